@@ -0,0 +1,75 @@
+"""Compare the peak memory of a build with and without `low_memory`.
+
+A synthetic MkDocs site is generated in a temporary directory and built
+once per mode in a separate process, whose peak resident memory is
+reported.
+
+    python benchmarks/bench_memory.py --pages 500
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+PAGE = '''# Page {0}
+
+{1}
+'''
+
+SECTION = '''## Section {0}
+
+Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod
+tempor incididunt ut labore et dolore magna aliqua. See [the next page](page{1}.md#section-{0}).
+
+| a | b | c |
+|---|---|---|
+{2}
+
+```
+{3}
+```
+'''
+
+
+def make_site(root, pages, sections):
+    docs = os.path.join(root, 'docs')
+    os.makedirs(docs)
+    for i in range(pages):
+        body = '\n'.join(SECTION.format(s, (i + 1) % pages,
+                                        '\n'.join('| {0} | {0} | {0} |'.format(r) for r in range(10)),
+                                        '\n'.join('line = {}'.format(r) for r in range(20)))
+                         for s in range(sections))
+        with open(os.path.join(docs, 'page{}.md'.format(i)), 'w') as f:
+            f.write(PAGE.format(i, body))
+    nav = '\n'.join('  - page{0}.md'.format(i) for i in range(pages))
+    return nav
+
+
+def build(root, nav, low_memory):
+    with open(os.path.join(root, 'mkdocs.yml'), 'w') as f:
+        f.write('site_name: Memory benchmark\nnav:\n{}\nplugins:\n'
+                '  - mkpdfs:\n      low_memory: {}\n'.format(nav, str(low_memory).lower()))
+    process = subprocess.Popen([sys.executable, '-m', 'mkdocs', 'build', '-q'], cwd=root)
+    _, status, usage = os.wait4(process.pid, 0)
+    if status:
+        sys.exit('mkdocs build failed')
+    # KiB on Linux, bytes on macOS
+    return usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--sections', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        nav = make_site(root, args.pages, args.sections)
+        for low_memory in (False, True):
+            peak = build(root, nav, low_memory)
+            print('low_memory={:<5} peak RSS {:8.1f} MiB'.format(str(low_memory), peak))
+
+
+if __name__ == '__main__':
+    main()
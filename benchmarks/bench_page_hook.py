@@ -0,0 +1,98 @@
+"""Compare the cost per page of the download button injection.
+
+The page hook parses each page once to extract its article. Before, the
+button was then added by parsing and serializing the page a second time
+with BeautifulSoup (`modify_html`, kept here as the baseline); it is now
+spliced into the page markup (`themes.Theme.add_button`). The script exits
+with a non-zero status if both pages do not parse to the same document.
+
+    python benchmarks/bench_page_hook.py --pages 200
+"""
+import argparse
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+from mkpdfs_mkdocs.themes import get_theme
+
+HREF = '../pdf/guide/page.pdf'
+
+
+def make_page(sections=20):
+    parts = ['<!DOCTYPE html>\n<html lang="en"><head><meta charset="utf-8">'
+             '<title>Page</title><link href="css/theme.css" rel="stylesheet"></head>'
+             '<body><nav class="sidebar"><ul>']
+    parts.extend('<li><a href="page{0}.html">Page {0}</a></li>'.format(i) for i in range(50))
+    parts.append('</ul></nav><div class="container"><div role="main" class="content">'
+                 '<h1 id="title">Title</h1>')
+    for i in range(sections):
+        parts.append(
+            '<h2 id="s{0}">Section {0}</h2>'
+            '<p>See <a href="other.html#s{0}">other</a> and <img src="img/p{0}.png" alt="p"></p>'
+            '<table><tbody>{1}</tbody></table>'
+            '<pre><code>{2}</code></pre>'
+            .format(i,
+                    ''.join('<tr><td>{0}</td><td>x</td></tr>'.format(r) for r in range(10)),
+                    '\n'.join('print({})'.format(r) for r in range(10))))
+    parts.append('</div></div><script src="js/theme.js"></script></body></html>')
+    return ''.join(parts)
+
+
+def modify_html(html: str, href: str, parser: str = 'html.parser') -> str:
+    """The former download button injection of the page hook."""
+    soup = BeautifulSoup(html, parser)
+    a = soup.new_tag('a',
+                     href=href,
+                     title='Download',
+                     download=None
+                     )
+    a['class'] = 'md-content__icon pdf-download-btn'
+    i = soup.new_tag('i')
+    i['class'] = 'fa fas fa-download'
+    small = soup.new_tag('small')
+    a.append(i)
+    small.append(' PDF')
+    a.append(small)
+    if soup.article:
+        soup.article.insert(0, a)
+    else:
+        soup.find('div', **{'role': 'main'}).insert(0, a)
+    return str(soup)
+
+
+def before(html):
+    BeautifulSoup(html, 'html.parser').find('article')
+    return modify_html(html, HREF)
+
+
+def after(html, theme=get_theme('mkdocs')):
+    BeautifulSoup(html, 'html.parser').find('article')
+    return theme.add_button(html, HREF)
+
+
+def run(func, html, pages):
+    start = time.perf_counter()
+    results = [func(html) for _ in range(pages)]
+    return (time.perf_counter() - start) / pages, results[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=100)
+    parser.add_argument('--sections', type=int, default=20)
+    args = parser.parse_args()
+
+    html = make_page(args.sections)
+    before_time, before_out = run(before, html, args.pages)
+    after_time, after_out = run(after, html, args.pages)
+    identical = (str(BeautifulSoup(before_out, 'html.parser'))
+                 == str(BeautifulSoup(after_out, 'html.parser')))
+    print('per page  parse + re-parse {:.2f}ms  parse + splice {:.2f}ms  '
+          'speedup x{:.2f}  identical={}'.format(
+              before_time * 1000, after_time * 1000, before_time / after_time, identical))
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""Compare the throughput of the page preprocessing with the number of workers.
+
+The pages are preprocessed in this process, as `add_article` does, then by
+`preprocessing.preprocess_pages` with each number of worker processes, as
+the `parallel_preprocess` option does. The script exits with a non-zero
+status if an article differs from the one preprocessed in this process.
+
+    python benchmarks/bench_parallel_preprocess.py --pages 1000 --workers 1 2 4 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from mkpdfs_mkdocs.assets import AssetIndex
+from mkpdfs_mkdocs.diagrams import DiagramStage
+from mkpdfs_mkdocs.preprocessing import PagePreprocessor, preprocess_pages
+
+
+def make_page(index, sections=20):
+    parts = ['<!DOCTYPE html>\n<html lang="en"><head><meta charset="utf-8">'
+             '<title>Page {0}</title></head><body><div class="md-content">'
+             '<article class="md-content__inner md-typeset">'
+             '<h1 id="title">Page {0}<a class="headerlink" href="#title">&para;</a></h1>'
+             .format(index)]
+    for i in range(sections):
+        parts.append(
+            '<h2 id="s{0}">Section {0}<a class="headerlink" href="#s{0}">&para;</a></h2>'
+            '<p>See <a href="page{1}.html#s{0}">the next page</a>, <a href="#s{0}">here</a> '
+            'and <a href="https://example.org/{0}">external</a>.</p>'
+            '<p><img src="img/pic{0}.png"/></p>'
+            '<table><thead><tr><th>a</th><th>b</th></tr></thead><tbody>{2}</tbody></table>'
+            '<div class="highlight"><pre><span></span><code>{3}</code></pre></div>'
+            .format(i, index + 1,
+                    ''.join('<tr><td>{0}</td><td>x</td></tr>'.format(r) for r in range(10)),
+                    '\n'.join('<span class="n">print</span>({})'.format(r) for r in range(10))))
+    parts.append('</article></div></body></html>')
+    return ''.join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--sections', type=int, default=20)
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as site_dir:
+        jobs = [(make_page(index, args.sections), 'page{}.html'.format(index),
+                 'file://{}/page{}'.format(site_dir, index), 0, 0, False)
+                for index in range(args.pages)]
+
+        def preprocessor():
+            return PagePreprocessor('html.parser', material=True, assets=AssetIndex(site_dir),
+                                    diagrams=DiagramStage(os.path.join(site_dir, 'diagrams')))
+
+        serial = preprocessor()
+        start = time.perf_counter()
+        expected = [str(serial.preprocess(*job)[0]) for job in jobs]
+        seconds = time.perf_counter() - start
+        print('{:>3} workers  {:8.2f}s  {:8.1f} pages/s  (in process)'.format(
+            1, seconds, args.pages / seconds))
+        identical = True
+        for workers in args.workers:
+            start = time.perf_counter()
+            results = preprocess_pages(preprocessor(), jobs, workers=workers)
+            seconds = time.perf_counter() - start
+            same = [result[0] for result in results] == expected
+            identical = identical and same
+            print('{:>3} workers  {:8.2f}s  {:8.1f} pages/s  identical={}'.format(
+                workers, seconds, args.pages / seconds, same))
+    return 0 if identical else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
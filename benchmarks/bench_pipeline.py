@@ -0,0 +1,219 @@
+"""Benchmark the whole PDF pipeline on synthetic MkDocs sites.
+
+For each page count, a site is generated in a temporary directory and the
+hooks of `Mkpdfs` (`on_config`, `on_nav`, `on_post_page` and
+`on_post_build`) are driven directly in a separate process, which reports
+the time spent in each hook and stage, the throughput and its peak memory.
+Nothing is fetched from the network.
+
+The results are written as JSON to `--output`, in the temporary directory
+by default. Given the results of a previous run with `--baseline`, the
+script exits with a non-zero status if a site is slower, or needs more
+memory, by more than `--threshold`.
+
+    python benchmarks/bench_pipeline.py --pages 10 100 --output before.json
+    python benchmarks/bench_pipeline.py --pages 10 100 --baseline before.json
+"""
+import argparse
+import json
+import os
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+PAGE_LAYOUTS = {
+    'mkdocs': ('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{title}</title></head>'
+               '<body><div class="container"><div class="col-md-9" role="main">{content}'
+               '</div></div></body></html>'),
+    'material': ('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{title}</title></head>'
+                 '<body><div class="md-content" data-md-component="content">'
+                 '<article class="md-content__inner md-typeset">{content}</article>'
+                 '</div></body></html>'),
+}
+
+
+def png(width, height):
+    """A valid grey PNG image, written without any imaging library."""
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+    rows = b''.join(b'\0' + bytes([(x * 7 + y) % 256 for x in range(width)]) for y in range(height))
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+def page_path(index, pages, depth, fanout=10):
+    """Location of a page in a tree of `depth` levels of directories."""
+    parts = []
+    size = pages
+    for level in range(depth):
+        size = max(1, size // fanout)
+        parts.append('section{}'.format(index // size % fanout))
+    return '/'.join(parts + ['page{}.md'.format(index)])
+
+
+def make_site(root, args, pages):
+    rand = random.Random(pages)
+    docs = os.path.join(root, 'docs')
+    os.makedirs(os.path.join(docs, 'img'))
+    for n in range(args.images):
+        with open(os.path.join(docs, 'img', 'pic{}.png'.format(n)), 'wb') as f:
+            f.write(png(64, 48))
+    paths = [page_path(i, pages, args.depth) for i in range(pages)]
+    for i, path in enumerate(paths):
+        up = '../' * path.count('/')
+        body = ['# Page {}\n'.format(i)]
+        for h in range(args.headings):
+            body.append('## Heading {0}\n\nLorem ipsum dolor sit amet, consectetur adipiscing '
+                        'elit, see [the next page]({1}{2}#heading-{0}).\n'
+                        .format(h, up, paths[(i + 1) % pages]))
+            if rand.random() < args.tables:
+                body.append('| a | b | c |\n|---|---|---|\n' + '\n'.join(
+                    '| {0} | {0} | {0} |'.format(r) for r in range(8)) + '\n')
+            if rand.random() < args.code:
+                body.append('```\n' + '\n'.join('line = {}'.format(r) for r in range(12)) + '\n```\n')
+        for n in range(args.images):
+            body.append('![Picture {0}]({1}img/pic{0}.png)\n'.format(n, up))
+        target = os.path.join(docs, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(body))
+    with open(os.path.join(root, 'mkdocs.yml'), 'w') as f:
+        f.write('site_name: Pipeline benchmark\nuse_directory_urls: false\n'
+                'theme:\n  name: {}\nmarkdown_extensions:\n  - tables\n  - fenced_code\n'
+                'plugins:\n  - mkpdfs:\n      offline: true\n      profile: true\n'
+                .format(args.theme))
+
+
+def drive(root):
+    """Build the site at `root` through the hooks of the plugin and return
+    the measures."""
+    from mkdocs.config import load_config
+    from mkdocs.structure.files import get_files
+    from mkdocs.structure.nav import get_navigation
+
+    from mkpdfs_mkdocs.utils import peak_rss
+
+    config = load_config(os.path.join(root, 'mkdocs.yml'))
+    plugin = config.plugins['mkpdfs']
+    layout = PAGE_LAYOUTS[config['theme'].name]
+    hooks = dict.fromkeys(('on_config', 'on_nav', 'markdown', 'on_post_page', 'on_post_build'), 0.0)
+
+    def timed(hook, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        hooks[hook] += time.perf_counter() - start
+        return result
+
+    config = timed('on_config', plugin.on_config, config)
+    files = get_files(config)
+    files.copy_static_files()
+    nav = timed('on_nav', plugin.on_nav, get_navigation(files, config), config=config, files=files)
+    for page in nav.pages:
+        timed('markdown', page.read_source, config)
+        timed('markdown', page.render, config, files)
+        html = layout.format(title=page.title, content=page.content)
+        timed('on_post_page', plugin.on_post_page, html, page=page, config=config)
+    timed('on_post_build', plugin.on_post_build, config)
+
+    with open(os.path.join(config['site_dir'], 'mkpdfs-profile.json'), encoding='utf-8') as f:
+        profile = json.load(f)
+    seconds = sum(value for hook, value in hooks.items() if hook != 'markdown')
+    return {
+        'pages': len(nav.pages),
+        'seconds': round(seconds, 4),
+        'pages_per_second': round(len(nav.pages) / seconds, 2),
+        'peak_rss_mib': peak_rss(),
+        'hooks': {hook: round(value, 4) for hook, value in hooks.items()},
+        'stages': {name: stats['seconds'] for name, stats in profile['stages'].items()},
+        'pdf_pages': profile['pdf_pages'],
+    }
+
+
+def run(args, pages):
+    with tempfile.TemporaryDirectory() as root:
+        make_site(root, args, pages)
+        process = subprocess.run([sys.executable, os.path.abspath(__file__), '--drive', root],
+                                 cwd=root, stdout=subprocess.PIPE, universal_newlines=True)
+        if process.returncode:
+            sys.exit('The build of {} pages failed'.format(pages))
+        return json.loads(process.stdout.splitlines()[-1])
+
+
+def compare(results, baseline, threshold):
+    """Print the changes from `baseline` and return whether one of them is
+    a regression."""
+    regressed = False
+    for pages, result in results.items():
+        before = baseline['results'].get(pages)
+        if before is None:
+            continue
+        for measure in ('seconds', 'peak_rss_mib'):
+            if not before[measure] or result[measure] is None:
+                continue
+            change = result[measure] / before[measure] - 1
+            worse = change > threshold
+            regressed = regressed or worse
+            print('{:>6} pages  {:<13} {:10.2f} -> {:10.2f}  {:+7.1%}{}'.format(
+                pages, measure, before[measure], result[measure], change,
+                '  REGRESSION' if worse else ''))
+    return regressed
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, universal_newlines=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--depth', type=int, default=2, help='levels of nav sections')
+    parser.add_argument('--headings', type=int, default=8, help='headings per page')
+    parser.add_argument('--tables', type=float, default=0.5, help='share of headings followed by a table')
+    parser.add_argument('--code', type=float, default=0.5, help='share of headings followed by a code block')
+    parser.add_argument('--images', type=int, default=2, help='images per page')
+    parser.add_argument('--theme', choices=sorted(PAGE_LAYOUTS), default='mkdocs')
+    parser.add_argument('--output', default=os.path.join(tempfile.gettempdir(), 'bench_pipeline.json'),
+                        help='file the results are written to')
+    parser.add_argument('--baseline', help='results of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown or memory growth failing the comparison')
+    parser.add_argument('--drive', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.drive:
+        print(json.dumps(drive(args.drive)))
+        return 0
+
+    results = {}
+    for pages in args.pages:
+        results[str(pages)] = result = run(args, pages)
+        print('{:>6} pages  {:8.2f}s  {:8.1f} pages/s  peak RSS {:8.1f} MiB'.format(
+            pages, result['seconds'], result['pages_per_second'], result['peak_rss_mib'] or 0))
+    settings = {name: getattr(args, name) for name in ('depth', 'headings', 'tables', 'code',
+                                                       'images', 'theme')}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'commit': git_commit(), 'python': sys.version.split()[0],
+                   'settings': settings, 'results': results}, f, indent=2)
+    print('Results written to {}'.format(args.output))
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('settings') != settings:
+            print('The baseline was run with other settings: {}'.format(baseline.get('settings')))
+        return 1 if compare(results, baseline, args.threshold) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Compare the single-pass article rewrite with the legacy preprocessing chain.
+
+Both pipelines run on the same synthetic articles; the script exits with a
+non-zero status if their serialized output differs by a single byte.
+
+    python benchmarks/bench_preprocess.py --pages 200
+"""
+import argparse
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+from mkpdfs_mkdocs.preprocessor import (
+    adjust_heading_levels,
+    get_combined,
+    nest_heading_bookmarks,
+    remove_header_links,
+    remove_material_header_icons,
+    rewrite_article,
+)
+
+BASE_URL = 'file:///tmp/site/guide/page'
+REL_URL = 'guide/page.html'
+
+
+def make_article(sections=20):
+    parts = ['<article class="md-content__inner md-typeset">',
+             '<a class="md-content__button md-icon" href="edit/page.md" title="Edit">e</a>',
+             '<h1 id="title">Title<a class="headerlink" href="#title">&para;</a></h1>']
+    for i in range(sections):
+        parts.append(
+            '<h2 id="s{0}">Section {0}<a class="headerlink" href="#s{0}">&para;</a></h2>'
+            '<p>See <a href="other.html#s{0}">other</a>, <a href="#s{0}">here</a>, '
+            '<a href="https://example.org/{0}">external</a>, <a href="file.zip">zip</a> '
+            'and <a name="n{0}">named</a>.</p>'
+            '<p><img src="img/pic{0}.svg"/><img alt="p" src="../img/p{0}.png"/></p>'
+            '<h3 id="t{0}">Table {0}</h3>'
+            '<table><thead><tr><th>a</th><th>b</th></tr></thead><tbody>{1}</tbody></table>'
+            '<h4>Code</h4><div class="highlight"><pre><span></span><code>{2}</code></pre></div>'
+            .format(i,
+                    ''.join('<tr><td>{0}</td><td id="c{1}-{0}">x</td></tr>'.format(r, i)
+                            for r in range(10)),
+                    '\n'.join('<span class="n">print</span>({})'.format(r) for r in range(10))))
+    parts.append('<link href="extra.css" rel="stylesheet"/></article>')
+    return ''.join(parts)
+
+
+def legacy(article, nesting_level, heading_shift, material):
+    if material:
+        article = remove_material_header_icons(article)
+    article = get_combined(article, BASE_URL, REL_URL)
+    article = remove_header_links(article)
+    article = nest_heading_bookmarks(article, nesting_level)
+    if heading_shift:
+        article = adjust_heading_levels(article, heading_shift)
+    return article
+
+
+def single_pass(article, nesting_level, heading_shift, material):
+    return rewrite_article(article, BASE_URL, REL_URL,
+                           nesting_level=nesting_level,
+                           heading_shift=heading_shift,
+                           material=material)
+
+
+def run(func, html, pages, options):
+    soups = [BeautifulSoup(html, 'html.parser').article for _ in range(pages)]
+    start = time.perf_counter()
+    results = [func(soup, *options) for soup in soups]
+    return time.perf_counter() - start, str(results[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=100)
+    parser.add_argument('--sections', type=int, default=20)
+    args = parser.parse_args()
+
+    html = make_article(args.sections)
+    failed = False
+    for options in ((0, 0, False), (2, 0, False), (1, 2, True), (3, 3, True)):
+        legacy_time, legacy_out = run(legacy, html, args.pages, options)
+        single_time, single_out = run(single_pass, html, args.pages, options)
+        identical = legacy_out == single_out
+        failed = failed or not identical
+        print('nesting={} shift={} material={!s:5}  legacy {:.3f}s  '
+              'single-pass {:.3f}s  speedup x{:.2f}  identical={}'.format(
+                  *options, legacy_time, single_time,
+                  legacy_time / single_time, identical))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
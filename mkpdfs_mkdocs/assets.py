@@ -0,0 +1,81 @@
+import os
+import re
+from html import unescape
+
+from mkpdfs_mkdocs.preprocessor.links.util import replace_svg_with_png, url_to_path
+
+
+REMOTE_SRC_RE = re.compile(r'\ssrc="(https?://[^"]*)"')
+SVG_SRC_RE = re.compile(r'''\ssrc=(["'])([^"']*\.svg)\1''', re.I)
+
+
+class AssetIndex(object):
+    """The files of the site directory, listed once per build.
+
+    Checking whether an image exists (such as the `_svg_to_png` version of
+    an SVG) is then a set lookup instead of a filesystem call. Local images
+    that cannot be found are collected for the end of build report, and
+    remote ones for prefetching.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.normpath(root)
+        self._files = None
+        self.missing = {}  # Path -> pages referencing it
+        self.remote = set()  # URLs of the remote assets
+
+    def exists(self, path):
+        path = os.path.normpath(path)
+        if not path.startswith(self.root + os.sep):
+            return os.path.exists(path)
+        if self._files is None:
+            self.scan()
+        return path in self._files
+
+    def scan(self):
+        files = set()
+        for directory, _, names in os.walk(self.root):
+            files.update(os.path.join(directory, name) for name in names)
+        self._files = files
+
+    def check(self, url, base_url):
+        """Record `url` as missing if it is a local file that does not exist,
+        or as remote."""
+        if url.startswith(('http://', 'https://')):
+            self.remote.add(url)
+            return
+        path = url_to_path(url)
+        if path is None or self.exists(path):
+            return
+        self.missing.setdefault(os.path.normpath(path), set()).add(self._page(base_url))
+
+    def missing_from(self, base_url):
+        """The missing images recorded for the page at `base_url`."""
+        page = self._page(base_url)
+        return sorted(path for path, pages in self.missing.items() if page in pages)
+
+    def recheck(self, paths, base_url):
+        """Record the images found missing for the page at `base_url` by a
+        previous build, when they still do not exist."""
+        for path in paths:
+            if not self.exists(path):
+                self.missing.setdefault(path, set()).add(self._page(base_url))
+
+    def swaps(self, content, base_url):
+        """The SVG images of `content` that are swapped for their
+        `_svg_to_png` version, with the PNG, see `replace_svg_with_png`."""
+        swaps = set()
+        for _, src in SVG_SRC_RE.findall(content):
+            src = unescape(src)
+            png_src = replace_svg_with_png(src, base_url, self)
+            if png_src != src:
+                swaps.add((src, png_src))
+        return sorted(swaps)
+
+    def _page(self, base_url):
+        page = url_to_path(base_url) or base_url
+        return os.path.relpath(page, self.root)
+
+    def collect_remote(self, html):
+        """Record the remote sources of already preprocessed markup."""
+        self.remote.update(unescape(url) for url in REMOTE_SRC_RE.findall(html))
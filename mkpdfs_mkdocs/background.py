@@ -0,0 +1,123 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+
+from mkpdfs_mkdocs.render import temporary_path, write_pdf
+
+log = logging.getLogger('mkdocs.mkpdfs')
+
+
+class BackgroundRenderer(object):
+    """Renders the PDF in a worker process while `mkdocs serve` keeps running.
+
+    Each rebuild submits the assembled document, with the stages it leaves
+    to the worker, see `render`. The render starts once no new document has
+    been submitted for `delay` seconds, and a render still running when a
+    newer document arrives is cancelled. `mkdocs serve`
+    cleans the site directory on every rebuild, so the last complete PDF is
+    kept aside and copied back until its replacement is ready.
+    """
+
+    def __init__(self, delay=2):
+        self.delay = delay
+        self._context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._timer = None
+        self._process = None
+        self._generation = 0
+        self._stash = tempfile.mkdtemp(prefix='mkpdfs_')
+
+    def _stash_path(self, pdf_path):
+        return os.path.join(self._stash, os.path.basename(pdf_path))
+
+    def submit(self, html, pdf_path, design, fetcher=None, render_profile=None, diagrams=None,
+               images=None, remote=()):
+        job = {'html': html, 'pdf_path': pdf_path, 'design': design, 'fetcher': fetcher,
+               'render_profile': render_profile, 'diagrams': diagrams, 'images': images,
+               'remote': remote}
+        with self._lock:
+            self._generation += 1
+            if self._timer is not None:
+                self._timer.cancel()
+            self._cancel()
+            self._restore(pdf_path)
+            self._timer = threading.Timer(self.delay, self._start, (self._generation, job))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def shutdown(self):
+        with self._lock:
+            self._generation += 1
+            if self._timer is not None:
+                self._timer.cancel()
+            self._cancel()
+        shutil.rmtree(self._stash, ignore_errors=True)
+
+    def _start(self, generation, job):
+        pdf_path = job['pdf_path']
+        with self._lock:
+            if generation != self._generation:
+                return
+            process = self._context.Process(target=render, kwargs=job, daemon=True)
+            process.start()
+            self._process = (process, pdf_path)
+        log.info('Rendering the PDF version of the documentation in the background.')
+        waiter = threading.Thread(target=self._wait,
+                                  args=(generation, process, pdf_path),
+                                  daemon=True)
+        waiter.start()
+
+    def _wait(self, generation, process, pdf_path):
+        process.join()
+        if process.exitcode < 0:
+            # Cancelled by a newer change
+            return
+        if process.exitcode != 0:
+            log.warning('The background PDF render failed (exit code {}).'.format(process.exitcode))
+            return
+        try:
+            shutil.copyfile(pdf_path, self._stash_path(pdf_path))
+        except OSError:
+            # The site directory is being rebuilt, the next render will
+            # refresh the stash.
+            return
+        if generation == self._generation:
+            log.info('The PDF version of the documentation has been generated.')
+
+    def _cancel(self):
+        if self._process is None:
+            return
+        process, target = self._process
+        self._process = None
+        if process.is_alive():
+            process.terminate()
+            process.join()
+            tmp = temporary_path(target, process.pid)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _restore(self, pdf_path):
+        stash = self._stash_path(pdf_path)
+        if os.path.exists(stash) and not os.path.exists(pdf_path):
+            shutil.copyfile(stash, pdf_path)
+
+
+def render(html, pdf_path, design, fetcher=None, render_profile=None, diagrams=None, images=None,
+           remote=()):
+    """Entry point of the background worker process. The stages the rebuild
+    leaves out are run before the layout: the diagrams of the `DiagramStage`
+    are rendered and replace their blocks, the copies of the `ImageStage`
+    are made and the `remote` images downloaded."""
+    if diagrams is not None:
+        diagrams.render()
+        html = diagrams.resolve(html)
+    if images is not None:
+        # A daemon process cannot start worker processes of its own
+        images.workers = 1
+        images.render()
+    if fetcher is not None and remote:
+        fetcher.prefetch(remote)
+    write_pdf(html, pdf_path, design, None, fetcher, None, render_profile)
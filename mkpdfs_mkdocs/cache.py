@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import re
+import time
+import logging
+
+log = logging.getLogger('mkdocs.mkpdfs')
+
+# Bump whenever the preprocessing output changes, so that old entries are
+# never served to a newer version of the plugin.
+CACHE_VERSION = '5'
+
+
+# Comments changing with every build outside of the article, such as the
+# build date the mkdocs theme adds to the home page
+VOLATILE_RE = re.compile(r'<!--\s*MkDocs version\s*:[^>]*?Build Date UTC\s*:[^>]*?-->')
+
+
+def stable_content(content):
+    """The HTML of a page without the comments that change with every
+    build, to compute its `cache_key`."""
+    if 'Build Date UTC' not in content:
+        return content
+    return VOLATILE_RE.sub('', content)
+
+
+def cache_key(*parts):
+    """Hash the given parts into a stable cache key."""
+    digest = hashlib.sha256(CACHE_VERSION.encode('utf-8'))
+    for part in parts:
+        digest.update(b'\0')
+        digest.update(str(part).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ArticleCache(object):
+    """On-disk store of preprocessed articles, one JSON file per entry.
+
+    Entries are looked up by a content hash (see `cache_key`), so they never
+    need to be invalidated: a changed page simply gets a new key. Stale
+    entries are dropped by `evict` based on age and on the total cache size.
+    """
+
+    def __init__(self, directory, max_size=None, max_age=None):
+        self.directory = directory
+        self.max_size = max_size  # in bytes
+        self.max_age = max_age  # in seconds
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        # Refresh the mtime so that eviction drops the least recently used
+        # entries first.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        path = self._path(key)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            log.warning('Unable to write cache entry {}: {}'.format(path, e))
+
+    def evict(self):
+        """Remove entries older than `max_age`, then the least recently used
+        ones until the cache is smaller than `max_size`."""
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if self.max_age is not None and now - stat.st_mtime > self.max_age:
+                self._remove(path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        if self.max_size is None:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
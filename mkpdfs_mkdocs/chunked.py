@@ -0,0 +1,302 @@
+"""Parallel layout of the combined PDF.
+
+The combined document is split into chunks (the cover and table of contents,
+then groups of top-level nav entries) that WeasyPrint lays out in separate
+processes. The chunk PDFs are merged with pypdf into a single file with
+continuous page numbers, one bookmark outline and working internal links.
+
+Each chunk is rendered as a standalone document, so a few adjustments keep it
+the same as its part of the single-pass render:
+
+* Chunks after the first one start with lead pages that are dropped when
+  merging. They take the `@page :first` styles of the design, set the
+  running strings (copyright, current heading) of the previous pages and
+  keep the left/right parity of the pages.
+* The page counter of each chunk is reset to its value in the full document.
+  Page numbers are assumed to grow by one per page from the value the design
+  gives to the first page (`@page :first { counter-reset: page N }`).
+* Ids defined in other chunks get an empty placeholder anchor on a trailing
+  page, dropped as well, so that WeasyPrint records every internal link.
+  Links and table of contents page numbers are then resolved across chunks.
+
+Two passes are needed: the first one measures the pages of each chunk, the
+second one renders them with their final page numbers.
+"""
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from html import unescape
+from io import BytesIO
+
+from weasyprint import HTML
+
+from mkpdfs_mkdocs.profiling import BuildProfile
+from mkpdfs_mkdocs.render import DEFAULT_RENDER, document_options, temporary_path
+from mkpdfs_mkdocs.styles import process_styles
+
+try:
+    from pypdf import PdfReader, PdfWriter
+    from pypdf.annotations import Link
+    from pypdf.generic import ArrayObject, Fit, NameObject
+except ImportError:  # pypdf is an optional dependency
+    PdfReader = None
+
+# PDF points per CSS pixel, as written by WeasyPrint
+PX = 0.75
+START = 'mkpdfs-chunk-start'
+END = 'mkpdfs-chunk-end'
+
+ID_RE = re.compile(r'\sid="([^"]*)"')
+HREF_RE = re.compile(r'\shref="#([^"]*)"')
+H1_RE = re.compile(r'<h1[^>]*>(.*?)</h1>', re.S)
+TAG_RE = re.compile(r'<[^>]+>')
+TOC_LINK_RE = re.compile(r'<a href="#([^"]*)"')
+FIRST_PAGE_RE = re.compile(r'@page\s*:first\s*{[^}]*counter-reset:\s*page\s+(-?\d+)')
+
+TOC_STYLE = '#contents a[data-mkpdfs-page]::after { content: attr(data-mkpdfs-page) !important }'
+
+
+def available():
+    return PdfReader is not None
+
+
+def first_page_number(css_file):
+    """Page number the design gives to the first page of the document."""
+    try:
+        with open(css_file, encoding='utf-8') as f:
+            match = FIRST_PAGE_RE.search(f.read())
+    except OSError:
+        return 1
+    return int(match.group(1)) if match else 1
+
+
+def split_chunks(groups, count):
+    """Pack consecutive groups of markup into at most `count` chunks of
+    similar size."""
+    target = sum(len(group) for group in groups) / max(count, 1)
+    chunks = []
+    current = ''
+    for group in groups:
+        current += group
+        if len(current) >= target:
+            chunks.append(current)
+            current = ''
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def render_chunk(html, write, design, fetcher=None, render_profile=None):
+    """Lay out a chunk document and describe its pages.
+
+    Runs in a worker process. Returns the PDF (when `write` is set), the
+    number of lead pages and, for every page between the lead and the
+    trailing pages, its height, anchors, internal links and bookmarks.
+    """
+    render_profile = render_profile or DEFAULT_RENDER
+    stylesheets, font_config = process_styles.get(design)
+    options = render_profile.render_options()
+    document = HTML(string=html, **document_options(fetcher)).render(
+        stylesheets=render_profile.stylesheets(stylesheets, font_config),
+        font_config=font_config, **options)
+    lead, end = 0, len(document.pages)
+    for index, page in enumerate(document.pages):
+        if START in page.anchors:
+            lead = index
+        if END in page.anchors:
+            end = index
+    pages = []
+    for page in document.pages[lead:end]:
+        pages.append({
+            'height': page.height,
+            'anchors': dict(page.anchors),
+            'links': [(link[1], link[2]) for link in page.links
+                      if link[0] == 'internal'],
+            'bookmarks': [(mark[0], mark[1], mark[2], mark[3] if len(mark) > 3 else 'open')
+                          for mark in page.bookmarks],
+        })
+    pdf = document.write_pdf(**options) if write else None
+    return pdf, lead, pages
+
+
+def _is_internal_link(annot):
+    if annot.get('/Subtype') != '/Link':
+        return False
+    action = annot.get('/A')
+    return '/Dest' in annot or (action is not None and action.get('/S') == '/GoTo')
+
+
+class ChunkedLayout(object):
+    """Lay out the combined document in parallel chunks and merge them."""
+
+    def __init__(self, head, front, groups, back, css_file, workers=None, fetcher=None,
+                 profile=None, render_profile=None):
+        """`head` is the document head, `front` the cover (and the table of
+        contents when placed before the articles), `groups` the markup of
+        each top-level nav entry and `back` the table of contents when
+        placed after them. The passes are timed by `profile` when given."""
+        self.head = head
+        self.render_profile = render_profile
+        self.profile = profile or BuildProfile()
+        self.workers = workers or os.cpu_count() or 1
+        self.bodies = [front] + split_chunks(groups, self.workers)
+        if back:
+            self.bodies.append(back)
+        self.design = css_file
+        self.fetcher = fetcher
+        self.first_page = first_page_number(css_file)
+        end = front.find('</article>')
+        self.cover = front[:end + len('</article>')] if end >= 0 else ''
+        self.headings = []
+        last = ''
+        for body in self.bodies:
+            self.headings.append(last)
+            found = H1_RE.findall(body)
+            if found:
+                last = TAG_RE.sub('', found[-1])
+
+    def _lead(self, index, pad):
+        """Pages put before a chunk: padding for the page parity, the cover
+        setting the running copyright, and the last heading before it."""
+        pages = ['<article style="break-after: page"></article>'] * pad
+        if self.cover:
+            pages.append(self.cover.replace('<article', '<article style="break-after: page"', 1))
+        if self.headings[index]:
+            pages.append('<article style="break-after: page">'
+                         '<h1 style="bookmark-level: none">{}</h1></article>'.format(self.headings[index]))
+        return ''.join(pages)
+
+    def _document(self, index, pad=0, start=None, toc_pages=None):
+        body = self.bodies[index]
+        styles = []
+        if start is not None:
+            styles.append('@page :first {{ counter-reset: page {} }}'.format(start))
+        if toc_pages is not None:
+            styles.append(TOC_STYLE)
+            body = self._number_toc(body, toc_pages)
+        head = self.head
+        if styles:
+            head = head.replace('</head>', '<style>{}</style></head>'.format(' '.join(styles)))
+        parts = ['<html>', head, '<body>']
+        if index:
+            parts.append(self._lead(index, pad))
+            # Mark the first page of the chunk itself
+            opening = body.find('>') + 1
+            body = '{}<a id="{}"></a>{}'.format(body[:opening], START, body[opening:])
+        parts.append(body)
+        missing = set(HREF_RE.findall(body)) - set(ID_RE.findall(body))
+        if missing:
+            parts.append('<article style="break-before: page"><a id="{}"></a>'.format(END))
+            parts.extend('<a id="{}"></a>'.format(name) for name in sorted(missing))
+            parts.append('</article>')
+        parts.append('</body></html>')
+        return ''.join(parts)
+
+    @staticmethod
+    def _number_toc(body, toc_pages):
+        start = body.find('<article id="contents"')
+        if start < 0:
+            return body
+        end = body.find('</article>', start)
+
+        def number(match):
+            page = toc_pages.get(unescape(match.group(1)))
+            if page is None:
+                return match.group(0)
+            return '<a data-mkpdfs-page="{}" href="#{}"'.format(page, match.group(1))
+
+        return body[:start] + TOC_LINK_RE.sub(number, body[start:end]) + body[end:]
+
+    def _render(self, pool, documents, write):
+        futures = [pool.submit(render_chunk, html, write, self.design, self.fetcher,
+                               self.render_profile)
+                   for html in documents]
+        return [future.result() for future in futures]
+
+    def write(self, pdf_path):
+        context = multiprocessing.get_context('spawn')
+        workers = min(self.workers, len(self.bodies))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            # First pass: measure the chunks
+            documents = [self._document(index) for index in range(len(self.bodies))]
+            with self.profile.stage('layout (measure)'):
+                measures = self._render(pool, documents, False)
+            offsets = []
+            toc_pages = {}
+            offset = 0
+            for _, lead, pages in measures:
+                offsets.append(offset)
+                for number, page in enumerate(pages):
+                    for name in page['anchors']:
+                        toc_pages.setdefault(name, self.first_page + offset + number)
+                offset += len(pages)
+
+            # Second pass: render with the final page numbers
+            documents = []
+            for index, offset in enumerate(offsets):
+                lead = measures[index][1]
+                pad = 1 if index and lead % 2 != offset % 2 else 0
+                start = self.first_page + offset - lead - pad if index else None
+                documents.append(self._document(index, pad, start, toc_pages))
+            with self.profile.stage('layout'):
+                results = self._render(pool, documents, True)
+        self.profile.count_pages(page['anchors'] for _, _, pages in results for page in pages)
+        with self.profile.stage('merge'):
+            self._merge(results, pdf_path)
+
+    @staticmethod
+    def _merge(results, pdf_path):
+        writer = PdfWriter()
+        anchors = {}
+        kept = []
+        for pdf, lead, pages in results:
+            reader = PdfReader(BytesIO(pdf))
+            if not kept and reader.metadata:
+                writer.add_metadata(dict(reader.metadata))
+            for number, info in enumerate(pages):
+                page = reader.pages[lead + number]
+                if '/Annots' in page:
+                    # Internal links are rebuilt below, across chunks
+                    page[NameObject('/Annots')] = ArrayObject(
+                        annot for annot in page['/Annots']
+                        if not _is_internal_link(annot.get_object()))
+                writer.add_page(page)
+                for name, (x, y) in info['anchors'].items():
+                    anchors.setdefault(name, (len(kept), x, y))
+                kept.append(info)
+
+        for number, info in enumerate(kept):
+            height = info['height'] * PX
+            for name, (x, y, width, link_height) in info['links']:
+                if name not in anchors:
+                    continue
+                target, target_x, target_y = anchors[name]
+                top = kept[target]['height'] * PX - target_y * PX
+                writer.add_annotation(number, Link(
+                    rect=(x * PX, height - (y + link_height) * PX,
+                          (x + width) * PX, height - y * PX),
+                    border=[0, 0, 0],
+                    target_page_index=target,
+                    fit=Fit.xyz(left=target_x * PX, top=top)))
+
+        parents = []
+        for number, info in enumerate(kept):
+            height = info['height'] * PX
+            for level, label, (x, y), state in info['bookmarks']:
+                while parents and parents[-1][0] >= level:
+                    parents.pop()
+                item = writer.add_outline_item(
+                    label, number, parent=parents[-1][1] if parents else None,
+                    fit=Fit.xyz(left=x * PX, top=height - y * PX),
+                    is_open=state != 'closed')
+                parents.append((level, item))
+
+        tmp = temporary_path(pdf_path)
+        try:
+            with open(tmp, 'wb') as f:
+                writer.write(f)
+            os.replace(tmp, pdf_path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
@@ -0,0 +1,101 @@
+"""Render the PDFs of a built site again, without building the site.
+
+The build must have saved its manifest with the `manifest` option. Only
+the assembly and the render of the PDFs are run, so that a change of the
+design is seen in the time of a render:
+
+    mkpdfs site --design docs/pdf.css --section Guide/Admin
+"""
+import argparse
+import logging
+import os
+import sys
+
+from mkpdfs_mkdocs.generator import Generator
+from mkpdfs_mkdocs.manifest import DIRECTORY, BuildManifest
+from mkpdfs_mkdocs.render_profiles import ENV_VAR, RENDER_PROFILES
+
+log = logging.getLogger('mkdocs.mkpdfs')
+
+
+def section_paths(items, parent=''):
+    """"Guide/Admin" paths of the sections of the saved nav `items`."""
+    for item in items:
+        if item.is_section:
+            path = '{}/{}'.format(parent, item.title) if parent else item.title
+            yield path
+            yield from section_paths(item.children, path)
+
+
+def apply_overrides(options, design=None, output=None, sections=None, render_profile=None):
+    """Update the plugin options of a saved build with the command line
+    settings. A given output path or sections replace the outputs of the
+    build with a single combined PDF."""
+    if design:
+        options['design'] = design
+        # Also used by each output having its own design
+        outputs = options['output_path']
+        if isinstance(outputs, list):
+            options['output_path'] = [dict(entry, design=design) if isinstance(entry, dict) else entry
+                                      for entry in outputs]
+    if output or sections:
+        first = options['output_path']
+        if isinstance(first, list):
+            first = first[0]
+        entry = dict(first) if isinstance(first, dict) else {'path': first}
+        if output:
+            entry['path'] = output
+        if sections:
+            entry['sections'] = sections
+            entry.pop('tags', None)
+        options['output_path'] = [entry]
+        options['output_mode'] = 'combined'
+        options['partial'] = None
+    if render_profile:
+        options['render_profile'] = render_profile
+    # Rendered in the foreground, and the manifest is left as it is
+    options['detached'] = False
+    options['manifest'] = False
+    return options
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='mkpdfs', description=__doc__.splitlines()[0])
+    parser.add_argument('site_dir', nargs='?', default='site',
+                        help='site directory of the build (default: site)')
+    parser.add_argument('--design', help='stylesheet to render with, relative to the current directory')
+    parser.add_argument('-o', '--output', help='path of the combined PDF, relative to site_dir')
+    parser.add_argument('-s', '--section', action='append', dest='sections',
+                        help='render only this section, as the path of the nav titles down to it '
+                             '(Guide/Admin); may be repeated')
+    parser.add_argument('-p', '--render-profile', choices=sorted(RENDER_PROFILES),
+                        help='render profile, instead of the one of the build')
+    parser.add_argument('-v', '--verbose', action='store_true', help='show the debug messages')
+    args = parser.parse_args(argv)
+    logging.basicConfig(format='%(levelname)-7s -  %(message)s',
+                        level=logging.DEBUG if args.verbose else logging.INFO)
+
+    site_dir = os.path.abspath(args.site_dir)
+    manifest = BuildManifest(os.path.join(site_dir, DIRECTORY))
+    if manifest.load() is None:
+        sys.exit('No build manifest in {}, build the site with the manifest option of the '
+                 'mkpdfs plugin first.'.format(site_dir))
+    if args.sections:
+        known = set(section_paths(manifest.nav()))
+        for section in args.sections:
+            if section not in known:
+                log.warning('There is no section {} in the navigation.'.format(section))
+    if args.render_profile:
+        # The environment variable would win over the option
+        os.environ[ENV_VAR] = args.render_profile
+    options = apply_overrides(manifest.data['options'], design=args.design, output=args.output,
+                              sections=args.sections, render_profile=args.render_profile)
+    generator = Generator()
+    generator.set_config(options, manifest.mkdocs_config(site_dir))
+    generator.load_manifest(manifest)
+    generator.write()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,213 @@
+"""Render the PDFs of a build in a process that outlives MkDocs.
+
+The assembled documents and a manifest describing their renders are
+written to a directory, and a worker process started on it. The worker
+records its progress in `status.json`, next to the manifest. To block
+until the PDFs are ready:
+
+    python -m mkpdfs_mkdocs.detached --wait .cache/mkpdfs/detached
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+log = logging.getLogger('mkdocs.mkpdfs')
+
+MANIFEST = 'manifest.json'
+STATUS = 'status.json'
+LOG = 'render.log'
+FINISHED = ('done', 'failed')
+
+
+def _write_json(path, data):
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def read_status(directory):
+    """The status of the last detached render in `directory`, or None."""
+    try:
+        with open(os.path.join(directory, STATUS), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def wait(directory, timeout=None, interval=1):
+    """Wait for the detached render in `directory` to finish and return its
+    status. A worker that died without finishing is reported as failed."""
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        status = read_status(directory)
+        if status is None:
+            return None
+        if status['state'] in FINISHED:
+            return status
+        if not _alive(status['pid']):
+            status = read_status(directory)
+            if status['state'] not in FINISHED:
+                status.update(state='failed', error='The render process exited unexpectedly, '
+                                                    'see {}'.format(os.path.join(directory, LOG)))
+            return status
+        if deadline is not None and time.monotonic() > deadline:
+            return status
+        time.sleep(interval)
+
+
+class DetachedRender(object):
+    """Collects the documents of a build and renders them in a detached
+    worker process.
+
+    `add` writes each document to `directory`; `start` writes the manifest
+    and starts the worker, cancelling the one of a previous build that may
+    still be running.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.jobs = []
+
+    def _prepare(self):
+        status = read_status(self.directory)
+        if status is not None and status['state'] not in FINISHED and _alive(status['pid']):
+            log.info('Cancelling the detached render of a previous build.')
+            try:
+                if hasattr(os, 'killpg'):
+                    os.killpg(status['pid'], signal.SIGTERM)
+                else:
+                    os.kill(status['pid'], signal.SIGTERM)
+            except OSError:
+                pass
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory)
+
+    def add(self, html, pdf_path, design, from_file=False, fingerprint=None):
+        """Add the render of `html` to `pdf_path`. With `from_file`, `html`
+        is the path of a file holding the document, which is moved. The
+        PDF is stored in the render cache under `fingerprint` when given."""
+        if not self.jobs:
+            self._prepare()
+        path = os.path.join(self.directory, 'document-{}.html'.format(len(self.jobs)))
+        if from_file:
+            shutil.move(html, path)
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(html)
+        self.jobs.append({'html': path, 'pdf': pdf_path, 'design': design,
+                          'fingerprint': fingerprint})
+
+    def start(self, fetcher, render_profile, workers=None, render_cache=None):
+        """Write the manifest and start the worker. Returns its pid."""
+        manifest = os.path.join(self.directory, MANIFEST)
+        _write_json(manifest, {
+            'jobs': self.jobs,
+            'fetcher': fetcher.settings(),
+            'render_profile': render_profile.name,
+            'workers': workers,
+            'render_cache': render_cache,
+        })
+        with open(os.path.join(self.directory, LOG), 'w') as out:
+            process = subprocess.Popen([sys.executable, '-m', 'mkpdfs_mkdocs.detached', manifest],
+                                       stdin=subprocess.DEVNULL, stdout=out,
+                                       stderr=subprocess.STDOUT, start_new_session=True)
+        if read_status(self.directory) is None:
+            # Until the worker records its own status
+            _write_json(os.path.join(self.directory, STATUS), {
+                'state': 'pending', 'pid': process.pid, 'total': len(self.jobs), 'done': 0,
+                'pdfs': []})
+        return process.pid
+
+
+def run(manifest_path):
+    """Render the jobs of a manifest, recording the progress in the status
+    file. Runs in the detached worker process."""
+    from mkpdfs_mkdocs.fetcher import Fetcher
+    from mkpdfs_mkdocs.fingerprint import RenderCache
+    from mkpdfs_mkdocs.render import write_pdf_file
+    from mkpdfs_mkdocs.render_profiles import RENDER_PROFILES
+
+    directory = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    jobs = manifest['jobs']
+    fetcher = Fetcher(**manifest['fetcher'])
+    render_profile = RENDER_PROFILES[manifest['render_profile']]
+    renders = RenderCache(manifest['render_cache']) if manifest.get('render_cache') else None
+    status = {'state': 'running', 'pid': os.getpid(), 'started': time.time(),
+              'total': len(jobs), 'done': 0, 'pdfs': []}
+    status_path = os.path.join(directory, STATUS)
+    _write_json(status_path, status)
+
+    def done(job):
+        if renders is not None and job.get('fingerprint'):
+            renders.store(job['pdf'], job['fingerprint'])
+        status['done'] += 1
+        status['pdfs'].append({'path': job['pdf'], 'size': os.path.getsize(job['pdf'])})
+        _write_json(status_path, status)
+
+    try:
+        workers = manifest.get('workers')
+        if len(jobs) <= 1 or workers == 1:
+            for job in jobs:
+                write_pdf_file(job['html'], job['pdf'], job['design'], None, fetcher, None,
+                               render_profile)
+                done(job)
+        else:
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers or None, mp_context=context) as pool:
+                futures = {pool.submit(write_pdf_file, job['html'], job['pdf'], job['design'],
+                                       None, fetcher, None, render_profile): job for job in jobs}
+                for future in as_completed(futures):
+                    future.result()
+                    done(futures[future])
+        status['state'] = 'done'
+    except Exception as e:
+        status.update(state='failed', error='{}: {}'.format(type(e).__name__, e))
+        raise
+    finally:
+        fetcher.close()
+        status['finished'] = time.time()
+        _write_json(status_path, status)
+    for job in jobs:
+        os.remove(job['html'])
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='manifest to render, or with --wait the render directory')
+    parser.add_argument('--wait', action='store_true', help='wait for the render to finish')
+    parser.add_argument('--timeout', type=float, help='seconds to wait at most')
+    args = parser.parse_args(argv)
+    if not args.wait:
+        return run(args.path)
+    status = wait(args.path, args.timeout)
+    if status is None:
+        print('No detached render in {}'.format(args.path))
+        return 1
+    print(json.dumps(status, indent=2))
+    return 0 if status['state'] == 'done' else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
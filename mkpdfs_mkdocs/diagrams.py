@@ -0,0 +1,158 @@
+import hashlib
+import logging
+import os
+import re
+import shlex
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from html import escape
+
+from bs4 import Comment
+from weasyprint import urls
+
+log = logging.getLogger('mkdocs.mkpdfs')
+
+# Commands rendering a diagram source file to an image, by diagram language
+DEFAULT_RENDERERS = {
+    'mermaid': 'mmdc --input {input} --output {output}',
+}
+
+# Diagram blocks waiting for their image, see `DiagramStage.resolve`
+MARKER = 'mkpdfs-diagram:'
+BLOCK_RE = re.compile(r'<!--mkpdfs-diagram:(.*?)-->(.*?)<!--/mkpdfs-diagram-->', re.DOTALL)
+
+
+class CommandRenderer(object):
+    """Renders a diagram by running an external command.
+
+    `{input}` and `{output}` in the command are replaced by the path of the
+    diagram source and of the image to create.
+    """
+
+    def __init__(self, commands):
+        self.commands = commands
+
+    def __call__(self, kind, source_path, output_path):
+        args = [arg.format(input=source_path, output=output_path)
+                for arg in shlex.split(self.commands[kind])]
+        subprocess.run(args, check=True, stdout=subprocess.PIPE,
+                       stderr=subprocess.PIPE, universal_newlines=True)
+
+
+class DiagramStage(object):
+    """Pre-renders the diagrams of the documentation to images.
+
+    While the pages are preprocessed, each diagram block is marked with the
+    image named after the hash of its source, so articles never wait for a
+    diagram. The images missing from the cache directory are then rendered
+    together, by a bounded pool of workers, before the PDF layout, and
+    `resolve` replaces the blocks whose image exists. The others are left
+    as they are.
+
+    `renderer` is called as `renderer(kind, source_path, output_path)` and
+    defaults to a `CommandRenderer` running the configured commands.
+    """
+
+    def __init__(self, directory, commands=None, image_format='png', workers=None, renderer=None):
+        self.directory = directory
+        self.commands = dict(DEFAULT_RENDERERS, **(commands or {}))
+        self.image_format = image_format
+        self.workers = workers or min(os.cpu_count() or 1, 4)
+        self.renderer = renderer or CommandRenderer(self.commands)
+        self._jobs = {}  # Image path -> (kind, source)
+
+    def mentions(self, content):
+        """Whether a page may contain diagrams."""
+        return any(kind in content for kind in self.commands)
+
+    def signature(self):
+        """Identifies the images produced for a given source."""
+        return sorted(self.commands.items()), self.image_format
+
+    def image_path(self, kind, source):
+        digest = hashlib.sha256('\0'.join(
+            (kind, self.commands[kind], self.image_format, source)).encode('utf-8'))
+        return os.path.join(self.directory, '{}.{}'.format(digest.hexdigest(), self.image_format))
+
+    def add(self, kind, source):
+        """Queue a diagram for `render` and return the path of its image."""
+        path = self.image_path(kind, source)
+        self._jobs.setdefault(path, (kind, source))
+        return path
+
+    def mark_blocks(self, article):
+        """Mark the diagram blocks of a BeautifulSoup article with the path
+        of their image, for `resolve`. Returns the `(kind, source)` of the
+        diagrams found."""
+        diagrams = []
+        for kind, element in self._find_blocks(article):
+            source = element.get_text()
+            path = self.add(kind, source)
+            element.insert_before(Comment('{}{}:{}'.format(MARKER, kind, path)))
+            element.insert_after(Comment('/mkpdfs-diagram'))
+            diagrams.append((kind, source))
+        return diagrams
+
+    @staticmethod
+    def resolve(markup):
+        """Replace the marked diagram blocks of `markup` by their image when
+        it has been rendered, and else leave the blocks in place."""
+        if MARKER not in markup:
+            return markup
+
+        def replace(match):
+            kind, _, path = match.group(1).partition(':')
+            if not os.path.exists(path):
+                return match.group(2)
+            return '<img alt="{0} diagram" class="diagram diagram-{0}" src="{1}"/>'.format(
+                kind, escape(urls.path2url(path)))
+
+        return BLOCK_RE.sub(replace, markup)
+
+    def _find_blocks(self, article):
+        """`(kind, element)` of the diagram blocks: `<pre class="mermaid">`,
+        `<div class="mermaid">` or `<pre><code class="language-mermaid">`."""
+        blocks = []
+        for element in article.find_all(['pre', 'div', 'code']):
+            classes = element.get('class') or []
+            for kind in self.commands:
+                if element.name == 'code' and 'language-' + kind in classes:
+                    if element.parent is not None and element.parent.name == 'pre':
+                        element = element.parent
+                elif element.name == 'code' or kind not in classes:
+                    continue
+                if not any(element is found or any(parent is found for parent in element.parents)
+                           for _, found in blocks):
+                    blocks.append((kind, element))
+                break
+        return blocks
+
+    def render(self):
+        """Render the images missing from the cache directory. Returns the
+        number of diagrams rendered and the number of failures."""
+        pending = [(path, kind, source) for path, (kind, source) in self._jobs.items()
+                   if not os.path.exists(path)]
+        if not pending:
+            return 0, 0
+        os.makedirs(self.directory, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(lambda job: self._render_one(*job), pending))
+        return len(pending), results.count(False)
+
+    def _render_one(self, path, kind, source):
+        source_path = '{}.{}'.format(os.path.splitext(path)[0], kind)
+        tmp = '{}.{}.tmp.{}'.format(os.path.splitext(path)[0], os.getpid(), self.image_format)
+        try:
+            with open(source_path, 'w', encoding='utf-8') as f:
+                f.write(source)
+            self.renderer(kind, source_path, tmp)
+            os.replace(tmp, path)
+            return True
+        except (OSError, subprocess.CalledProcessError) as e:
+            detail = getattr(e, 'stderr', None) or e
+            log.warning('Unable to render a {} diagram: {}'.format(kind, detail))
+            return False
+        finally:
+            for leftover in (source_path, tmp):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
@@ -0,0 +1,236 @@
+import hashlib
+import io
+import json
+import logging
+import mimetypes
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+
+from mkpdfs_mkdocs.preprocessor.links.util import url_to_path
+
+try:
+    from weasyprint.urls import URLFetcher, URLFetcherResponse
+except ImportError:  # WeasyPrint < 70 takes a function returning a dict
+    from weasyprint.urls import default_url_fetcher
+    URLFetcher = None
+
+log = logging.getLogger('mkdocs.mkpdfs')
+
+# Local files up to this size are kept in memory, larger ones are mapped
+MEMORY_LIMIT = 1024 * 1024
+USER_AGENT = 'mkpdfs-mkdocs'
+
+
+class Fetcher(object):
+    """Loads the resources of the documents rendered by WeasyPrint.
+
+    Local files are read once and kept in memory, or memory-mapped once
+    when large until `close`. Remote resources are fetched once per build
+    and kept in a disk cache for `ttl` seconds; `prefetch` downloads them
+    concurrently before the layout. In `offline` mode, remote resources
+    only come from the cache, and they are not loaded at all without
+    `remote`. Instances are sent to the render worker processes, which
+    start with an empty memory store.
+    """
+
+    def __init__(self, cache_dir, ttl=24 * 3600, offline=False, timeout=10, workers=8,
+                 remote=True):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.offline = offline
+        self.remote = remote
+        self.timeout = timeout
+        self.workers = workers
+        self._init_state()
+
+    def _init_state(self):
+        self._memory = {}  # URL -> (body, mime type, URL) or the fetch error
+        self._maps = {}  # Path -> memory map of a large local file
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_memory'], state['_maps'], state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_state()
+
+    def settings(self):
+        """The arguments creating a fetcher like this one."""
+        return {'cache_dir': self.cache_dir, 'ttl': self.ttl, 'offline': self.offline,
+                'timeout': self.timeout, 'workers': self.workers, 'remote': self.remote}
+
+    def url_fetcher(self):
+        """The `url_fetcher` to hand to WeasyPrint."""
+        if URLFetcher is not None:
+            return _WeasyPrintFetcher(self)
+        return self._fetch_dict
+
+    def close(self):
+        """Release the memory maps of the large local files."""
+        with self._lock:
+            maps, self._maps = self._maps, {}
+        for mapping in maps.values():
+            mapping.close()
+
+    def fetch(self, url):
+        """Return `(body, mime type, url)` for `url`, or None if this
+        fetcher does not handle its scheme. Errors are raised, and raised
+        again for the following requests of the same URL."""
+        scheme = url.split(':', 1)[0].lower()
+        if scheme == 'file':
+            return self._fetch_file(url)
+        if scheme not in ('http', 'https'):
+            return None
+        with self._lock:
+            known = self._memory.get(url)
+        if known is None:
+            try:
+                known = self._fetch_remote(url)
+            except Exception as e:
+                known = e
+            with self._lock:
+                self._memory[url] = known
+        if isinstance(known, Exception):
+            raise known
+        return known
+
+    def prefetch(self, urls):
+        """Fetch the remote `urls` concurrently. Returns the number of URLs
+        that could not be fetched."""
+        urls = [url for url in urls if url not in self._memory]
+        if not urls:
+            return 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            failed = list(pool.map(self._prefetch_one, urls))
+        return failed.count(True)
+
+    def _prefetch_one(self, url):
+        try:
+            self.fetch(url)
+        except Exception as e:
+            log.debug('Unable to fetch {}: {}'.format(url, e))
+            return True
+        return False
+
+    def _fetch_file(self, url):
+        path = url_to_path(url.split('?')[0].split('#')[0])
+        mime_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        with self._lock:
+            body = self._memory.get(url)
+            mapping = self._maps.get(path)
+        if body is not None:
+            return body, mime_type, url
+        if mapping is not None:
+            return _MappedFile(mapping), mime_type, url
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size > MEMORY_LIMIT:
+                # Read by WeasyPrint straight from the page cache
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                body = f.read()
+        if mapping is not None:
+            with self._lock:
+                known = self._maps.setdefault(path, mapping)
+            if known is not mapping:
+                mapping.close()
+            return _MappedFile(known), mime_type, url
+        with self._lock:
+            self._memory[url] = body
+        return body, mime_type, url
+
+    def _cache_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    def _fetch_remote(self, url):
+        if not self.remote:
+            raise ValueError('{} is not loaded, remote resources are disabled'.format(url))
+        path = self._cache_path(url)
+        try:
+            with open(path + '.json', encoding='utf-8') as f:
+                meta = json.load(f)
+            fresh = time.time() - os.path.getmtime(path + '.json') < self.ttl
+        except (OSError, ValueError):
+            meta, fresh = None, False
+        if meta is not None and (fresh or self.offline):
+            try:
+                with open(path, 'rb') as f:
+                    return f.read(), meta['mime_type'], meta['url']
+            except OSError:
+                pass
+        if self.offline:
+            raise ValueError('{} is not in the cache and the build is offline'.format(url))
+        request = Request(url, headers={'User-Agent': USER_AGENT})
+        with urlopen(request, timeout=self.timeout) as response:
+            body = response.read()
+            mime_type = response.headers.get_content_type()
+            final_url = response.geturl()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(body)
+            os.replace(tmp, path)
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'url': final_url, 'mime_type': mime_type}, f)
+            os.replace(tmp, path + '.json')
+        except OSError as e:
+            log.warning('Unable to cache {}: {}'.format(url, e))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return body, mime_type, final_url
+
+    def _fetch_dict(self, url):
+        result = self.fetch(url)
+        if result is None:
+            return default_url_fetcher(url)
+        body, mime_type, final_url = result
+        key = 'file_obj' if hasattr(body, 'read') else 'string'
+        return {key: body, 'mime_type': mime_type, 'redirected_url': final_url}
+
+
+class _MappedFile(io.RawIOBase):
+    """A file reading a memory map shared by all the fetches of a file,
+    from its start."""
+
+    def __init__(self, mapping):
+        super().__init__()
+        self._mapping = mapping
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._mapping[self._position:self._position + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def readall(self):
+        data = self._mapping[self._position:]
+        self._position += len(data)
+        return data
+
+
+if URLFetcher is not None:
+    class _WeasyPrintFetcher(URLFetcher):
+        """`URLFetcher` serving the resources of a `Fetcher`."""
+
+        def __init__(self, fetcher):
+            super().__init__()
+            self._fetcher = fetcher
+
+        def fetch(self, url, headers=None):
+            result = self._fetcher.fetch(url)
+            if result is None:
+                return super().fetch(url, headers)
+            body, mime_type, final_url = result
+            return URLFetcherResponse(final_url, body, {'Content-Type': mime_type})
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+
+import weasyprint
+
+from mkpdfs_mkdocs.preprocessor.links.util import url_to_path
+from mkpdfs_mkdocs.styles import StyleCache
+
+# Resources the layout loads: images and stylesheet URLs
+RESOURCE_RE = re.compile(r'''(?:\ssrc=["']|url\(\s*["']?)((?:file|https?)://[^"')\s]+)''')
+BLOCK_SIZE = 1024 * 1024
+
+
+class RenderCache(object):
+    """Keeps the last PDF rendered to each output path, with the fingerprint
+    of what it was rendered from.
+
+    The fingerprint covers the document, the design and the files it
+    references (fonts and images), the local files the document embeds,
+    the URLs of its remote resources, the render profile and the version
+    of WeasyPrint. A PDF whose fingerprint did not change is copied back
+    instead of being rendered again.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.reused = 0
+        self._digests = {}  # Path -> digest of the file, for this build
+
+    def _file_digest(self, path):
+        if path not in self._digests:
+            digest = hashlib.sha256()
+            try:
+                with open(path, 'rb') as f:
+                    for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                        digest.update(block)
+                self._digests[path] = digest.hexdigest()
+            except OSError:
+                self._digests[path] = 'missing'
+        return self._digests[path]
+
+    def fingerprint(self, html, design, render_profile, from_file=False):
+        """Fingerprint of the render of `html`, or with `from_file` of the
+        document in the file at `html`, with `design`."""
+        digest = hashlib.sha256()
+        digest.update(json.dumps([weasyprint.__version__, render_profile.name,
+                                  render_profile.options, render_profile.css],
+                                 sort_keys=True).encode('utf-8'))
+        resources = set()
+        if from_file:
+            with open(html, encoding='utf-8') as f:
+                for line in f:
+                    digest.update(line.encode('utf-8'))
+                    resources.update(RESOURCE_RE.findall(line))
+        else:
+            digest.update(html.encode('utf-8'))
+            resources.update(RESOURCE_RE.findall(html))
+        for url in sorted(resources):
+            path = url_to_path(url) if url.startswith('file:') else None
+            # Remote resources are identified by their URL
+            digest.update('\0{}\0{}'.format(url, self._file_digest(path) if path else '').encode('utf-8'))
+        for path, _ in StyleCache.signature(design) or ((design, None),):
+            digest.update('\0{}\0{}'.format(path, self._file_digest(path)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _paths(self, pdf_path):
+        name = hashlib.sha256(os.path.abspath(pdf_path).encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, name)
+        return base + '.pdf', base + '.json'
+
+    def restore(self, pdf_path, fingerprint):
+        """Copy the PDF rendered last time to `pdf_path` if its fingerprint
+        is `fingerprint`. Returns whether it was."""
+        cached, meta = self._paths(pdf_path)
+        try:
+            with open(meta, encoding='utf-8') as f:
+                if json.load(f).get('fingerprint') != fingerprint:
+                    return False
+            tmp = '{}.{}.tmp'.format(pdf_path, os.getpid())
+            shutil.copyfile(cached, tmp)
+        except (OSError, ValueError):
+            return False
+        os.replace(tmp, pdf_path)
+        self.reused += 1
+        return True
+
+    def store(self, pdf_path, fingerprint):
+        """Keep the PDF just rendered to `pdf_path` from `fingerprint`."""
+        cached, meta = self._paths(pdf_path)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = '{}.{}.tmp'.format(cached, os.getpid())
+        shutil.copyfile(pdf_path, tmp)
+        os.replace(tmp, cached)
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'path': pdf_path, 'fingerprint': fingerprint}, f)
+        os.replace(tmp, meta)
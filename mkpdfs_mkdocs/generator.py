@@ -1,119 +1,771 @@
+import copy
+import gc
 import logging
 import os
 import sys
-from html import unescape
-from uuid import uuid4
+import time
+from collections import namedtuple
+from html import escape, unescape
 
 from weasyprint import HTML, urls, CSS
-from bs4 import BeautifulSoup
-from weasyprint.text.fonts import FontConfiguration
+from bs4 import BeautifulSoup, Comment, FeatureNotFound
 
-from datetime import datetime
+from datetime import datetime, timezone
+from mkpdfs_mkdocs import chunked
+from mkpdfs_mkdocs.assets import AssetIndex
+from mkpdfs_mkdocs.cache import ArticleCache, cache_key, stable_content
+from mkpdfs_mkdocs.diagrams import DiagramStage
+from mkpdfs_mkdocs.fetcher import Fetcher
+from mkpdfs_mkdocs.fingerprint import RenderCache
+from mkpdfs_mkdocs import images
+from mkpdfs_mkdocs.linkmap import LinkMap, PageLinks, rewrite_links
+from mkpdfs_mkdocs.manifest import DIRECTORY as MANIFEST_DIRECTORY, BuildManifest
+from mkpdfs_mkdocs.nav import NavIndex
+from mkpdfs_mkdocs.outputs import OutputProfile, names, parse_outputs
+from mkpdfs_mkdocs.partial import ENV_VAR as PARTIAL_ENV_VAR, PartialLinks
+from mkpdfs_mkdocs.preprocessing import PagePreprocessor, preprocess_pages
+from mkpdfs_mkdocs.profiling import BuildProfile
+from mkpdfs_mkdocs.prune import CssPruner, DocumentSelectors
+from mkpdfs_mkdocs.render import write_pdf, write_pdf_file, write_pdfs
+from mkpdfs_mkdocs.render_profiles import get_render_profile
+from mkpdfs_mkdocs.sections import SectionLinks
+from mkpdfs_mkdocs.spill import SpillStore
+from mkpdfs_mkdocs.styles import StyleCache
+from mkpdfs_mkdocs.themes import get_theme
+from mkpdfs_mkdocs.toc import TocBuilder
 from mkpdfs_mkdocs.utils import gen_address
-from .utils import is_external
-from mkpdfs_mkdocs.preprocessor import get_separate as prep_separate, get_combined as prep_combined
-from mkpdfs_mkdocs.preprocessor import adjust_heading_levels
-from mkpdfs_mkdocs.preprocessor import nest_heading_bookmarks
-from mkpdfs_mkdocs.preprocessor import remove_header_links
-from mkpdfs_mkdocs.preprocessor import remove_material_header_icons
+from .utils import peak_rss, slugify, RawHTML
+from mkpdfs_mkdocs.preprocessor import lxml_native
 
 log = logging.getLogger(__name__)
 
+# How a page is preprocessed, `key` is its article cache key or None
+PageJob = namedtuple('PageJob', ('key', 'base_url', 'nesting_level', 'shift_level', 'separate'))
+
+
+def build_year():
+    """The year of the build, taken from `SOURCE_DATE_EPOCH` when set for a
+    reproducible build."""
+    epoch = os.environ.get('SOURCE_DATE_EPOCH')
+    if epoch:
+        return datetime.fromtimestamp(int(epoch), timezone.utc).year
+    return datetime.now().year
+
 
 class Generator(object):
 
-    def __init__(self):
+    def __init__(self, styles=None):
         self.config = None
         self.design = None
         self.mkdconfig = None
+        self.theme = None
         self.nav = None
         self.title = None
         self.logger = logging.getLogger('mkdocs.mkpdfs')
         self.generate = True
         self._articles = {}
-        self._page_order = []
-        self._page_nesting = {}
-        self._base_urls = {}
+        self._nav = NavIndex()
         self._toc = None
-        self._index_to_chapter = {}  # Maps index.md URL to chapter UUID
-        self._skipped_sections = set()  # Section titles to skip in TOC
-        self.html = BeautifulSoup('<html><head></head>\
-        <body></body></html>',
-                                  'html.parser')
+        self.parser = 'html.parser'
+        self._lxml_native = False
+        self._preprocessor = None
+        self._deferred = None  # (content, page, base_url) captured by add_article
+        self._cache = None
+        self._pages = {}  # Page URL -> (title, PDF path, article) for per-page PDFs
+        self._links = LinkMap()
+        self._diagram_pages = []  # URLs of the articles with diagram blocks
+        self._spill = None  # Articles kept on disk in low-memory mode
+        self.styles = styles or StyleCache()
+        self._assets = None
+        self._diagrams = None
+        self._images = None
+        self._pruner = None
+        self._detached = None
+        self._renders = None
+        self._fetcher = None
+        self.profile = BuildProfile()
+        self.render_profile = None
+        self._written = []  # PDFs generated by the build
+        self.outputs = []
+        self._partial = []  # Sections of a partial render
+        self._options = None  # Plugin options as configured, for the manifest
+        self.html = self._new_document()
         self.dir = os.path.dirname(os.path.realpath(__file__))
         self.design = os.path.join(self.dir, 'design/report.css')
 
     def set_config(self, local, config):
         self.config = local
+        self._options = copy.deepcopy(dict(local))
+        self.render_profile = get_render_profile(self.config['render_profile'])
+        self.config.update(self.render_profile.config)
         if self.config['design']:
             css_file = os.path.join(os.getcwd(), self.config['design'])
             if not os.path.isfile(css_file):
                 sys.exit('The file {} specified for design has not \
                 been found.'.format(css_file))
             self.design = css_file
+        self.parser = self.config.get('html_parser') or 'html.parser'
+        try:
+            BeautifulSoup('', self.parser)
+        except FeatureNotFound:
+            sys.exit('The HTML parser {} is not installed.'.format(self.parser))
+        if self.config.get('lxml_native'):
+            if lxml_native.lxml_html is None:
+                self.logger.warning('lxml is not installed, lxml_native is ignored.')
+            else:
+                self._lxml_native = True
+        if self.config.get('cache'):
+            self._cache = ArticleCache(os.path.join(os.getcwd(), self.config['cache_dir']),
+                                       max_size=self.config['cache_max_size'] * 1024 * 1024,
+                                       max_age=self.config['cache_max_age'] * 24 * 3600)
+        if self.config.get('low_memory'):
+            self._spill = SpillStore()
+        self.theme = get_theme(config['theme'].name)
+        self.profile = BuildProfile(enabled=self.config['profile'])
+        self._assets = AssetIndex(config['site_dir'])
+        self._fetcher = Fetcher(os.path.join(os.getcwd(), self.config['remote_cache_dir']),
+                                ttl=self.config['remote_cache_ttl'] * 3600,
+                                offline=self.config['offline'],
+                                remote=self.config['remote_images'])
+        self._diagrams = DiagramStage(os.path.join(os.getcwd(), self.config['diagram_cache_dir']),
+                                      commands=self.config['diagram_renderers'] or None,
+                                      image_format=self.config['diagram_format'],
+                                      workers=self.config['workers'] or None)
+        if self.config.get('optimize_images'):
+            if images.Image is None:
+                self.logger.warning('Pillow is not installed, optimize_images is ignored.')
+            else:
+                self._images = images.ImageStage(os.path.join(os.getcwd(), self.config['image_cache_dir']),
+                                                 dpi=self.config['image_dpi'],
+                                                 quality=self.config['jpeg_quality'],
+                                                 colors=self.config['png_colors'],
+                                                 workers=self.config['workers'] or None)
+        if self.config['detached']:
+            # Imported here, the module is also run with `python -m`
+            from mkpdfs_mkdocs import detached
+            self._detached = detached.DetachedRender(os.path.join(os.getcwd(), self.config['detached_dir']))
+        if self.config['render_cache']:
+            self._renders = RenderCache(os.path.join(os.getcwd(), self.config['render_cache_dir']))
+        if self.config['prune_css']:
+            self._pruner = CssPruner(os.path.join(os.getcwd(), self.config['css_cache_dir']))
         self.title = config['site_name']
         copyright_text = config.get('copyright') or ''
-        self.config['copyright'] = copyright_text.replace('@YYYY', str(datetime.now().year))
+        self.config['copyright'] = copyright_text.replace('@YYYY', str(build_year()))
+        self.outputs = parse_outputs(self.config['output_path'], self.config, self.design, self.title)
+        if self.config['partial_path'] in [output.path for output in self.outputs]:
+            sys.exit('partial_path must differ from the paths of output_path.')
+        self._partial = names(os.environ.get(PARTIAL_ENV_VAR) or self.config['partial'])
+        self._preprocessor = PagePreprocessor(self.parser, self._lxml_native, self.theme.header_icons,
+                                              self._diagrams, self._assets, profile=self.profile)
+        if self.config.get('parallel_preprocess'):
+            self._deferred = []
         self.mkdconfig = config
 
-    def write(self):
+    @staticmethod
+    def _new_document():
+        return BeautifulSoup('<html><head></head>\
+        <body></body></html>',
+                             'html.parser')
+
+    def write(self, renderer=None):
+        """Assemble the combined documents and render them to the outputs
+        of `output_path`.
+
+        When a `BackgroundRenderer` is given, the document is handed over to
+        it and this method returns without waiting for the PDF. In detached
+        mode, the documents are rendered by a worker process that outlives
+        the build, see `mkpdfs_mkdocs.detached`.
+        """
         if not self.generate:
             self.logger.log(msg='Unable to generate the PDF Version (See Mkpdfs doc)',
                             level=logging.WARNING, )
             return
-        self.gen_articles()
-        font_config = FontConfiguration()
-        self.add_head()
+        if self._deferred:
+            with self.profile.stage('preprocess'):
+                self.preprocess_pages()
+            if not self.generate:
+                self.logger.log(msg='Unable to generate the PDF Version (See Mkpdfs doc)',
+                                level=logging.WARNING, )
+                return
+        for backend, (pages, seconds) in self._preprocessor.parse_stats.items():
+            self.logger.info('Parsed {} pages with {} in {:.2f}s'.format(pages, backend, seconds))
+        build_start = time.perf_counter()
+        if renderer is None:
+            # Else left to the background render, see _background_stages()
+            self.prepare_assets()
+        self.report_missing_images()
+        with self.profile.stage('check_links'):
+            self.check_links()
+        if renderer is None and self._assets.remote and self.config['remote_images']:
+            start = time.perf_counter()
+            with self.profile.stage('prefetch'):
+                failed = self._fetcher.prefetch(sorted(self._assets.remote))
+            self.logger.info('Fetched {} remote images in {:.1f}s ({} failed)'.format(
+                len(self._assets.remote), time.perf_counter() - start, failed))
+        if self._cache is not None:
+            self.logger.info('Article cache: {} hits, {} misses'.format(self._cache.hits, self._cache.misses))
+            self._cache.evict()
+        if self.config['manifest']:
+            with self.profile.stage('manifest'):
+                self.save_manifest()
+        partial = self.partial_output()
+        if partial is not None:
+            self.logger.info('Partial render of {} to {}, the full PDF is left as it is.'.format(
+                partial.title, partial.path))
+            self.write_outputs(renderer, [partial])
+            if partial.links.rewritten:
+                self.logger.info('{} links to pages outside of the partial render point to {}.'.format(
+                    partial.links.rewritten, 'the site' if partial.links.site_url else 'the full PDF'))
+            if partial.links.unlinked:
+                self.logger.info('{} links to pages outside of the partial render are left as text, '
+                                 'without site_url or full PDF to point to.'.format(partial.links.unlinked))
+        else:
+            if self.config['output_mode'] != 'pages':
+                with self.profile.stage('check_links'):
+                    self.check_output_links()
+                self.write_outputs(renderer)
+            if self.config['output_mode'] != 'combined':
+                if renderer is not None:
+                    self.logger.info('The per-page PDFs are not rendered while serving in the background.')
+                else:
+                    self.write_pages()
+        if self._detached is not None and self._detached.jobs:
+            self.start_detached()
+        if self._spill is not None:
+            self._spill.cleanup()
+        self._fetcher.close()
+        if self._renders is not None and self._renders.reused:
+            self.logger.info('Render cache: reused {} unchanged PDFs'.format(self._renders.reused))
+        if self._written:
+            size = sum(os.path.getsize(path) for path in self._written if os.path.isfile(path))
+            self.logger.info('Render profile {}: {} PDFs, {:.1f} MiB in {:.1f}s'.format(
+                self.render_profile.name, len(self._written), size / (1024 * 1024),
+                time.perf_counter() - build_start))
+        peak = peak_rss()
+        if peak is not None:
+            self.logger.info('Peak memory usage: {:.0f} MiB'.format(peak))
+        if self.profile.enabled:
+            self.profile.write(os.path.join(self.mkdconfig['site_dir'], 'mkpdfs-profile.json'))
+
+    def prepare_assets(self):
+        """Render the diagrams and make the copies of the optimized images
+        before the layout."""
+        start = time.perf_counter()
+        with self.profile.stage('diagrams'):
+            rendered, failed = self._diagrams.render()
+            self.resolve_diagrams()
+        if rendered:
+            self.logger.info('Rendered {} diagrams in {:.1f}s ({} failed)'.format(
+                rendered, time.perf_counter() - start, failed))
+        if self._images is not None:
+            start = time.perf_counter()
+            with self.profile.stage('optimize_images'):
+                processed, saved = self._images.render()
+            if processed:
+                self.logger.info('Optimized {} images in {:.1f}s, saving {:.1f} MiB'.format(
+                    processed, time.perf_counter() - start, saved / (1024 * 1024)))
+
+    def _background_stages(self):
+        """The stages a `BackgroundRenderer` runs before the layout, which
+        the rebuild leaves out."""
+        remote = sorted(self._assets.remote) if self.config['remote_images'] else []
+        return {'diagrams': self._diagrams, 'images': self._images, 'remote': remote}
 
-        pdf_path = os.path.join(self.mkdconfig['site_dir'],
-                                self.config['output_path'])
+    def save_manifest(self):
+        """Save the articles and the navigation to `mkpdfs-manifest` in
+        `site_dir`, for the `mkpdfs` command to render the PDFs again, see
+        `mkpdfs_mkdocs.cli`."""
+        keys = [key for key in self._nav.order()
+                if self._nav.get(key).is_page and self._has_article(key)]
+        skipped = [node.key for node in self._nav.nodes() if node.is_section and node.skipped]
+        pages = ((url, title, pdf, markup) for url, (title, pdf, markup) in self._pages.items())
+        BuildManifest(os.path.join(self.mkdconfig['site_dir'], MANIFEST_DIRECTORY)).save(
+            self._options, self.mkdconfig, self.nav, skipped,
+            ((key, self._article_markup(key)) for key in keys), pages)
+
+    def load_manifest(self, manifest):
+        """Restore the navigation and the articles of a `BuildManifest`, in
+        place of the events of a MkDocs build."""
+        self.add_nav(manifest.nav())
+        for key in manifest.data['skipped']:
+            node = self._nav.get(key)
+            if node is not None:
+                node.skipped = True
+                self._articles.pop(key, None)
+        for key, markup in manifest.articles():
+            self._assets.collect_remote(markup)
+            if self._spill is not None:
+                self._spill.put(key, markup)
+            else:
+                self._articles[key] = RawHTML(markup)
+        for url, title, pdf, markup in manifest.pages():
+            self._pages[url] = (title, pdf, markup)
+
+    def start_detached(self):
+        """Start the detached render, and wait for it when `detached_wait`
+        or the `MKPDFS_WAIT` environment variable is set."""
+        from mkpdfs_mkdocs import detached
+        directory = self._detached.directory
+        pid = self._detached.start(self._fetcher, self.render_profile,
+                                   workers=self.config['workers'] or None,
+                                   render_cache=self._renders.directory if self._renders else None)
+        self.logger.info('Rendering {} PDFs in the detached process {}, see {}'.format(
+            len(self._detached.jobs), pid, os.path.join(directory, detached.STATUS)))
+        if not (self.config['detached_wait'] or os.environ.get('MKPDFS_WAIT')):
+            return
+        status = detached.wait(directory)
+        if status['state'] != 'done':
+            sys.exit('The detached PDF render failed: {}'.format(status.get('error')))
+        self._written.extend(pdf['path'] for pdf in status['pdfs'])
+
+    def report_missing_images(self):
+        """Warn about the local images referenced by the pages that do not
+        exist in the site directory."""
+        missing = self._assets.missing
+        if not missing:
+            return
+        self.logger.warning('{} images referenced by the documentation are missing:'.format(len(missing)))
+        for path in sorted(missing):
+            self.logger.info('  {} (referenced by {})'.format(
+                os.path.relpath(path, self._assets.root), ', '.join(sorted(missing[path]))))
+
+    def resolve_diagrams(self):
+        """Replace the diagram blocks of the articles by their rendered
+        images, see `DiagramStage.resolve`."""
+        for url in self._diagram_pages:
+            if url in self._pages:
+                title, pdf, page_html = self._pages[url]
+                self._pages[url] = (title, pdf, self._diagrams.resolve(page_html))
+            if not self._has_article(url):
+                continue
+            markup = self._diagrams.resolve(self._article_markup(url))
+            if url in self._articles:
+                self._articles[url] = RawHTML(markup)
+            else:
+                self._spill.put(url, markup)
+
+    def check_links(self):
+        """Report the internal links of the pages that match no anchor of
+        the combined document, before the layout. Depending on the
+        `broken_links` option, they are also fixed or removed, or the build
+        fails."""
+        broken = self._links.broken()
+        if not broken:
+            return
+        mode = self.config['broken_links']
+        fixes = {}  # Page URL -> {target: new target, or None to remove the link}
+        self.logger.warning('{} links of the documentation point to no anchor of the PDF:'.format(
+            len(broken)))
+        for link in broken:
+            fix = link.fix if mode in ('rewrite', 'strip') else None
+            if fix is not None:
+                outcome = ', linked to #{}'.format(fix)
+            elif mode == 'strip':
+                outcome = ', removed'
+            else:
+                outcome = ''
+            if fix is not None or mode == 'strip':
+                fixes.setdefault(link.page, {})[link.target] = fix
+            self.logger.info('  #{} in {} ({}{})'.format(link.target, link.page, link.reason, outcome))
+        if mode == 'fail':
+            sys.exit('The documentation has broken links, see above (broken_links: fail).')
+        for url, targets in fixes.items():
+            if not self._has_article(url):
+                continue
+            markup = rewrite_links(self._article_markup(url), targets)
+            if url in self._articles:
+                self._articles[url] = RawHTML(markup)
+            else:
+                self._spill.put(url, markup)
+
+    def check_output_links(self):
+        """Give the outputs holding only some of the pages a `PartialLinks`,
+        as the partial render, and report their links to the pages they
+        leave out."""
+        selections = [(output, output.select(self._nav)) for output in self.outputs]
+        full = next((output for output, selected in selections if selected is None), None)
+        site_dir = self.mkdconfig['site_dir']
+        site_url = self.mkdconfig.get('site_url')
+        pages = [node.key for node in self._nav.nodes() if node.is_page]
+        for output, selected in selections:
+            if selected is None:
+                continue
+            output.links = PartialLinks(pages, selected,
+                                        os.path.join(site_dir, full.path) if full else None,
+                                        os.path.join(site_dir, output.path), site_url=site_url)
+            outside = self._links.outside(selected)
+            if not outside:
+                continue
+            self.logger.info('{} links of {} point to pages it leaves out, {}:'.format(
+                len(outside), output.path,
+                'linked to the site' if site_url else
+                'linked to ' + full.path if full else 'left as text'))
+            for url, target in outside:
+                self.logger.info('  #{} in {}'.format(target, url))
+
+    def write_outputs(self, renderer=None, outputs=None):
+        """Render the combined PDF of each output profile, those of
+        `output_path` by default. The documents of several profiles are laid
+        out in parallel worker processes."""
+        outputs = outputs or self.outputs
+        if renderer is not None and len(outputs) > 1:
+            self.logger.info('Only {} is rendered while serving.'.format(outputs[0].path))
+            outputs = outputs[:1]
+        if self._detached is not None:
+            for index, output in enumerate(outputs):
+                if index:
+                    self.html = self._new_document()
+                pdf_path, html, design = self._assemble(output, 'combined-{}.html'.format(index))
+                fingerprint = self._fingerprint(html, pdf_path, design, from_file=self._spill is not None)
+                if fingerprint is not False:
+                    self._detached.add(html, pdf_path, design, from_file=self._spill is not None,
+                                       fingerprint=fingerprint)
+            return
+        if len(outputs) == 1 or renderer is not None or self.config['chunked_layout']:
+            for index, output in enumerate(outputs):
+                if index:
+                    self.html = self._new_document()
+                self.write_combined(renderer, output, release=index == len(outputs) - 1)
+            return
+        jobs = []
+        for index, output in enumerate(outputs):
+            if index:
+                self.html = self._new_document()
+            pdf_path, html, design = self._assemble(output, 'combined-{}.html'.format(index))
+            jobs.append((html, pdf_path, design))
+        low_memory = self._spill is not None
+        jobs, fingerprints = self._unchanged(jobs, from_file=low_memory)
+        if low_memory:
+            self._release_trees()
+        if not jobs:
+            return
+        start = time.perf_counter()
+        with self.profile.stage('layout'):
+            write_pdfs(jobs, self.design, workers=self.config['workers'] or None,
+                       styles=self.styles, fetcher=self._fetcher, from_files=low_memory,
+                       render_profile=self.render_profile)
+        self._rendered(jobs, fingerprints)
+        self.logger.info('{} PDF versions of the documentation have been generated in {:.1f}s.'.format(
+            len(jobs), time.perf_counter() - start))
+
+    def partial_output(self):
+        """The output of a partial render, or None. It holds the sections
+        named by the `partial` option or the `MKPDFS_PARTIAL` environment
+        variable, and the sections of the pages having `pdf_partial: true`
+        in their metadata, or the page itself outside of any section."""
+        sections = list(self._partial)
+        keys, titles = [], []
+        for node in self._nav.nodes():
+            if node.is_page and (node.item.meta or {}).get('pdf_partial'):
+                paths = node.section_paths()
+                if paths:
+                    sections.append(paths[-1])
+                else:
+                    keys.append(node.key)
+                    titles.append(node.title)
+        known = set()
+        for node in self._nav.nodes():
+            known.update(node.section_paths())
+        for section in sections:
+            if section not in known:
+                self.logger.warning('There is no section {} in the navigation.'.format(section))
+        sections = [section for section in sections if section in known]
+        if not sections and not keys:
+            return None
+        for section in sections:
+            title = section.rsplit('/', 1)[-1]
+            if title not in titles:
+                titles.append(title)
+        first = self.outputs[0]
+        output = OutputProfile(self.config['partial_path'], sections=sections, keys=keys,
+                               toc_position=first.toc_position, design=first.design,
+                               title='{} - {}'.format(first.title, ', '.join(titles)),
+                               author=first.author, company=first.company)
+        pages = [node.key for node in self._nav.nodes() if node.is_page]
+        output.links = PartialLinks(pages, output.select(self._nav),
+                                    os.path.join(self.mkdconfig['site_dir'], first.path),
+                                    os.path.join(self.mkdconfig['site_dir'], output.path),
+                                    site_url=self.mkdconfig.get('site_url'))
+        return output
+
+    def _fingerprint(self, html, pdf_path, design, from_file=False):
+        """The fingerprint of a render with the render cache, None without
+        it, or False when the unchanged PDF has been put back at
+        `pdf_path`."""
+        if self._renders is None:
+            return None
+        with self.profile.stage('fingerprint'):
+            fingerprint = self._renders.fingerprint(html, design, self.render_profile, from_file)
+            if self._renders.restore(pdf_path, fingerprint):
+                self.logger.debug('{} is unchanged, rendering skipped.'.format(
+                    os.path.relpath(pdf_path, self.mkdconfig['site_dir'])))
+                self._written.append(pdf_path)
+                return False
+        return fingerprint
+
+    def _unchanged(self, jobs, from_file=False):
+        """Put back the unchanged PDFs of `(html, pdf_path, design)` jobs.
+        Returns the jobs left to render and their fingerprints."""
+        left, fingerprints = [], {}
+        for html, pdf_path, design in jobs:
+            fingerprint = self._fingerprint(html, pdf_path, design, from_file)
+            if fingerprint is not False:
+                left.append((html, pdf_path, design))
+                fingerprints[pdf_path] = fingerprint
+        return left, fingerprints
+
+    def _rendered(self, jobs, fingerprints):
+        for _, pdf_path, _ in jobs:
+            self._written.append(pdf_path)
+            if fingerprints.get(pdf_path):
+                self._renders.store(pdf_path, fingerprints[pdf_path])
+
+    def _assemble(self, output, html_name='combined.html'):
+        """Build the combined document of `output`, and export it when
+        `export_combinedHTML` is set. Returns the path of the PDF, the
+        markup of the document, or in low-memory mode the path of the file
+        holding it, and the design to render it with."""
+        low_memory = self._spill is not None
+        selectors = DocumentSelectors() if self._pruner is not None else None
+        with self.profile.stage('gen_articles'):
+            self.gen_articles(streamed=low_memory, output=output)
+            self.add_head(output)
+
+        pdf_path = os.path.join(self.mkdconfig['site_dir'], output.path)
         os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
 
-        if self.config['export_combinedHTML']:
-            htmlcontent = str(self.html)
-            text_file = open(pdf_path + ".html", "w")
-            text_file.write(htmlcontent)
-            text_file.close()
+        with self.profile.stage('serialize'):
+            if low_memory:
+                html = self._spill.path(html_name)
+                self._stream_combined(html, output, selectors=selectors)
+                if self.config['export_combinedHTML']:
+                    self._stream_combined(pdf_path + '.html', output, design_link=True)
+            else:
+                html = str(self.html)
+                if selectors is not None:
+                    selectors.feed(html)
+                if self.config['export_combinedHTML']:
+                    text_file = open(pdf_path + ".html", "w")
+                    text_file.write(self._link_design(html, output.design))
+                    text_file.close()
+        design = output.design
+        if selectors is not None:
+            with self.profile.stage('prune_css'):
+                design = self._pruner.prune(design, selectors)
+        return pdf_path, html, design
+
+    def write_combined(self, renderer=None, output=None, release=True):
+        """Render the combined PDF of `output`, the first output profile by
+        default. In low-memory mode, the document trees are dropped before
+        the layout when `release` is set."""
+        output = output or self.outputs[0]
+        low_memory = self._spill is not None
+        pdf_path, html, design = self._assemble(output)
+        fingerprint = None
+        if renderer is None:
+            fingerprint = self._fingerprint(html, pdf_path, design, from_file=low_memory)
+            if fingerprint is False:
+                return
+        if low_memory:
+            html_path = html
+        else:
+            htmlcontent = html
 
-        html = HTML(string=str(self.html)).write_pdf(pdf_path,
-                                                     font_config=font_config)
+        if renderer is not None:
+            if low_memory:
+                self._release_trees()
+                with open(html_path, encoding='utf-8') as f:
+                    htmlcontent = f.read()
+            renderer.submit(htmlcontent, pdf_path, design, self._fetcher,
+                            self.render_profile, **self._background_stages())
+            return
+        dump = None
+        if self.config['profile_render']:
+            dump = os.path.join(self.mkdconfig['site_dir'], 'mkpdfs-render.prof')
+        with self.profile.cprofile(dump):
+            if self.config['chunked_layout'] and chunked.available():
+                self._write_chunked(pdf_path, output, design, release)
+            else:
+                if self.config['chunked_layout']:
+                    self.logger.warning('pypdf is not installed, chunked_layout is ignored.')
+                if low_memory:
+                    if release:
+                        self._release_trees()
+                    write_pdf_file(html_path, pdf_path, design, self.styles, self._fetcher,
+                                   self.profile, self.render_profile)
+                else:
+                    write_pdf(htmlcontent, pdf_path, design, self.styles, self._fetcher,
+                              self.profile, self.render_profile)
+        self._rendered([(html, pdf_path, design)], {pdf_path: fingerprint})
         self.logger.log(msg='The PDF version of the documentation has been generated.', level=logging.INFO, )
 
+    def _write_chunked(self, pdf_path, output, design, release=True):
+        """Lay out the combined document in parallel chunks of top-level
+        nav entries, see `mkpdfs_mkdocs.chunked`."""
+        front = str(self.html.body.find('article', id='doc-cover'))
+        back = ''
+        if output.toc_position == 'pre':
+            front += str(self._toc)
+        elif output.toc_position == 'post':
+            back = str(self._toc)
+        groups = []
+        for url in self._order(output):
+            if not self._has_article(url):
+                continue
+            if self._nav.is_top_level(url) or not groups:
+                groups.append('')
+            groups[-1] += self._article_markup(url, output)
+        head = str(self.html.head)
+        if self._spill is not None and release:
+            self._release_trees()
+        start = time.perf_counter()
+        layout = chunked.ChunkedLayout(head, front, groups, back,
+                                       design, workers=self.config['workers'] or None,
+                                       fetcher=self._fetcher, profile=self.profile,
+                                       render_profile=self.render_profile)
+        layout.write(pdf_path)
+        self.logger.info('Laid out {} chunks in {:.1f}s.'.format(
+            len(layout.bodies), time.perf_counter() - start))
+
+    def _stream_combined(self, html_path, output, design_link=False, selectors=None):
+        """Write the combined document to `html_path`, copying the spilled
+        articles into it one at a time. Only the cover and the table of
+        contents are held in memory. The markup is fed to `selectors` when
+        given."""
+        prefix, suffix = str(self.html).split(self._placeholder().output_ready())
+        if design_link:
+            prefix = self._link_design(prefix, output.design)
+        feed = selectors.feed if selectors is not None else lambda markup: None
+        with open(html_path, 'w', encoding='utf-8') as f:
+            f.write(prefix)
+            feed(prefix)
+            for url in self._order(output):
+                if url in self._articles:
+                    markup = str(self._articles[url])
+                elif url in self._spill:
+                    if selectors is None and output.links is None:
+                        self._spill.copy_to(url, f)
+                        continue
+                    markup = self._spill.read(url)
+                else:
+                    continue
+                if output.links is not None:
+                    markup = output.links.rewrite(markup)
+                f.write(markup)
+                feed(markup)
+            f.write(suffix)
+            feed(suffix)
+
+    def _release_trees(self):
+        """Drop the document trees before the layout starts."""
+        self.html = BeautifulSoup('<html><head></head><body></body></html>', 'html.parser')
+        self._toc = None
+        self._articles = {}
+        gc.collect()
+
+    def _order(self, output):
+        """Keys of the articles of `output`, in order."""
+        selected = output.select(self._nav)
+        return [key for key in self._nav.order() if selected is None or key in selected]
+
+    def _has_article(self, url):
+        return url in self._articles or (self._spill is not None and url in self._spill)
+
+    def _article_markup(self, url, output=None):
+        if url in self._articles:
+            markup = str(self._articles[url])
+        else:
+            markup = self._spill.read(url)
+        if output is not None and output.links is not None:
+            markup = output.links.rewrite(markup)
+        return markup
+
+    @staticmethod
+    def _placeholder():
+        return Comment('mkpdfs-articles')
+
+    def write_pages(self):
+        """Render one PDF per page, plus one per top-level nav section when
+        `section_pdfs` is set, in parallel worker processes."""
+        site_dir = self.mkdconfig['site_dir']
+        jobs = []
+        for url in self._nav.order():
+            if url in self._pages:
+                title, pdf, article = self._pages[url]
+                jobs.append((self._page_document(title, article),
+                             os.path.join(site_dir, pdf)))
+        if self.config['section_pdfs']:
+            pdf_dir = os.path.dirname(self.outputs[0].path)
+            used = set()
+            for section in self._nav.sections():
+                title = section.title
+                pages = [url for url in section.pages() if url in self._pages]
+                if not pages:
+                    continue
+                links = SectionLinks([(url, self._pages[url][1]) for url in pages], pdf_dir)
+                articles = [links.article(url, self._pages[url][1], self._pages[url][2])
+                            for url in pages]
+                body = '<h1 class="section_title">{}</h1>{}'.format(
+                    escape(unescape(title)), ''.join(articles))
+                name = base = slugify(unescape(title)) or 'section'
+                count = 1
+                while name in used:
+                    # Sections with the same title, see NavIndex._section_key
+                    count += 1
+                    name = '{}-{}'.format(base, count)
+                used.add(name)
+                jobs.append((self._page_document(title, body),
+                             os.path.join(site_dir, pdf_dir, name + '.pdf')))
+        for _, pdf_path in jobs:
+            os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+        design = self.design
+        if self._pruner is not None:
+            # One stylesheet for all the pages
+            selectors = DocumentSelectors()
+            for html, _ in jobs:
+                selectors.feed(html)
+            with self.profile.stage('prune_css'):
+                design = self._pruner.prune(design, selectors)
+        jobs, fingerprints = self._unchanged([(html, pdf_path, design) for html, pdf_path in jobs])
+        if self._detached is not None:
+            for html, pdf_path, _ in jobs:
+                self._detached.add(html, pdf_path, design, fingerprint=fingerprints.get(pdf_path))
+            return
+        start = time.perf_counter()
+        with self.profile.stage('page_pdfs'):
+            write_pdfs(jobs, design, workers=self.config['workers'] or None,
+                       styles=self.styles, fetcher=self._fetcher,
+                       render_profile=self.render_profile)
+        self._rendered(jobs, fingerprints)
+        self.logger.info('{} page PDFs have been generated in {:.1f}s.'.format(
+            len(jobs), time.perf_counter() - start))
+
     def add_nav(self, nav):
         self.nav = nav
-        for p in nav:
-            self.add_to_order(p)
+        self._nav = NavIndex(nav)
+        for section in self._nav.chapters():
+            self.add_chapter(section)
 
-    def add_to_order(self, page, level=1):
-        if page.is_page and page.meta and 'pdf' in page.meta and not page.meta['pdf']:
-            return
-        if page.is_page:
-            self._page_nesting[page.file.url] = level - 1
-            self._page_order.append(page.file.url)
-        elif page.children:
-            uuid = str(uuid4())
-            self._page_order.append(uuid)
-            title = self.html.new_tag('h1',
-                                      id='{}-title'.format(uuid),
-                                      **{'class': 'section_title',
-                                          # See also nest_heading_bookmarks()
-                                         'style': 'bookmark-level:{}'.format(level)}
-                                      )
-            title.append(unescape(page.title))
-            article = self.html.new_tag('article',
-                                        id='{}'.format(uuid),
-                                        **{'class': 'chapter'}
-                                        )
-            article.append(title)
-            self._articles[uuid] = article
-            # Track index.md to chapter mapping for pdf_chapter support
-            for child in page.children:
-                if child.is_page and hasattr(child, 'file') and child.file.name == 'index':
-                    self._index_to_chapter[child.file.src_path] = (uuid, page.title)
-                    self.logger.info(f"Tracked chapter mapping: {child.file.src_path} -> {uuid} (title: {page.title})")
-                    break
-            for child in page.children:
-                self.add_to_order(child, level=level + 1)
+    def add_chapter(self, section):
+        """Add the article opening the chapter of a nav section."""
+        uuid = section.key
+        title = self.html.new_tag('h1',
+                                  id='{}-title'.format(uuid),
+                                  **{'class': 'section_title',
+                                      # See also nest_heading_bookmarks()
+                                     'style': 'bookmark-level:{}'.format(section.depth + 1)}
+                                  )
+        title.append(unescape(section.title))
+        article = self.html.new_tag('article',
+                                    id='{}'.format(uuid),
+                                    **{'class': 'chapter'}
+                                    )
+        article.append(title)
+        self._articles[uuid] = article
+        # Track index.md to chapter mapping for pdf_chapter support
+        index = section.index_page()
+        if index is not None:
+            self.logger.info(f"Tracked chapter mapping: {index.item.file.src_path} -> {uuid} (title: {section.title})")
 
     def remove_from_order(self, item):
         return
@@ -121,287 +773,208 @@ class Generator(object):
     def add_article(self, content, page, base_url):
         if not self.generate:
             return None
-        self._base_urls[page.file.url] = base_url
-        soup = BeautifulSoup(content, 'html.parser')
-        url = page.url.split('.')[0]
-        article = soup.find('article')
-        if not article:
-            article = self.html.new_tag('article')
-            eld = soup.find('div', **{'role': 'main'})
-            article.append(eld)
-            article.div['class'] = article.div['role'] = None
-
-        if not article:
-            self.generate = False
-            return None
-        # Pre-render Mermaid diagrams to SVG+PNG files (must run before
-        # prep_combined so replace_svg_with_png can swap SVG refs for PNG)
-        try:
-            scripts_dir = os.path.join(os.getcwd(), 'scripts')
-            if scripts_dir not in sys.path:
-                sys.path.insert(0, scripts_dir)
-            from mermaid_renderer import render_mermaid_blocks
-            render_mermaid_blocks(article, base_url)
-        except ImportError:
-            self.logger.debug("mermaid_renderer not available, skipping Mermaid pre-rendering")
-
-        if self.mkdconfig['theme'].name == 'material':
-            article = remove_material_header_icons(article)
-        article = prep_combined(article, base_url, page.file.url)
-        article = remove_header_links(article)
-        nesting_level = self._page_nesting.get(page.file.url, 0)
-        article = nest_heading_bookmarks(article, nesting_level)
+        if self._deferred is not None:
+            # Preprocessed with the other pages by preprocess_pages()
+            self._deferred.append((content, page, base_url))
+            return self._pdf_url(page)
+        job = self._page_job(content, page, base_url)
+        result = self._cached(job)
+        if result is None:
+            result = self._preprocess(content, page, base_url, job.nesting_level, job.shift_level,
+                                      separate=job.separate)
+            if result is None:
+                self.generate = False
+                return None
+            result = self._cache_put(job, result)
+        self._store(page, result)
+        return self._pdf_url(page)
+
+    def preprocess_pages(self):
+        """Preprocess the pages captured by `add_article` with the
+        `parallel_preprocess` option, in worker processes. The articles are
+        stored in the order of capture, as `add_article` would have."""
+        captured, self._deferred = self._deferred, []
+        jobs = [self._page_job(content, page, base_url) for content, page, base_url in captured]
+        results = [self._cached(job) for job in jobs]
+        pending = [index for index, result in enumerate(results) if result is None]
+        if pending:
+            start = time.perf_counter()
+            done = preprocess_pages(self._preprocessor, [
+                (captured[index][0], captured[index][1].file.url, captured[index][2],
+                 jobs[index].nesting_level, jobs[index].shift_level, jobs[index].separate)
+                for index in pending], workers=self.config['workers'] or None)
+            for index, result in zip(pending, done):
+                if result is not None:
+                    markup, page_html, diagrams, links = result
+                    results[index] = self._cache_put(jobs[index], (RawHTML(markup), page_html,
+                                                                   diagrams, links))
+            self.logger.info('Preprocessed {} pages in {:.1f}s'.format(
+                len(pending), time.perf_counter() - start))
+        for (_, page, _), result in zip(captured, results):
+            if result is None:
+                self.generate = False
+                return
+            self._store(page, result)
+
+    def _page_job(self, content, page, base_url):
+        nesting_level = self._nav.nesting(page.file.url)
         # Optionally adjust visual heading levels based on nesting depth
+        shift_level = 0
         if self.config.get('heading_shift', False):
             # Non-index pages get an extra level shift (they're subpages of index.md)
             shift_level = nesting_level
             if page.file.name != 'index':
                 shift_level += 1
             self.logger.info(f"heading_shift: {page.file.src_path} nesting={nesting_level} shift={shift_level}")
-            article = adjust_heading_levels(article, shift_level)
+        separate = self.config['output_mode'] != 'combined'
+        key = None
+        if self._cache is not None:
+            key = cache_key(stable_content(content), page.file.url, base_url, nesting_level,
+                            self.config.get('heading_shift', False), shift_level,
+                            self.mkdconfig['theme'].name, self.parser, self._lxml_native,
+                            separate, self._diagrams.signature(),
+                            # Depends on the PNG files, not on the content
+                            self._assets.swaps(content, base_url))
+        return PageJob(key, base_url, nesting_level, shift_level, separate)
+
+    def _cached(self, job):
+        """The preprocessed page of `job` from the article cache, or None."""
+        entry = self._cache.get(job.key) if job.key else None
+        if not entry:
+            return None
+        self._assets.collect_remote(entry['html'])
+        # Reported again, unless the images have been added since
+        self._assets.recheck(entry.get('missing', ()), job.base_url)
+        # The images may have been evicted from the diagram cache
+        for kind, source in entry.get('diagrams', ()):
+            self._diagrams.add(kind, source)
+        return (RawHTML(entry['html']), entry.get('page'), entry.get('diagrams', []),
+                PageLinks(entry['ids'], entry['targets']))
+
+    def _cache_put(self, job, result):
+        if not job.key:
+            return result
+        article, page_html, diagrams, links = result
+        html = str(article)
+        self._cache.put(job.key, {'html': html, 'page': page_html, 'diagrams': diagrams,
+                                  'ids': sorted(links.ids), 'targets': sorted(links.targets),
+                                  'missing': self._assets.missing_from(job.base_url)})
+        return RawHTML(html), page_html, diagrams, links
+
+    def _store(self, page, result):
+        """Keep the preprocessed article of `page` for the documents."""
+        article, page_html, diagrams, links = result
+        if self._images is not None:
+            # Applied after the cache, so that changed images get new copies
+            with self.profile.stage('images'):
+                article = RawHTML(self._images.rewrite(str(article)))
+                if page_html is not None:
+                    page_html = self._images.rewrite(page_html)
         if page.meta and 'pdf' in page.meta and not page.meta['pdf']:
             # print(page.meta)
-            return self.get_path_to_pdf(page.file.dest_path)
+            return
+        if self.config['output_mode'] != 'combined':
+            self._pages[page.file.url] = (page.title, self.get_page_pdf(page.file.dest_path), page_html)
         # Check if this index.md has pdf_chapter: false - if so, remove the chapter article
         if page.meta and 'pdf_chapter' in page.meta and not page.meta['pdf_chapter']:
             self.logger.info(f"Found pdf_chapter: false in {page.file.src_path}")
-            if page.file.src_path in self._index_to_chapter:
-                chapter_uuid, section_title = self._index_to_chapter[page.file.src_path]
-                self.logger.info(f"Removing chapter {chapter_uuid} for {page.file.src_path} (section: {section_title})")
-                if chapter_uuid in self._articles:
-                    del self._articles[chapter_uuid]
-                if chapter_uuid in self._page_order:
-                    self._page_order.remove(chapter_uuid)
-                # Also skip this section in TOC
-                self._skipped_sections.add(section_title)
+            section = self._nav.chapter_of(page.file.src_path)
+            if section is not None:
+                self.logger.info(f"Removing chapter {section.key} for {page.file.src_path} (section: {section.title})")
+                self._articles.pop(section.key, None)
+                # Also leaves the section out of the order and of the TOC
+                section.skipped = True
             else:
                 self.logger.info(f"No chapter mapping found for {page.file.src_path}")
-        self._articles[page.file.url] = article
+        if self._spill is not None:
+            self._spill.put(page.file.url, str(article))
+        else:
+            self._articles[page.file.url] = article
+        self._links.add(page.file.url, links)
+        if diagrams:
+            self._diagram_pages.append(page.file.url)
+
+    def _pdf_url(self, page):
+        """The link of the download button of `page`, or None."""
+        if page.meta and 'pdf' in page.meta and not page.meta['pdf']:
+            if self.config['output_mode'] == 'pages':
+                return None
+            return self.get_path_to_pdf(page.file.dest_path)
+        if self.config['output_mode'] != 'combined':
+            return os.path.basename(self.get_page_pdf(page.file.dest_path))
         return self.get_path_to_pdf(page.file.dest_path)
 
-    def add_head(self):
-        lines = ['<title>{}</title>'.format(self.title)]
+    def _preprocess(self, content, page, base_url, nesting_level, shift_level, separate=False):
+        """See `PagePreprocessor.preprocess`."""
+        return self._preprocessor.preprocess(content, page.file.url, base_url, nesting_level,
+                                             shift_level, separate=separate)
+
+    def add_head(self, output=None):
+        output = output or self.outputs[0]
+        head = BeautifulSoup(self._head_markup(output.title, output.author), 'html.parser')
+        self.html.head.replace_with(head)
+
+    def _head_markup(self, title, author=None):
+        lines = ['<title>{}</title>'.format(title)]
         for key, val in (
-                ("author", self.config['author'] or self.mkdconfig['site_author']),
+                ("author", author or self.mkdconfig['site_author']),
                 ("description", self.mkdconfig['site_description']),
         ):
             if val:
                 lines.append('<meta name="{}" content="{}">'.format(key, val))
-        for css in (self.design,):
-            if css:
-                css_tmpl = '<link rel="stylesheet" href="{}" type="text/css">'
-                lines.append(css_tmpl.format(urls.path2url(css)))
-        head = BeautifulSoup('<head>' + '\n'.join(lines) + '</head>', 'html.parser')
-        self.html.head.replace_with(head)
+        return '<head>' + '\n'.join(lines) + '</head>'
 
-    def add_tocs(self):
-        title = self.html.new_tag('h1', id='toc-title')
-        title.insert(0, self.config['toc_title'])
-        self._toc = self.html.new_tag('article', id='contents')
-        self._toc.insert(0, title)
-        for n in self.nav:
-            if n.is_page and n.meta and 'pdf' in n.meta \
-                    and not n.meta['pdf']:
-                continue
-            if hasattr(n, 'url') and is_external(n.url):
-                # Skip toc generation for external links
-                continue
-            h3 = self.html.new_tag('h3')
-            h3.insert(0, unescape(n.title))
-            self._toc.append(h3)
-            if n.is_page:
-                ptoc = self._gen_toc_page(n.file.url, n.toc)
-                self._toc.append(ptoc)
-            else:
-                self._gen_toc_section(n)
+    def _link_design(self, html, design=None):
+        """Link the design stylesheet from the head of an exported document.
+        WeasyPrint gets the parsed stylesheet directly, see `StyleCache`."""
+        css_tmpl = '\n<link href="{}" rel="stylesheet" type="text/css"/></head>'
+        return html.replace('</head>', css_tmpl.format(urls.path2url(design or self.design)), 1)
+
+    def _page_document(self, title, body):
+        head = self._head_markup(escape(unescape(title)))
+        return '<html>{}<body>{}</body></html>'.format(head, body)
+
+    def add_tocs(self, selected=None):
+        self._toc = RawHTML(TocBuilder(selected).build(self.config['toc_title'], self._nav.roots))
         self.html.body.append(self._toc)
 
-    def add_cover(self):
+    def add_cover(self, output=None):
+        output = output or self.outputs[0]
         a = self.html.new_tag('article', id='doc-cover')
         title = self.html.new_tag('h1', id='doc-title')
-        title.insert(0, self.title)
+        title.insert(0, output.title)
         a.insert(0, title)
-        a.append(gen_address(self.config))
+        a.append(gen_address(dict(self.config, author=output.author, company=output.company)))
         self.html.body.append(a)
 
-    def gen_articles(self):
-        self.add_cover()
-        if self.config['toc_position'] == 'pre':
-            self.add_tocs()
-        for url in self._page_order:
-            if url in self._articles:
-                self.html.body.append(self._articles[url])
-        if self.config['toc_position'] == 'post':
-            self.add_tocs()
+    def gen_articles(self, streamed=False, output=None):
+        """Assemble the combined document of `output`, the first output
+        profile by default. When `streamed` is set, the articles are left
+        out and a placeholder marks where `_stream_combined` writes them."""
+        output = output or self.outputs[0]
+        selected = output.select(self._nav)
+        self.add_cover(output)
+        if output.toc_position == 'pre':
+            with self.profile.stage('add_tocs'):
+                self.add_tocs(selected)
+        if streamed:
+            self.html.body.append(self._placeholder())
+        else:
+            for url in self._order(output):
+                if url not in self._articles:
+                    continue
+                article = self._articles[url]
+                if output.links is not None:
+                    article = RawHTML(output.links.rewrite(str(article)))
+                self.html.body.append(article)
+        if output.toc_position == 'post':
+            with self.profile.stage('add_tocs'):
+                self.add_tocs(selected)
+
+    def get_page_pdf(self, dest_path):
+        """Location of the PDF of a single page, relative to `site_dir`."""
+        return os.path.splitext(dest_path)[0] + '.pdf'
 
     def get_path_to_pdf(self, start):
-        return os.path.relpath(self.config['output_path'],
+        return os.path.relpath(self.outputs[0].path,
                                os.path.dirname(start))
-
-    def _gen_toc_section(self, section, is_skipped_section=False):
-        if section.children:  # External Links do not have children
-            # Check if this section is marked with pdf_chapter: false
-            section_is_skipped = section.title in self._skipped_sections
-            section_ul = None
-            for p in section.children:
-                if p.is_page and p.meta and 'pdf' \
-                        in p.meta and not p.meta['pdf']:
-                    continue
-                if p.is_section:
-                    # Skip section header if marked with pdf_chapter: false
-                    if p.title not in self._skipped_sections:
-                        h3 = self.html.new_tag('h3')
-                        h3.insert(0, unescape(p.title))
-                        self._toc.append(h3)
-                    self._gen_toc_section(p, p.title in self._skipped_sections)
-                    continue
-                if not hasattr(p, 'file'):
-                    # Skip external links
-                    continue
-                # Handle index.md - its TOC items go directly into section
-                if p.file.name == 'index':
-                    stoc = self._gen_toc_for_index(p.file.url, p)
-                    if stoc:
-                        self._toc.append(stoc)
-                        # Get the ul from the stoc for adding non-index pages
-                        section_ul = stoc.find('ul')
-                elif section_is_skipped:
-                    # For skipped sections (pdf_chapter: false), add TOC items directly without page title
-                    items = self._gen_toc_for_subpage(p.file.url, p)
-                    if items:
-                        if section_ul is None:
-                            section_ul = self.html.new_tag('ul')
-                            self._toc.append(section_ul)
-                        for item in items:
-                            section_ul.append(item)
-                else:
-                    # Normal sections: show page title as header with TOC items
-                    stoc = self._gen_toc_for_page(p.file.url, p)
-                    child = self.html.new_tag('div')
-                    child.append(stoc)
-                    self._toc.append(child)
-
-    def _gen_children(self, url, children):
-        ul = self.html.new_tag('ul')
-        for child in children:
-            a = self.html.new_tag('a', href=child.url)
-            a.insert(0, unescape(child.title))
-            li = self.html.new_tag('li')
-            li.append(a)
-            if child.children:
-                sub = self._gen_children(url, child.children)
-                li.append(sub)
-            ul.append(li)
-        return ul
-
-    def _gen_toc_for_page(self, url, p):
-        """Generate TOC for normal pages - shows page title as h4 header with TOC items"""
-        div = self.html.new_tag('div')
-        menu = self.html.new_tag('div')
-        h4 = self.html.new_tag('h4')
-        a = self.html.new_tag('a', href='#')
-        a.insert(0, unescape(p.title))
-        h4.append(a)
-        menu.append(h4)
-        ul = self.html.new_tag('ul')
-        if p.toc:
-            for child in p.toc.items:
-                a = self.html.new_tag('a', href=child.url)
-                a.insert(0, unescape(child.title))
-                li = self.html.new_tag('li')
-                li.append(a)
-                if child.title == p.title:
-                    li = self.html.new_tag('div')
-                if child.children:
-                    sub = self._gen_children(url, child.children)
-                    li.append(sub)
-                ul.append(li)
-            if len(p.toc.items) > 0:
-                menu.append(ul)
-        div.append(menu)
-        div = prep_combined(div, self._base_urls[url], url)
-        return div.find('div')
-
-    def _gen_toc_for_index(self, url, p):
-        """Generate TOC for index.md - returns div with h4 title and ul of TOC items"""
-        div = self.html.new_tag('div')
-        menu = self.html.new_tag('div')
-        h4 = self.html.new_tag('h4')
-        a = self.html.new_tag('a', href='#')
-        a.insert(0, unescape(p.title))
-        h4.append(a)
-        menu.append(h4)
-        ul = self.html.new_tag('ul')
-        if p.toc:
-            for child in p.toc.items:
-                # If this is the page title (h1), add its children directly to ul
-                if child.title == p.title:
-                    if child.children:
-                        for subchild in child.children:
-                            sub_a = self.html.new_tag('a', href=subchild.url)
-                            sub_a.insert(0, unescape(subchild.title))
-                            sub_li = self.html.new_tag('li')
-                            sub_li.append(sub_a)
-                            if subchild.children:
-                                sub_sub = self._gen_children(url, subchild.children)
-                                sub_li.append(sub_sub)
-                            ul.append(sub_li)
-                    continue
-                # Normal TOC item
-                a = self.html.new_tag('a', href=child.url)
-                a.insert(0, unescape(child.title))
-                li = self.html.new_tag('li')
-                li.append(a)
-                if child.children:
-                    sub = self._gen_children(url, child.children)
-                    li.append(sub)
-                ul.append(li)
-            if len(ul.contents) > 0:
-                menu.append(ul)
-        div.append(menu)
-        div = prep_combined(div, self._base_urls[url], url)
-        return div.find('div')
-
-    def _gen_toc_for_subpage(self, url, p):
-        """Generate TOC for non-index pages - returns list of li items from the page's TOC"""
-        if not p.toc or len(p.toc.items) == 0:
-            return []
-        # Build a temporary div to hold items for URL transformation
-        div = self.html.new_tag('div')
-        ul = self.html.new_tag('ul')
-        for child in p.toc.items:
-            if child.title == p.title:
-                # Skip the page title itself in the TOC
-                continue
-            li = self.html.new_tag('li')
-            a = self.html.new_tag('a', href=child.url)
-            a.insert(0, unescape(child.title))
-            li.append(a)
-            if child.children:
-                sub = self._gen_children(url, child.children)
-                li.append(sub)
-            ul.append(li)
-        div.append(ul)
-        # Transform URLs through prep_combined
-        div = prep_combined(div, self._base_urls.get(url, ''), url)
-        # Extract and return the li items
-        transformed_ul = div.find('ul')
-        if transformed_ul:
-            return list(transformed_ul.children)
-        return []
-
-    def _gen_toc_page(self, url, toc):
-        div = self.html.new_tag('div')
-        menu = self.html.new_tag('ul')
-        for item in toc.items:
-            li = self.html.new_tag('li')
-            a = self.html.new_tag('a', href=item.url)
-            a.append(unescape(item.title))
-            li.append(a)
-            menu.append(li)
-            if item.children:
-                child = self._gen_children(url, item.children)
-                menu.append(child)
-        div.append(menu)
-        div = prep_combined(div, self._base_urls[url], url)
-        return div.find('ul')
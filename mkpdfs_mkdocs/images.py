@@ -0,0 +1,168 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from html import unescape
+
+from weasyprint import urls
+
+from mkpdfs_mkdocs.preprocessor.links.util import url_to_path
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is an optional dependency
+    Image = None
+
+log = logging.getLogger('mkdocs.mkpdfs')
+
+IMG_RE = re.compile(r'<img\b[^>]*>')
+SRC_RE = re.compile(r'(\ssrc=")([^"]*)(")')
+WIDTH_RE = re.compile(r'\swidth="(\d+)(?:px)?"')
+
+FORMATS = {'.png': 'PNG', '.jpg': 'JPEG', '.jpeg': 'JPEG'}
+
+# Width of the text column of the default design (A4 less the margins), used
+# for the images without a width attribute.
+DISPLAY_WIDTH_MM = 170
+CSS_PX_PER_INCH = 96
+
+
+def optimize_image(source, target, max_width, quality, colors):
+    """Downsample `source` to at most `max_width` pixels and recompress it
+    to `target`. Runs in a worker process."""
+    tmp = '{}.{}.tmp'.format(target, os.getpid())
+    try:
+        with Image.open(source) as img:
+            resized = img.width > max_width
+            if resized:
+                height = max(1, round(img.height * max_width / img.width))
+                img = img.resize((max_width, height), Image.LANCZOS)
+            image_format = FORMATS[os.path.splitext(source)[1].lower()]
+            if image_format == 'JPEG':
+                if img.mode not in ('RGB', 'L'):
+                    img = img.convert('RGB')
+                img.save(tmp, 'JPEG', quality=quality, optimize=True, progressive=True)
+            else:
+                if colors and img.mode not in ('P', '1', 'L'):
+                    if img.mode not in ('RGB', 'RGBA'):
+                        img = img.convert('RGBA')
+                    img = img.quantize(colors, method=Image.FASTOCTREE)
+                img.save(tmp, 'PNG', optimize=True)
+        if not resized and os.path.getsize(tmp) >= os.path.getsize(source):
+            # Recompressing did not help, keep the original
+            shutil.copyfile(source, tmp)
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+class ImageStage(object):
+    """Embeds downsampled and recompressed copies of the images in the PDF.
+
+    The sources of the PNG and JPEG images of an article are rewritten to
+    copies in `directory`, sized for `dpi` at their displayed width and named
+    after the hash of the original and of the settings. The copies missing
+    from the directory are produced by `render`, in worker processes.
+    """
+
+    def __init__(self, directory, dpi=150, quality=85, colors=256, workers=None):
+        self.directory = directory
+        self.dpi = dpi
+        self.quality = quality
+        self.colors = colors
+        self.workers = workers
+        self._digests = {}  # Path -> digest, or None if missing
+        self._jobs = {}  # Copy path -> (original path, max width)
+
+    def signature(self):
+        return self.dpi, self.quality, self.colors
+
+    def _digest(self, path):
+        """Hash of the file at `path`, computed once per build."""
+        if path not in self._digests:
+            digest = hashlib.sha256()
+            try:
+                with open(path, 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 20), b''):
+                        digest.update(block)
+                self._digests[path] = digest.hexdigest()
+            except OSError:
+                self._digests[path] = None
+        return self._digests[path]
+
+    def max_width(self, width=None):
+        """Width in pixels of an image displayed `width` CSS pixels wide, or
+        as wide as the text column."""
+        inches = DISPLAY_WIDTH_MM / 25.4
+        if width:
+            inches = min(inches, width / CSS_PX_PER_INCH)
+        return max(1, round(inches * self.dpi))
+
+    def add(self, source, max_width):
+        """Queue a copy of `source` and return its path, or None if the
+        file cannot be read."""
+        digest = self._digest(source)
+        if digest is None:
+            return None
+        key = hashlib.sha256('\0'.join(str(part) for part in (
+            digest, max_width) + self.signature()).encode('utf-8')).hexdigest()
+        target = os.path.join(self.directory, key + os.path.splitext(source)[1].lower())
+        self._jobs.setdefault(target, (source, max_width))
+        return target
+
+    def rewrite(self, html):
+        """Point the images of the `html` markup to their processed copies."""
+        def replace_img(match):
+            tag = match.group(0)
+            src = SRC_RE.search(tag)
+            if src is None:
+                return tag
+            path = url_to_path(unescape(src.group(2)))
+            if path is None or os.path.splitext(path)[1].lower() not in FORMATS:
+                return tag
+            width = WIDTH_RE.search(tag)
+            target = self.add(path, self.max_width(int(width.group(1)) if width else None))
+            if target is None:
+                return tag
+            return tag[:src.start(2)] + urls.path2url(target) + tag[src.end(2):]
+
+        return IMG_RE.sub(replace_img, html)
+
+    def render(self):
+        """Produce the copies missing from the directory. Returns the number
+        of images processed and the bytes saved."""
+        pending = [(target, source, max_width)
+                   for target, (source, max_width) in self._jobs.items()
+                   if not os.path.exists(target)]
+        if not pending:
+            return 0, 0
+        os.makedirs(self.directory, exist_ok=True)
+        if len(pending) <= 1 or self.workers == 1:
+            saved = sum(self._done(target, source, optimize_image, source, target, max_width,
+                                   self.quality, self.colors)
+                        for target, source, max_width in pending)
+            return len(pending), saved
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+            futures = [(target, source, pool.submit(optimize_image, source, target, max_width,
+                                                    self.quality, self.colors))
+                       for target, source, max_width in pending]
+            saved = sum(self._done(target, source, future.result)
+                        for target, source, future in futures)
+        return len(pending), saved
+
+    @staticmethod
+    def _done(target, source, func, *args):
+        """Bytes saved by the copy of `source` made by `func(*args)`. When it
+        fails, `source` is copied as it is."""
+        try:
+            func(*args)
+        except (OSError, ValueError) as e:
+            log.warning('Unable to process the image {}: {}'.format(source, e))
+            shutil.copyfile(source, target)
+            return 0
+        return os.path.getsize(source) - os.path.getsize(target)
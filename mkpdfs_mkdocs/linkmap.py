@@ -0,0 +1,117 @@
+import os
+import re
+from collections import namedtuple
+from html import escape, unescape
+
+from mkpdfs_mkdocs.partial import page_path
+
+# Internal links in serialized articles, see `transform_href`
+HREF_RE = re.compile(r'''\shref=(["'])#([^"']*)\1''')
+
+# What the links that do not match an id of the combined document point to
+MISSING_ANCHOR = 'missing anchor'
+MISSING_PAGE = 'missing page'
+AMBIGUOUS_PAGE = 'several pages'
+OTHER_URL = 'other page URL'
+
+# `fix` is the target to link to instead, or None
+BrokenLink = namedtuple('BrokenLink', ('page', 'target', 'reason', 'fix'))
+
+
+class PageLinks(object):
+    """The ids of an article and the targets of its internal links, collected
+    while it is rewritten for the combined document."""
+
+    __slots__ = ('ids', 'targets')
+
+    def __init__(self, ids=(), targets=()):
+        self.ids = set(ids)
+        self.targets = set(targets)
+
+
+def page_stem(path):
+    """The path of a page with the differences links may have removed: the
+    trailing slash of directory URLs, the `.html` or `.md` suffix and the
+    `index` file name."""
+    path = os.path.normpath(path or '.')
+    root, ext = os.path.splitext(path)
+    if ext in ('.html', '.md'):
+        path = root
+    if os.path.basename(path) == 'index':
+        path = os.path.dirname(path) or '.'
+    return path
+
+
+class LinkMap(object):
+    """The ids and internal links of all the articles of the build.
+
+    The links of each page are checked against the ids of the combined
+    document with dictionary lookups once the pages are preprocessed, so
+    that broken links are reported before the layout. A link whose page is
+    found under another spelling is fixed to it, to the top of the page
+    when its anchor does not exist.
+    """
+
+    def __init__(self):
+        self._pages = {}  # Page URL -> PageLinks
+
+    def __len__(self):
+        return len(self._pages)
+
+    def add(self, url, links):
+        self._pages[url] = links
+
+    def broken(self, pages=None):
+        """The `BrokenLink` of the articles of `pages`, all of them by
+        default."""
+        ids = set()
+        stems = {}  # Page stem -> URLs of the pages
+        for url, links in self._pages.items():
+            ids.update(links.ids)
+            stems.setdefault(page_stem(url), []).append(url)
+        broken = []
+        for url in pages if pages is not None else self._pages:
+            links = self._pages.get(url)
+            if links is None:
+                continue
+            for target in sorted(links.targets - ids):
+                page, _, anchor = target.partition(':')
+                candidates = stems.get(page_stem(page), ())
+                if len(candidates) > 1:
+                    broken.append(BrokenLink(url, target, AMBIGUOUS_PAGE, None))
+                elif not candidates:
+                    broken.append(BrokenLink(url, target, MISSING_PAGE, None))
+                elif '{}:{}'.format(candidates[0], anchor) in ids:
+                    broken.append(BrokenLink(url, target, OTHER_URL, '{}:{}'.format(candidates[0], anchor)))
+                else:
+                    broken.append(BrokenLink(url, target, MISSING_ANCHOR, '{}:'.format(candidates[0])))
+        return broken
+
+    def outside(self, selected):
+        """The `(page, target)` of the links of the pages of `selected` to
+        the pages it leaves out."""
+        pages = {page_path(url): url for url in self._pages}
+        links = []
+        for url, page_links in self._pages.items():
+            if url not in selected:
+                continue
+            for target in sorted(page_links.targets):
+                page = pages.get(page_path(target.partition(':')[0]))
+                if page is not None and page not in selected:
+                    links.append((url, target))
+        return links
+
+
+def rewrite_links(markup, fixes):
+    """Point the internal links of `markup` to the targets of `fixes`, or
+    remove their `href` when it maps them to None."""
+
+    def replace(match):
+        target = unescape(match.group(2))
+        if target not in fixes:
+            return match.group(0)
+        if fixes[target] is None:
+            return ''
+        return ' href={0}#{1}{0}'.format(match.group(1), escape(fixes[target]))
+
+    return HREF_RE.sub(replace, markup)
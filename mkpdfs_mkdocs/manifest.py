@@ -0,0 +1,167 @@
+import json
+import os
+import shutil
+from types import SimpleNamespace
+
+# Saved in `site_dir`
+DIRECTORY = 'mkpdfs-manifest'
+MANIFEST = 'manifest.json'
+VERSION = 1
+# Page metadata read by the PDF generation
+META_KEYS = ('pdf', 'pdf_chapter', 'pdf_partial', 'tags')
+# MkDocs settings read by the PDF generation
+MKDOCS_KEYS = ('site_name', 'site_url', 'site_author', 'site_description', 'copyright')
+
+
+class SavedFile(object):
+    def __init__(self, src_path, dest_path, url, name):
+        self.src_path = src_path
+        self.dest_path = dest_path
+        self.url = url
+        self.name = name
+
+
+class SavedAnchor(object):
+    """An entry of the table of contents of a saved page."""
+
+    def __init__(self, title, url, children=()):
+        self.title = title
+        self.url = url
+        self.children = [SavedAnchor(**child) for child in children]
+
+
+class SavedToc(object):
+    def __init__(self, items):
+        self.items = [SavedAnchor(**item) for item in items]
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class SavedItem(object):
+    """A navigation entry read back from a manifest, with the attributes of
+    the MkDocs nav items the PDF generation uses."""
+
+    def __init__(self, data):
+        self.is_page = data['kind'] == 'page'
+        self.is_section = data['kind'] == 'section'
+        self.is_link = data['kind'] == 'link'
+        self.title = data['title']
+        self.url = data.get('url')
+        self.file = SavedFile(**data['file']) if self.is_page else None
+        self.meta = data.get('meta') or {}
+        self.toc = SavedToc(data.get('toc') or ())
+        self.children = [SavedItem(child) for child in data['children']] if self.is_section else None
+
+
+def _dump_anchors(items):
+    return [{'title': item.title, 'url': item.url, 'children': _dump_anchors(item.children)}
+            for item in items]
+
+
+def dump_nav(items):
+    """The MkDocs nav `items` as JSON data."""
+    entries = []
+    for item in items:
+        if item.is_page:
+            meta = item.meta or {}
+            entries.append({
+                'kind': 'page', 'title': item.title, 'url': item.url,
+                'file': {'src_path': item.file.src_path, 'dest_path': item.file.dest_path,
+                         'url': item.file.url, 'name': item.file.name},
+                'meta': {key: meta[key] for key in META_KEYS if key in meta},
+                'toc': _dump_anchors(item.toc or ()),
+            })
+        elif item.is_section:
+            entries.append({'kind': 'section', 'title': item.title,
+                            'children': dump_nav(item.children)})
+        else:
+            entries.append({'kind': 'link', 'title': item.title, 'url': item.url})
+    return entries
+
+
+class BuildManifest(object):
+    """What the PDF generation needs from a build: the plugin options, the
+    MkDocs settings it reads, the navigation with the page titles, tables of
+    contents and metadata, and the preprocessed articles.
+
+    Saved to the `mkpdfs-manifest` directory of `site_dir` with one file
+    per article, for the `mkpdfs` command to render the PDFs again without
+    building the site. The articles link their images with absolute URLs,
+    so the site directory must still hold them.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.data = None
+        self._files = 0
+
+    def save(self, options, mkdocs, nav, skipped, articles, pages):
+        """Write the manifest. `articles` yields `(key, markup)` and `pages`
+        `(url, title, pdf, markup)` for the per-page PDFs."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory)
+        data = {
+            'version': VERSION,
+            'options': options,
+            'mkdocs': {key: mkdocs.get(key) for key in MKDOCS_KEYS},
+            'theme': mkdocs['theme'].name,
+            'nav': dump_nav(nav),
+            'skipped': list(skipped),
+            'articles': [],
+            'pages': [],
+        }
+        for key, markup in articles:
+            data['articles'].append([key, self._write(markup)])
+        for url, title, pdf, markup in pages:
+            data['pages'].append([url, title, pdf, self._write(markup)])
+        path = os.path.join(self.directory, MANIFEST)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'w', encoding='utf-8') as f:
+            # Metadata values parsed from YAML may be dates
+            json.dump(data, f, default=str)
+        os.replace(tmp, path)
+
+    def _write(self, markup):
+        name = '{}.html'.format(self._files)
+        self._files += 1
+        with open(os.path.join(self.directory, name), 'w', encoding='utf-8') as f:
+            f.write(markup)
+        return name
+
+    def _read(self, name):
+        with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+            return f.read()
+
+    def load(self):
+        """Read the manifest. Returns None if there is none, or it was saved
+        by another version of the plugin."""
+        try:
+            with open(os.path.join(self.directory, MANIFEST), encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != VERSION:
+            return None
+        self.data = data
+        return data
+
+    def mkdocs_config(self, site_dir):
+        """The MkDocs settings of the build, writing to `site_dir`."""
+        config = dict(self.data['mkdocs'], site_dir=site_dir)
+        config['theme'] = SimpleNamespace(name=self.data['theme'])
+        return config
+
+    def nav(self):
+        return [SavedItem(entry) for entry in self.data['nav']]
+
+    def articles(self):
+        for key, name in self.data['articles']:
+            yield key, self._read(name)
+
+    def pages(self):
+        for url, title, pdf, name in self.data['pages']:
+            yield url, title, pdf, self._read(name)
@@ -5,8 +5,10 @@ from mkdocs.config import config_options
 from mkdocs.plugins import BasePlugin
 
 from weasyprint import HTML, urls, CSS
+from mkpdfs_mkdocs.background import BackgroundRenderer
 from mkpdfs_mkdocs.generator import Generator
-from mkpdfs_mkdocs.utils import modify_html, modify_html_material
+from mkpdfs_mkdocs.styles import StyleCache
+from mkpdfs_mkdocs.themes import get_theme
 
 log = logging.getLogger(__name__)
 
@@ -20,32 +22,94 @@ class Mkpdfs(BasePlugin):
         ('author', config_options.Type(str, default=None)),
         ('toc_position', config_options.Type(str, default="pre")),
         ('pdf_links', config_options.Type(bool, default=True)),
-        ('output_path', config_options.Type(str, default="pdf/combined.pdf")),
+        ('output_path', config_options.Type((str, list), default="pdf/combined.pdf")),
+        ('partial', config_options.Type((str, list), default=None)),
+        ('partial_path', config_options.Type(str, default=os.path.join('pdf', 'partial.pdf'))),
+        ('broken_links', config_options.Choice(('warn', 'rewrite', 'strip', 'fail'), default='warn')),
         ('export_combinedHTML', config_options.Type(bool, default=False)),
         ('heading_shift', config_options.Type(bool, default=False)),
+        ('html_parser', config_options.Choice(('html.parser', 'lxml', 'html5lib'), default='html.parser')),
+        ('lxml_native', config_options.Type(bool, default=False)),
+        ('cache', config_options.Type(bool, default=False)),
+        ('cache_dir', config_options.Type(str, default=os.path.join('.cache', 'mkpdfs'))),
+        ('cache_max_size', config_options.Type(int, default=512)),  # MiB
+        ('cache_max_age', config_options.Type(int, default=30)),  # days
+        ('output_mode', config_options.Choice(('combined', 'pages', 'both'), default='combined')),
+        ('section_pdfs', config_options.Type(bool, default=False)),
+        ('workers', config_options.Type(int, default=0)),  # 0: one per core
+        ('parallel_preprocess', config_options.Type(bool, default=False)),
+        ('chunked_layout', config_options.Type(bool, default=False)),
+        ('low_memory', config_options.Type(bool, default=False)),
+        ('offline', config_options.Type(bool, default=False)),
+        ('remote_images', config_options.Type(bool, default=True)),
+        ('remote_cache_dir', config_options.Type(str, default=os.path.join('.cache', 'mkpdfs', 'remote'))),
+        ('remote_cache_ttl', config_options.Type(int, default=24)),  # hours
+        ('diagram_renderers', config_options.Type(dict, default={})),  # Language -> command
+        ('diagram_format', config_options.Choice(('png', 'svg'), default='png')),
+        ('optimize_images', config_options.Type(bool, default=False)),
+        ('image_dpi', config_options.Type(int, default=150)),
+        ('jpeg_quality', config_options.Type(int, default=85)),
+        ('png_colors', config_options.Type(int, default=256)),  # 0: no quantization
+        ('image_cache_dir', config_options.Type(str, default=os.path.join('.cache', 'mkpdfs', 'images'))),
+        ('diagram_cache_dir', config_options.Type(str, default=os.path.join('.cache', 'mkpdfs', 'diagrams'))),
+        ('prune_css', config_options.Type(bool, default=False)),
+        ('css_cache_dir', config_options.Type(str, default=os.path.join('.cache', 'mkpdfs', 'css'))),
+        ('render_cache', config_options.Type(bool, default=False)),
+        ('render_cache_dir', config_options.Type(str, default=os.path.join('.cache', 'mkpdfs', 'renders'))),
+        ('serve_mode', config_options.Choice(('blocking', 'background'), default='blocking')),
+        ('serve_delay', config_options.Type(int, default=2)),  # seconds
+        ('manifest', config_options.Type(bool, default=False)),
+        ('detached', config_options.Type(bool, default=False)),
+        ('detached_dir', config_options.Type(str, default=os.path.join('.cache', 'mkpdfs', 'detached'))),
+        ('detached_wait', config_options.Type(bool, default=False)),
+        ('profile', config_options.Type(bool, default=False)),
+        ('profile_render', config_options.Type(bool, default=False)),
+        ('render_profile', config_options.Choice(('default', 'draft', 'release'), default='default')),
     )
 
     def __init__(self):
-        self.generator = Generator()
+        self._styles = StyleCache()
+        self.generator = Generator(styles=self._styles)
         self._skip_pdf = True if os.environ.get("SKIP_PDF") else False
         self._logger = logging.getLogger('mkdocs.mkpdfs')
-        self.theme = ''
+        self.theme = None
+        self._serving = False
+        self._renderer = None
+
+    def on_startup(self, command, dirty, **kwargs):
+        # Defining this hook keeps the plugin instance alive across the
+        # rebuilds of `mkdocs serve`, which the background renderer needs.
+        self._serving = command == 'serve'
+
+    def on_shutdown(self, **kwargs):
+        if self._renderer is not None:
+            self._renderer.shutdown()
+            self._renderer = None
 
     def on_serve(self, server, config, **kwargs):
         if self._skip_pdf:
             self._logger.info("PDF generation will be skipped: presence of env var SKIP_PDF=1")
-        # TODO: Implement watcher when the user is performing design
-        #     print(server.watcher.__dict__)
-        #     # builder = build(config, True, False)
-        #     # server.watch(os.path.dirname(self.design), builder)
+        elif self.config['design']:
+            # Rebuild the PDF when the user is working on the design
+            server.watch(self.generator.design)
         return server
 
     def on_config(self, config, **kwargs):
         if self._skip_pdf:
             return config
+        # The instance is reused by each rebuild of `mkdocs serve`
+        self.generator = Generator(styles=self._styles)
+        if self._serving and self.config['serve_mode'] == 'background':
+            if self._renderer is None:
+                self._renderer = BackgroundRenderer(delay=self.config['serve_delay'])
+            # Unchanged pages are reused from the article cache
+            self.config['cache'] = True
+        if self._serving:
+            # The PDF is rendered by the serve process itself
+            self.config['detached'] = False
         self.config['output_path'] = os.path.join("pdf", "combined.pdf") if not self.config['output_path'] else self.config['output_path']
         self.generator.set_config(self.config, config)
-        self.theme = config['theme'].name
+        self.theme = get_theme(config['theme'].name)
         return config
 
     def on_nav(self, nav, config, **kwargs):
@@ -67,15 +131,16 @@ class Mkpdfs(BasePlugin):
         os.makedirs(path, exist_ok=True)
         filename = os.path.splitext(os.path.basename(src_path))[0]
         base_url = urls.path2url(os.path.join(path, filename))
-        pdf_url = self.generator.add_article(output_content, page, base_url)
+        profile = self.generator.profile
+        with profile.stage('add_article', page=page.file.url):
+            pdf_url = self.generator.add_article(output_content, page, base_url)
         if self.config['pdf_links'] and pdf_url:
-            if self.theme == 'material':
-                output_content = modify_html_material(output_content, pdf_url)
-            else:
-                output_content = modify_html(output_content, pdf_url)
+            # Spliced in, so that the page is not parsed a second time
+            with profile.stage('add_button'):
+                output_content = self.theme.add_button(output_content, pdf_url)
         return output_content
 
     def on_post_build(self, config):
         if self._skip_pdf:
             return
-        self.generator.write()
+        self.generator.write(renderer=self._renderer)
@@ -0,0 +1,160 @@
+from mkpdfs_mkdocs.utils import slugify
+
+PAGE = 'page'
+SECTION = 'section'
+LINK = 'link'
+
+
+class NavNode(object):
+    """An entry of the navigation: a page, a section or a link.
+
+    `key` identifies the entry in the combined document: the URL of a page,
+    or the id of the chapter article of a section, derived from the titles
+    of the sections down to it (`section:guide/admin`). `depth` is the
+    number of sections above the entry.
+    """
+
+    __slots__ = ('item', 'kind', 'key', 'url', 'parent', 'children', 'depth', 'ordered',
+                 'skipped')
+
+    def __init__(self, item, kind, key, parent=None):
+        self.item = item
+        self.kind = kind
+        self.key = key
+        self.url = getattr(item, 'url', None)
+        self.parent = parent
+        self.children = []
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self.ordered = False  # Part of the combined document
+        self.skipped = False  # Section whose chapter page is left out (`pdf_chapter: false`)
+
+    @property
+    def title(self):
+        # Known once the page has been read
+        return self.item.title
+
+    @property
+    def is_page(self):
+        return self.kind == PAGE
+
+    @property
+    def is_section(self):
+        return self.kind == SECTION
+
+    def section_paths(self):
+        """"Guide/Admin" paths of the sections above this entry, innermost
+        last."""
+        titles = []
+        parent = self.parent
+        while parent is not None:
+            titles.insert(0, parent.title)
+            parent = parent.parent
+        return ['/'.join(titles[:end]) for end in range(1, len(titles) + 1)]
+
+    def pages(self):
+        """URLs of the pages below this entry."""
+        urls = []
+        for child in self.children:
+            if child.is_page:
+                urls.append(child.key)
+            elif child.is_section:
+                urls.extend(child.pages())
+        return urls
+
+    def index_page(self):
+        """The `index` page of a section, or None."""
+        for child in self.children:
+            if child.is_page and child.item.file.name == 'index':
+                return child
+        return None
+
+
+class NavIndex(object):
+    """The navigation of the site, indexed once when it is built.
+
+    Holds the order of the pages and section chapters in the combined
+    document, and finds entries by page URL, source path or key.
+    """
+
+    def __init__(self, nav=()):
+        self.roots = []
+        self._order = []
+        self._by_key = {}
+        self._by_src = {}
+        for item in nav:
+            self.roots.append(self._add(item, None))
+
+    def _add(self, item, parent):
+        if item.is_page:
+            node = NavNode(item, PAGE, item.file.url, parent)
+            self._by_src[item.file.src_path] = node
+            excluded = item.meta and 'pdf' in item.meta and not item.meta['pdf']
+        elif item.is_section:
+            node = NavNode(item, SECTION, self._section_key(item, parent), parent)
+            excluded = not item.children
+        else:
+            node = NavNode(item, LINK, None, parent)
+            excluded = True
+        if not excluded and (parent is None or parent.ordered):
+            node.ordered = True
+            self._order.append(node)
+        if node.key is not None:
+            self._by_key[node.key] = node
+        for child in item.children or ():
+            node.children.append(self._add(child, node))
+        return node
+
+    def _section_key(self, item, parent):
+        name = slugify(item.title or '') or 'section'
+        if parent is not None:
+            name = '{}/{}'.format(parent.key[len('section:'):], name)
+        key = 'section:' + name
+        count = 1
+        while key in self._by_key:
+            # Sections with the same title
+            count += 1
+            key = 'section:{}-{}'.format(name, count)
+        return key
+
+    def nodes(self):
+        """All the entries, depth first."""
+        stack = list(reversed(self.roots))
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    def get(self, key):
+        return self._by_key.get(key)
+
+    def page(self, src_path):
+        """The page built from `src_path`, or None."""
+        return self._by_src.get(src_path)
+
+    def chapter_of(self, src_path):
+        """The section having `src_path` as its index page, or None."""
+        node = self._by_src.get(src_path)
+        section = node.parent if node is not None else None
+        if section is not None and section.ordered and section.index_page() is node:
+            return section
+        return None
+
+    def nesting(self, url):
+        node = self._by_key.get(url)
+        return node.depth if node is not None else 0
+
+    def order(self):
+        """Keys of the pages and chapters of the combined document, in order."""
+        return [node.key for node in self._order if not node.skipped]
+
+    def sections(self):
+        """The top-level sections."""
+        return [node for node in self.roots if node.is_section]
+
+    def is_top_level(self, key):
+        node = self._by_key.get(key)
+        return node is not None and node.parent is None
+
+    def chapters(self):
+        """The ordered sections, which get a chapter article."""
+        return [node for node in self._order if node.is_section]
@@ -0,0 +1,89 @@
+import os
+import sys
+
+# Keys of an output profile, other than `path`
+OPTIONS = ('sections', 'tags', 'toc_position', 'design', 'title', 'author', 'company')
+
+
+class OutputProfile(object):
+    """One combined PDF generated from the articles of the build.
+
+    `sections` ("Guide/Admin" paths of nav section titles) and `tags` (found
+    in the `tags` meta of the pages) select the pages it contains, as well
+    as `keys` of pages, all of them when none is given. The other settings
+    default to the plugin options. The `links` of a partial render rewrite
+    the links to the pages it leaves out, see `mkpdfs_mkdocs.partial`.
+    """
+
+    def __init__(self, path, sections=(), tags=(), toc_position='pre', design=None,
+                 title=None, author=None, company=None, keys=()):
+        self.path = path
+        self.sections = list(sections)
+        self.tags = set(tags)
+        self.keys = set(keys)
+        self.toc_position = toc_position
+        self.design = design
+        self.title = title
+        self.author = author
+        self.company = company
+        self.links = None
+
+    def select(self, nav):
+        """Keys of the nav entries of this output, or None for all of them."""
+        if not self.sections and not self.tags and not self.keys:
+            return None
+        selected = set()
+        for node in nav.nodes():
+            if not node.is_page:
+                continue
+            tags = (node.item.meta or {}).get('tags') or ()
+            if node.key in self.keys or self.tags.intersection(tags) or any(
+                    path in self.sections for path in node.section_paths()):
+                selected.add(node.key)
+                parent = node.parent
+                while parent is not None:
+                    # The chapters above a selected page are kept
+                    selected.add(parent.key)
+                    parent = parent.parent
+        return selected
+
+
+def names(value):
+    if not value:
+        return ()
+    return [value] if isinstance(value, str) else value
+
+
+def parse_outputs(value, config, design, title):
+    """The output profiles of the `output_path` option: a path, or a list of
+    paths and of mappings with a `path` and any of the `OPTIONS`."""
+    entries = value if isinstance(value, list) else [value]
+    if not entries:
+        sys.exit('output_path must list at least one output.')
+    outputs = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {'path': entry}
+        if not isinstance(entry, dict) or not isinstance(entry.get('path'), str):
+            sys.exit('Each output of output_path needs a path: {!r}'.format(entry))
+        unknown = set(entry) - set(OPTIONS) - {'path'}
+        if unknown:
+            sys.exit('Unknown output_path setting(s): {}'.format(', '.join(sorted(unknown))))
+        css_file = design
+        if entry.get('design'):
+            css_file = os.path.join(os.getcwd(), entry['design'])
+            if not os.path.isfile(css_file):
+                sys.exit('The file {} specified for design has not been found.'.format(css_file))
+        outputs.append(OutputProfile(
+            entry['path'],
+            sections=names(entry.get('sections')),
+            tags=names(entry.get('tags')),
+            toc_position=entry.get('toc_position', config['toc_position']),
+            design=css_file,
+            title=entry.get('title', title),
+            author=entry.get('author', config['author']),
+            company=entry.get('company', config['company'])))
+    paths = [output.path for output in outputs]
+    if len(set(paths)) != len(paths):
+        sys.exit('The outputs of output_path must have different paths.')
+    return outputs
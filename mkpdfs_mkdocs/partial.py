@@ -0,0 +1,68 @@
+import os
+import re
+from html import escape, unescape
+from urllib.parse import urljoin
+
+# Overrides the `partial` option
+ENV_VAR = 'MKPDFS_PARTIAL'
+
+LINK_RE = re.compile(r'<a\s[^>]*>')
+# Links between the articles of the combined document, see `transform_href`
+HREF_RE = re.compile(r'''(\shref=)(["'])#([^"':]*):([^"']*)\2''')
+CLASS_RE = re.compile(r'''\sclass=(["'])''')
+
+
+def page_path(url):
+    """The path of a page URL as links to it are normalized: without the
+    trailing slash of directory URLs."""
+    return os.path.normpath(url or '.')
+
+
+class PartialLinks(object):
+    """Rewrites the links of a partial document to the pages it leaves out.
+
+    The links point to the page on the site when `site_url` is set, and
+    else to the anchor in the full PDF at `full_pdf`, relative to the
+    partial PDF at `partial_pdf`, whether or not it has been rendered yet.
+    They are styled as external links. Without a full PDF either, only the
+    text of the links is left, still styled.
+    """
+
+    def __init__(self, pages, selected, full_pdf, partial_pdf, site_url=None):
+        self.pages = {page_path(url): url for url in pages}
+        self.selected = selected
+        self.full_pdf = None
+        if full_pdf is not None:
+            self.full_pdf = os.path.relpath(full_pdf, os.path.dirname(partial_pdf)).replace(os.sep, '/')
+        self.site_url = site_url
+        self.rewritten = 0
+        self.unlinked = 0
+
+    def rewrite(self, markup):
+        return LINK_RE.sub(self._link, markup)
+
+    def _link(self, match):
+        tag = match.group(0)
+        href = HREF_RE.search(tag)
+        if href is None:
+            return tag
+        target, anchor = unescape(href.group(3)), unescape(href.group(4))
+        url = self.pages.get(page_path(target))
+        if url is None or url in self.selected:
+            # In the document, or not a page of the site
+            return tag
+        location = None
+        if self.site_url:
+            location = urljoin(self.site_url, url) + ('#' + anchor if anchor else '')
+        elif self.full_pdf:
+            location = '{}#{}:{}'.format(self.full_pdf, url, anchor)
+        if location is None:
+            self.unlinked += 1
+            tag = tag[:href.start()] + tag[href.end():]
+        else:
+            self.rewritten += 1
+            tag = '{}{}"{}"{}'.format(tag[:href.start()], href.group(1), escape(location),
+                                      tag[href.end():])
+        if CLASS_RE.search(tag):
+            return CLASS_RE.sub(r' class=\1external-link ', tag, count=1)
+        return tag[:2] + ' class="external-link"' + tag[2:]
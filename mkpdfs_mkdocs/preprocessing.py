@@ -0,0 +1,190 @@
+import copy
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from bs4 import BeautifulSoup
+
+from mkpdfs_mkdocs.linkmap import PageLinks
+from mkpdfs_mkdocs.preprocessor import get_separate as prep_separate
+from mkpdfs_mkdocs.preprocessor import remove_header_links, remove_material_header_icons
+from mkpdfs_mkdocs.preprocessor import rewrite_article
+from mkpdfs_mkdocs.preprocessor import lxml_native
+from mkpdfs_mkdocs.profiling import BuildProfile
+from mkpdfs_mkdocs.utils import RawHTML
+
+NO_PROFILE = BuildProfile()
+
+# Pages sent to a worker at once
+CHUNK_SIZE = 8
+
+
+class PagePreprocessor(object):
+    """Turns the HTML of a page into the article of the combined document.
+
+    It only reads the settings of the build, the `AssetIndex` and the
+    `DiagramStage`, so a copy of it can preprocess pages in another
+    process. The images it finds missing or remote and the diagrams it
+    queues are then recorded in the copies, see `preprocess_pages`.
+    """
+
+    def __init__(self, parser, lxml_native=False, material=False, diagrams=None, assets=None,
+                 profile=None):
+        self.parser = parser
+        self.lxml_native = lxml_native
+        self.material = material
+        self.diagrams = diagrams
+        self.assets = assets
+        self.profile = profile or NO_PROFILE
+        self.parse_stats = {}  # Parser backend -> [pages, seconds]
+
+    def __getstate__(self):
+        state = dict(self.__dict__, profile=NO_PROFILE, parse_stats={})
+        # Recorded by the parent process from the results
+        state['diagrams'] = copy.copy(self.diagrams)
+        state['diagrams']._jobs = {}
+        state['assets'] = copy.copy(self.assets)
+        state['assets'].missing, state['assets'].remote = {}, set()
+        return state
+
+    def preprocess(self, content, rel_url, base_url, nesting_level, shift_level, separate=False):
+        """Parse a page and return a `(combined, separate, diagrams, links)`
+        tuple: its article rewritten for the combined PDF, when `separate` is
+        set the markup of the article prepared for its own PDF, the `(kind,
+        source)` of the diagrams marked for their images and the `PageLinks`
+        of the article.
+
+        Returns None if the theme does not expose the page content.
+        """
+        material = self.material
+        links = PageLinks()
+        # Diagram blocks are marked on BeautifulSoup trees only
+        if self.lxml_native and not self.diagrams.mentions(content):
+            start = time.perf_counter()
+            with self.profile.stage('parse'):
+                doc = lxml_native.parse_document(content)
+            self._record_parse('lxml (native)', time.perf_counter() - start)
+            article = lxml_native.extract_article(doc)
+            if article is None:
+                return None
+            page_html = None
+            with self.profile.stage('rewrite'):
+                if separate:
+                    page_html = lxml_native.serialize(
+                        lxml_native.separate_article(copy.deepcopy(article), base_url, material,
+                                                     assets=self.assets))
+                article = lxml_native.rewrite_article(article, base_url, rel_url,
+                                                      nesting_level=nesting_level,
+                                                      heading_shift=shift_level,
+                                                      material=material,
+                                                      assets=self.assets,
+                                                      links=links)
+                article = RawHTML(lxml_native.serialize(article))
+            return article, page_html, [], links
+
+        start = time.perf_counter()
+        with self.profile.stage('parse'):
+            soup = BeautifulSoup(content, self.parser)
+        self._record_parse(self.parser, time.perf_counter() - start)
+        article = soup.find('article')
+        if not article:
+            article = soup.new_tag('article')
+            eld = soup.find('div', **{'role': 'main'})
+            article.append(eld)
+            article.div['class'] = article.div['role'] = None
+
+        if not article:
+            return None
+        with self.profile.stage('rewrite'):
+            # Mark diagram blocks with their images, rendered before the layout
+            diagrams = self.diagrams.mark_blocks(article) if self.diagrams.mentions(content) else []
+
+            page_html = None
+            if separate:
+                page_article = copy.copy(article)
+                if material:
+                    page_article = remove_material_header_icons(page_article)
+                page_article = remove_header_links(prep_separate(page_article, base_url, self.assets))
+                page_html = str(page_article)
+            article = rewrite_article(article, base_url, rel_url,
+                                      nesting_level=nesting_level,
+                                      heading_shift=shift_level,
+                                      material=material,
+                                      assets=self.assets,
+                                      links=links)
+        return article, page_html, diagrams, links
+
+    def _record_parse(self, backend, seconds):
+        stats = self.parse_stats.setdefault(backend, [0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+
+
+_preprocessor = None  # Of the worker process
+
+
+def _init(preprocessor):
+    global _preprocessor
+    _preprocessor = preprocessor
+
+
+def _run(job):
+    """Preprocess a page in a worker process. Returns the serialized
+    result, with what the page recorded in the `AssetIndex` and its parse
+    time, or None."""
+    assets = _preprocessor.assets
+    assets.missing, assets.remote = {}, set()
+    _preprocessor.parse_stats = {}
+    result = _preprocessor.preprocess(*job)
+    if result is None:
+        return None
+    article, page_html, diagrams, links = result
+    return (str(article), page_html, diagrams, links, assets.missing, assets.remote,
+            _preprocessor.parse_stats)
+
+
+def preprocess_pages(preprocessor, jobs, workers=None):
+    """Preprocess a list of `(content, rel_url, base_url, nesting_level,
+    shift_level, separate)` jobs and return their results in order, each a
+    `(markup, separate, diagrams, links)` tuple or None.
+
+    The parse and the rewrite of a page are pure Python and CPU bound, so
+    the pages are spread over a pool of worker processes, one per core
+    unless `workers` is given. What the workers find is recorded in the
+    `AssetIndex`, the `DiagramStage` and the parse times of `preprocessor`
+    as if the pages had been preprocessed in this process, in the order of
+    `jobs`.
+    """
+    if len(jobs) <= 1 or workers == 1:
+        results = []
+        for job in jobs:
+            result = preprocessor.preprocess(*job)
+            if result is not None:
+                article, page_html, diagrams, links = result
+                result = str(article), page_html, diagrams, links
+            results.append(result)
+        return results
+    assets = preprocessor.assets
+    # Listed once for all the workers
+    assets.scan()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers or None, mp_context=context,
+                             initializer=_init, initargs=(preprocessor,)) as pool:
+        outcomes = list(pool.map(_run, jobs, chunksize=CHUNK_SIZE))
+    results = []
+    for outcome in outcomes:
+        if outcome is None:
+            results.append(None)
+            continue
+        markup, page_html, diagrams, links, missing, remote, parse_stats = outcome
+        for path, pages in missing.items():
+            assets.missing.setdefault(path, set()).update(pages)
+        assets.remote.update(remote)
+        for kind, source in diagrams:
+            preprocessor.diagrams.add(kind, source)
+        for backend, (pages, seconds) in parse_stats.items():
+            stats = preprocessor.parse_stats.setdefault(backend, [0, 0.0])
+            stats[0] += pages
+            stats[1] += seconds
+        results.append((markup, page_html, diagrams, links))
+    return results
@@ -6,3 +6,4 @@ from .prep import (
     remove_header_links,
     remove_material_header_icons,
 )
+from .rewrite import rewrite_article
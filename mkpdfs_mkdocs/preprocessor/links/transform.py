@@ -1,8 +1,12 @@
 import os
+from functools import lru_cache
 
 from .util import is_doc, normalize_href
 
 # normalize href to #foo/bar/section:id
+# The same links recur on every page (navigation, TOC), so the results are
+# memoized
+@lru_cache(maxsize=65536)
 def transform_href(href: str, rel_url: str):
     if not is_doc(href):
         return href
@@ -1,4 +1,6 @@
 import os
+from functools import lru_cache
+from urllib.parse import urlparse, unquote
 
 from weasyprint import urls
 from bs4 import BeautifulSoup
@@ -6,6 +8,7 @@ from bs4 import BeautifulSoup
 
 # File extensions that should NOT be treated as documentation links
 NON_DOC_EXTENSIONS = {'.xls', '.xlsx', '.pdf', '.doc', '.docx', '.zip', '.png', '.jpg', '.jpeg', '.gif', '.svg'}
+_NON_DOC_SUFFIXES = tuple(NON_DOC_EXTENSIONS)
 
 # check if href is relative --
 # if it is relative it *should* be an html that generates a PDF doc
@@ -18,22 +21,34 @@ def is_doc(href: str):
     # Check if the href points to a non-documentation file (downloads, images, etc.)
     # Extract the path part before any anchor
     path_part = href.split('#')[0].split('?')[0].lower()
-    for ext in NON_DOC_EXTENSIONS:
-        if path_part.endswith(ext):
-            return False
-
-    return True
+    return not path_part.endswith(_NON_DOC_SUFFIXES)
 
 
 def rel_pdf_href(href: str):
-    head, tail = os.path.split(href)
-    filename, _ = os.path.splitext(tail)
+    """Link to the PDF of the page `href` points to, as written by
+    `get_page_pdf`: `foo/bar.html#x` -> `foo/bar.pdf#x` and, for directory
+    URLs, `foo/` -> `foo/index.pdf`.
+
+    >>> rel_pdf_href("../guide/#setup")
+    '../guide/index.pdf#setup'
 
+    >>> rel_pdf_href("page2.html")
+    'page2.pdf'
+    """
     internal = href.startswith('#')
     if not is_doc(href) or internal:
         return href
 
-    return urls.iri_to_uri(os.path.join(head, filename + '.pdf'))
+    path, hash_, fragment = href.partition('#')
+    path = path.split('?')[0]
+    head, tail = os.path.split(path)
+    if tail in ('', '.', '..'):
+        # Directory URL, whose page is the index.html of the folder
+        head, filename = os.path.join(head, tail), 'index'
+    else:
+        filename, _ = os.path.splitext(tail)
+
+    return urls.iri_to_uri(os.path.join(head, filename + '.pdf') + hash_ + fragment)
 
 def abs_asset_href(href: str, base_url: str):
     if urls.url_is_absolute(href) or os.path.isabs(href):
@@ -41,8 +56,26 @@ def abs_asset_href(href: str, base_url: str):
 
     return urls.iri_to_uri(urls.urljoin(base_url, href))
 
+def url_to_path(url: str):
+    """Local path of a file:// URL, or None for other URLs."""
+    parsed = urlparse(url)
+    if parsed.scheme != 'file':
+        return None
+    path = unquote(parsed.path)
+    # On Windows, remove leading slash from /C:/...
+    if len(path) > 2 and path[0] == '/' and path[2] == ':':
+        path = path[1:]
+    return path
+
+
+@lru_cache(maxsize=256)
+def _base_dir(base_url: str):
+    path = url_to_path(base_url)
+    return os.path.dirname(path) if path is not None else None
+
+
 # Replace SVG with PNG for PDF generation (only if PNG exists in _svg_to_png subfolder - SVG 2.0 not supported by WeasyPrint)
-def replace_svg_with_png(src: str, base_url: str = None):
+def replace_svg_with_png(src: str, base_url: str = None, assets=None):
     if src.lower().endswith('.svg'):
         # PNG is in _svg_to_png subfolder: image.svg -> _svg_to_png/image.png
         src_dir = os.path.dirname(src)
@@ -51,32 +84,33 @@ def replace_svg_with_png(src: str, base_url: str = None):
         png_src = os.path.join(src_dir, '_svg_to_png', png_name) if src_dir else '_svg_to_png/' + png_name
 
         # Check if PNG file exists (for SVG 2.0 files that were converted)
-        if base_url:
-            # Try to resolve the full path
-            from urllib.parse import urlparse, unquote
-            parsed = urlparse(base_url)
-            if parsed.scheme == 'file':
-                base_path = unquote(parsed.path)
-                # On Windows, remove leading slash from /C:/...
-                if len(base_path) > 2 and base_path[0] == '/' and base_path[2] == ':':
-                    base_path = base_path[1:]
-                png_path = os.path.join(os.path.dirname(base_path), png_src.lstrip('/'))
-                png_path = os.path.normpath(png_path)
-                if os.path.exists(png_path):
-                    return png_src
+        base_dir = _base_dir(base_url) if base_url else None
+        if base_dir is not None:
+            png_path = os.path.normpath(os.path.join(base_dir, png_src.lstrip('/')))
+            exists = assets.exists if assets is not None else os.path.exists
+            if exists(png_path):
+                return png_src
         return src  # Keep SVG if no PNG exists
     return src
 
 
+def resolve_src(src: str, base_url: str, assets=None):
+    """Absolute URL of an asset source, swapping SVG images for their PNG
+    version. Local files missing from `assets` are recorded in its report."""
+    src = abs_asset_href(replace_svg_with_png(src, base_url, assets), base_url)
+    if assets is not None:
+        assets.check(src, base_url)
+    return src
+
+
 # makes all relative asset links absolute
-def replace_asset_hrefs(soup: BeautifulSoup, base_url: str):
+def replace_asset_hrefs(soup: BeautifulSoup, base_url: str, assets=None):
     for link in soup.find_all('link', href=True):
         link['href'] = abs_asset_href(link['href'], base_url)
 
     for asset in soup.find_all(src=True):
         # Replace SVG with PNG for better PDF compatibility (only if PNG exists)
-        asset['src'] = replace_svg_with_png(asset['src'], base_url)
-        asset['src'] = abs_asset_href(asset['src'], base_url)
+        asset['src'] = resolve_src(asset['src'], base_url, assets)
 
     return soup
 
@@ -0,0 +1,129 @@
+import os
+
+from .links import transform_href, transform_id, get_body_id
+from .links.util import abs_asset_href, rel_pdf_href, resolve_src
+
+from weasyprint import urls
+
+try:
+    from lxml import html as lxml_html
+except ImportError:  # lxml is an optional dependency
+    lxml_html = None
+
+HEADINGS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4, 'h5': 5, 'h6': 6}
+
+
+def parse_document(content: str):
+    return lxml_html.document_fromstring(content)
+
+
+def extract_article(doc):
+    """Return the page article of a parsed document, or None if the theme
+    does not provide one."""
+    article = doc.find('.//article')
+    if article is not None:
+        return article
+    main = doc.find(".//div[@role='main']")
+    if main is None:
+        return None
+    article = doc.makeelement('article', {})
+    article.append(main)
+    main.attrib.pop('class', None)
+    main.attrib.pop('role', None)
+    return article
+
+
+def has_class(el, name: str):
+    value = el.get('class')
+    if value is None:
+        return False
+    return name in value.split() or ' '.join(value.split()) == name
+
+
+def rewrite_article(article, base_url: str, rel_url: str,
+                    nesting_level: int = 0, heading_shift: int = 0,
+                    material: bool = False, assets=None, links=None):
+    """lxml counterpart of `preprocessor.rewrite_article`, applying the same
+    transforms to an lxml element without going through BeautifulSoup."""
+    stack = list(reversed(article))
+    while stack:
+        el = stack.pop()
+        if isinstance(el.tag, str) and _rewrite_element(
+                el, base_url, rel_url, nesting_level, heading_shift, material, assets, links):
+            stack.extend(reversed(el))
+    article.set('id', get_body_id(rel_url))
+    if links is not None:
+        links.ids.add(article.get('id'))
+    return article
+
+
+def _rewrite_element(el, base_url: str, rel_url: str, nesting_level: int,
+                     heading_shift: int, material: bool, assets=None, links=None):
+    tag = el.tag
+    attrib = el.attrib
+    if tag == 'a' and material and has_class(el, 'md-content__button'):
+        el.drop_tree()
+        return False
+
+    level = HEADINGS.get(tag)
+    if level and attrib.get('id'):
+        anchor_id = transform_id(attrib['id'], rel_url)
+        el.addprevious(el.makeelement('a', {'id': anchor_id,
+                                            'name': anchor_id}))
+
+    if 'id' in attrib:
+        attrib['id'] = transform_id(attrib['id'], rel_url)
+        if links is not None:
+            links.ids.add(attrib['id'])
+
+    if tag == 'a':
+        if 'name' in attrib:
+            attrib['name'] = transform_id(attrib['name'], rel_url)
+            if links is not None:
+                links.ids.add(attrib['name'])
+        href = attrib.get('href')
+        if href is not None:
+            if urls.url_is_absolute(href) or os.path.isabs(href):
+                attrib['class'] = 'external-link'
+            else:
+                attrib['href'] = transform_href(href, rel_url)
+                if links is not None and attrib['href'] != href:
+                    links.targets.add(attrib['href'][1:])
+        if has_class(el, 'headerlink'):
+            el.drop_tree()
+            return False
+    elif tag == 'link' and 'href' in attrib:
+        attrib['href'] = abs_asset_href(attrib['href'], base_url)
+
+    if 'src' in attrib:
+        attrib['src'] = resolve_src(attrib['src'], base_url, assets)
+
+    if level:
+        if nesting_level:
+            attrib['style'] = 'bookmark-level:{}'.format(level + nesting_level)
+        if heading_shift:
+            el.tag = 'h{}'.format(min(level + heading_shift, 6))
+    return True
+
+
+def separate_article(article, base_url: str, material: bool = False, assets=None):
+    """lxml counterpart of `get_separate` followed by the header link
+    removal, preparing an article for its own PDF."""
+    for el in list(article.iter('a', 'link')):
+        if el.tag == 'link':
+            if 'href' in el.attrib:
+                el.set('href', abs_asset_href(el.get('href'), base_url))
+            continue
+        if has_class(el, 'headerlink') or (material and has_class(el, 'md-content__button')):
+            el.drop_tree()
+            continue
+        if 'href' in el.attrib:
+            el.set('href', rel_pdf_href(el.get('href')))
+    for el in article.iter():
+        if isinstance(el.tag, str) and 'src' in el.attrib:
+            el.set('src', resolve_src(el.get('src'), base_url, assets))
+    return article
+
+
+def serialize(article):
+    return lxml_html.tostring(article, encoding='unicode', with_tail=False)
@@ -5,7 +5,7 @@ from .links import transform_href, transform_id, get_body_id, replace_asset_href
 from weasyprint import urls
 from bs4 import BeautifulSoup
 
-def get_combined(soup: BeautifulSoup, base_url: str, rel_url: str):
+def get_combined(soup: BeautifulSoup, base_url: str, rel_url: str, assets=None):
     # Add explicit anchor tags for headings with ids (for MkDocs Material { #anchor } syntax)
     for heading in soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
         if heading.get('id'):
@@ -33,16 +33,16 @@ def get_combined(soup: BeautifulSoup, base_url: str, rel_url: str):
         a['href'] = transform_href(a['href'], rel_url)
 
     soup.attrs['id'] = get_body_id(rel_url)
-    soup = replace_asset_hrefs(soup, base_url)
+    soup = replace_asset_hrefs(soup, base_url, assets)
     return soup
 
-def get_separate(soup: BeautifulSoup, base_url: str):
+def get_separate(soup: BeautifulSoup, base_url: str, assets=None):
     # transforms all relative hrefs pointing to other html docs
     # into relative pdf hrefs
     for a in soup.find_all('a', href=True):
         a['href'] = rel_pdf_href(a['href'])
 
-    soup = replace_asset_hrefs(soup, base_url)
+    soup = replace_asset_hrefs(soup, base_url, assets)
     return soup
 
 def remove_material_header_icons(soup: BeautifulSoup):
@@ -0,0 +1,110 @@
+import os
+
+from .links import transform_href, transform_id, get_body_id
+from .links.util import abs_asset_href, resolve_src
+
+from weasyprint import urls
+from bs4 import BeautifulSoup, Tag
+
+HEADINGS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4, 'h5': 5, 'h6': 6}
+
+
+def has_class(tag: Tag, name: str):
+    """Match ``name`` against the class attribute the way ``find_all`` does."""
+    value = tag.get('class')
+    if value is None:
+        return False
+    if isinstance(value, str):
+        return value == name
+    return name in value or ' '.join(value) == name
+
+
+def rewrite_article(soup: BeautifulSoup, base_url: str, rel_url: str,
+                    nesting_level: int = 0, heading_shift: int = 0,
+                    material: bool = False, assets=None, links=None):
+    """Prepare a page article for the combined PDF in a single tree walk.
+    The ids of the article and the targets of its internal links are added
+    to `links`, a `PageLinks`, when given.
+
+    The result is the same markup as running `remove_material_header_icons`
+    (material theme only), `get_combined`, `remove_header_links`,
+    `nest_heading_bookmarks` and `adjust_heading_levels` one after the other,
+    but every element is visited only once.
+    """
+    factory = BeautifulSoup('', 'html.parser')
+    stack = []
+    node = soup.contents[0] if soup.contents else None
+    while node is not None:
+        following = node.next_sibling
+        if isinstance(node, Tag) \
+                and _rewrite_tag(node, factory, base_url, rel_url,
+                                 nesting_level, heading_shift, material, assets, links) \
+                and node.contents:
+            stack.append(following)
+            following = node.contents[0]
+        while following is None and stack:
+            following = stack.pop()
+        node = following
+
+    soup.attrs['id'] = get_body_id(rel_url)
+    if links is not None:
+        links.ids.add(soup.attrs['id'])
+    return soup
+
+
+def _rewrite_tag(tag: Tag, factory: BeautifulSoup, base_url: str,
+                 rel_url: str, nesting_level: int, heading_shift: int,
+                 material: bool, assets=None, links=None):
+    """Rewrite a single element in place.
+
+    Returns False when the element has been removed from the tree, so that
+    its children are not visited.
+    """
+    name = tag.name
+    attrs = tag.attrs
+    if name == 'a' and material and has_class(tag, 'md-content__button'):
+        tag.decompose()
+        return False
+
+    level = HEADINGS.get(name)
+    if level and attrs.get('id'):
+        # Explicit anchor before the heading for better PDF anchor resolution
+        anchor_id = transform_id(attrs['id'], rel_url)
+        tag.insert_before(factory.new_tag('a', attrs={'id': anchor_id,
+                                                      'name': anchor_id}))
+
+    if attrs.get('id') is not None:
+        attrs['id'] = transform_id(attrs['id'], rel_url)
+        if links is not None:
+            links.ids.add(attrs['id'])
+
+    if name == 'a':
+        if attrs.get('name') is not None:
+            attrs['name'] = transform_id(attrs['name'], rel_url)
+            if links is not None:
+                links.ids.add(attrs['name'])
+        href = attrs.get('href')
+        if href is not None:
+            if urls.url_is_absolute(href) or os.path.isabs(href):
+                attrs['class'] = 'external-link'
+            else:
+                attrs['href'] = transform_href(href, rel_url)
+                if links is not None and attrs['href'] != href:
+                    links.targets.add(attrs['href'][1:])
+        if has_class(tag, 'headerlink'):
+            tag.decompose()
+            return False
+    elif name == 'link' and attrs.get('href') is not None:
+        attrs['href'] = abs_asset_href(attrs['href'], base_url)
+
+    if attrs.get('src') is not None:
+        attrs['src'] = resolve_src(attrs['src'], base_url, assets)
+
+    if level:
+        if nesting_level:
+            # See nest_heading_bookmarks()
+            attrs['style'] = 'bookmark-level:{}'.format(level + nesting_level)
+        if heading_shift:
+            # See adjust_heading_levels()
+            tag.name = 'h{}'.format(min(level + heading_shift, 6))
+    return True
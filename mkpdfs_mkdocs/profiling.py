@@ -0,0 +1,105 @@
+import cProfile
+import json
+import logging
+from contextlib import contextmanager
+from time import perf_counter
+
+from mkpdfs_mkdocs.utils import peak_rss
+
+log = logging.getLogger('mkdocs.mkpdfs')
+
+# Number of pages listed in each ranking of the report
+TOP_PAGES = 10
+
+
+class BuildProfile(object):
+    """Time and memory spent by each stage of the build, collected when the
+    `profile` option is set.
+
+    Stages may be nested, `parse` is part of `add_article` for instance.
+    For each stage, the report gives the number of runs, the total time and
+    the peak memory of the process when it last ended. The pages are ranked
+    by preprocessing time and by the number of PDF pages they fill.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stages = {}  # Name -> [runs, seconds, peak RSS in MiB]
+        self.page_seconds = {}  # Page URL -> seconds spent in add_article
+        self.page_counts = {}  # Page URL -> PDF pages, None for the cover and TOC
+
+    @contextmanager
+    def stage(self, name, page=None):
+        """Time the body of the `with` statement as part of `name`, and of
+        the preprocessing of `page` when given."""
+        if not self.enabled:
+            yield
+            return
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - start
+            stats = self.stages.setdefault(name, [0, 0.0, None])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = peak_rss()
+            if page is not None:
+                self.page_seconds[page] = self.page_seconds.get(page, 0.0) + seconds
+
+    @contextmanager
+    def cprofile(self, path):
+        """Profile the body of the `with` statement with cProfile and dump
+        the statistics to `path`, if given."""
+        if not path:
+            yield
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            log.info('Render profile written to {}'.format(path))
+
+    def count_pages(self, anchors):
+        """Attribute the laid out pages to the articles, from the anchor
+        names of each page: a page belongs to the first article starting on
+        it, or to the article running over it."""
+        if not self.enabled:
+            return
+        current = None
+        for names in anchors:
+            starts = [name[:-1] for name in names
+                      if name.endswith(':') and name[:-1] in self.page_seconds]
+            owner = starts[0] if starts else current
+            self.page_counts[owner] = self.page_counts.get(owner, 0) + 1
+            if starts:
+                current = starts[-1]
+
+    def report(self):
+        total = sum(self.page_counts.values())
+        slowest = sorted(self.page_seconds.items(), key=lambda item: -item[1])
+        longest = sorted(((url, count) for url, count in self.page_counts.items()
+                          if url is not None), key=lambda item: -item[1])
+        return {
+            'peak_rss_mib': peak_rss(),
+            'stages': {name: {'runs': runs, 'seconds': round(seconds, 4), 'peak_rss_mib': peak}
+                       for name, (runs, seconds, peak) in self.stages.items()},
+            'pdf_pages': total,
+            'slowest_pages': [{'page': url, 'seconds': round(seconds, 4)}
+                              for url, seconds in slowest[:TOP_PAGES]],
+            'longest_pages': [{'page': url, 'pdf_pages': count,
+                               'share': round(count / total, 4)}
+                              for url, count in longest[:TOP_PAGES]],
+        }
+
+    def write(self, path):
+        """Log the time spent by stage and write the full report to `path`."""
+        report = self.report()
+        for name, stats in report['stages'].items():
+            log.info('{:>16}: {:8.2f}s in {} runs'.format(name, stats['seconds'], stats['runs']))
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        log.info('Build profile written to {}'.format(path))
@@ -0,0 +1,280 @@
+import hashlib
+import logging
+import os
+import re
+from html import unescape
+from urllib.parse import urljoin
+
+import tinycss2
+from tinycss2.ast import AtRule, FunctionBlock, QualifiedRule, StringToken, URLToken, WhitespaceToken
+from tinycss2.serializer import serialize_string_value, serialize_url
+from weasyprint import urls
+
+from mkpdfs_mkdocs.preprocessor.links.util import url_to_path
+
+log = logging.getLogger('mkdocs.mkpdfs')
+
+TAG_RE = re.compile(r'<([a-zA-Z][a-zA-Z0-9-]*)')
+CLASS_RE = re.compile(r'''\sclass=(?:"([^"]*)"|'([^']*)')''')
+ID_RE = re.compile(r'''\sid=(?:"([^"]*)"|'([^']*)')''')
+STYLE_RE = re.compile(r'''\sstyle=(?:"([^"]*)"|'([^']*)')|<style\b[^>]*>(.*?)</style>''', re.S)
+
+# Elements that exist in the parsed document without being in the markup
+IMPLICIT_TAGS = ('html', 'head', 'body', 'tbody')
+# At-rules holding rules, which are pruned in turn
+GROUPING_RULES = ('media', 'supports')
+COMBINATORS = ('>', '+', '~')
+# Bump whenever the pruning changes, so that stylesheets pruned by an older
+# version are not reused
+PRUNE_VERSION = '2'
+
+
+class DocumentSelectors(object):
+    """The tags, classes and ids of a document, and its inline styles.
+
+    The markup is fed in pieces, as long as no tag is split between two of
+    them.
+    """
+
+    def __init__(self):
+        self.tags = set(IMPLICIT_TAGS)
+        self.classes = set()
+        self.ids = set()
+        self.styles = set()
+
+    def feed(self, html):
+        self.tags.update(tag.lower() for tag in TAG_RE.findall(html))
+        for double, single in CLASS_RE.findall(html):
+            self.classes.update(unescape(double or single).split())
+        for double, single in ID_RE.findall(html):
+            self.ids.add(unescape(double or single))
+        for match in STYLE_RE.findall(html):
+            self.styles.add(unescape(''.join(match)).lower())
+
+    def signature(self):
+        digest = hashlib.sha256()
+        for names in (self.tags, self.classes, self.ids, self.styles):
+            digest.update('\0'.join(sorted(names)).encode('utf-8'))
+            digest.update(b'\1')
+        return digest.hexdigest()
+
+
+def _selectors(prelude):
+    """Split the prelude of a rule into its comma separated selectors."""
+    selectors = [[]]
+    for token in prelude:
+        if token.type == 'literal' and token.value == ',':
+            selectors.append([])
+        else:
+            selectors[-1].append(token)
+    return selectors
+
+
+def can_match(selector, document):
+    """Whether `selector`, a list of tokens, may match an element of
+    `document`. Only type, class and id selectors are checked, outside of
+    functional pseudo-classes, and unsure cases are kept."""
+    if any(token.type == 'literal' and token.value == '|' for token in selector):
+        # Namespaced type selectors are not checked
+        return True
+    previous = None
+    for token in selector:
+        if token.type == 'ident':
+            if previous is None or previous.type == 'whitespace' or (
+                    previous.type == 'literal' and previous.value in COMBINATORS):
+                if token.lower_value not in document.tags:
+                    return False
+            elif previous.type == 'literal' and previous.value == '.':
+                if token.value not in document.classes:
+                    return False
+        elif token.type == 'hash' and token.is_identifier:
+            if token.value not in document.ids:
+                return False
+        if token.type != 'comment':
+            previous = token
+    return True
+
+
+def _family(rule):
+    for declaration in tinycss2.parse_declaration_list(rule.content, skip_comments=True,
+                                                       skip_whitespace=True):
+        if declaration.type == 'declaration' and declaration.lower_name == 'font-family':
+            return tinycss2.serialize(declaration.value).strip().strip('\'"').lower()
+    return None
+
+
+class CssPruner(object):
+    """Reduces the design stylesheet to the rules that may match a document.
+
+    Rules whose selectors all need a tag, class or id missing from the
+    document are dropped, as well as the `@font-face` rules of the families
+    used nowhere else. Local `@import` rules are inlined and pruned too,
+    the other ones are moved to the top of the stylesheet, and relative
+    URLs are made absolute. The result is written to `cache_dir`, named
+    after the hash of the design, of the stylesheets it inlines and of the
+    selectors of the document, and used as the design of the render.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self._pruned = {}  # Cache key -> path
+        self._count = 0  # Rules of the design
+
+    def prune(self, design, document):
+        """Path of the stylesheet of `design` pruned for `document`, a
+        `DocumentSelectors`."""
+        try:
+            with open(design, 'rb') as f:
+                css = f.read()
+        except OSError:
+            return design
+        digest = hashlib.sha256(PRUNE_VERSION.encode('ascii') + css)
+        # Inlined into the result, so their changes must give another key
+        for imported in self._imported(css.decode('utf-8'), urls.path2url(design),
+                                       {urls.path2url(design)}):
+            digest.update(hashlib.sha256(imported).digest())
+        digest.update(document.signature().encode('ascii'))
+        key = digest.hexdigest()
+        if key in self._pruned:
+            return self._pruned[key]
+        path = os.path.join(self.cache_dir, key + '.css')
+        if not os.path.isfile(path):
+            imports, rules = [], []
+            self._count = 0
+            self._prune_sheet(css.decode('utf-8'), urls.path2url(design), document, imports, rules,
+                              set())
+            kept = self._prune_fonts(rules, document)
+            text = ''.join(tinycss2.serialize([rule]) + '\n' for rule in imports + kept)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = '{}.{}.tmp'.format(path, os.getpid())
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(tmp, path)
+            log.info('Pruned the design from {} to {} rules'.format(
+                self._count, len(kept)))
+        self._pruned[key] = path
+        return path
+
+    def _prune_sheet(self, css, base_url, document, imports, rules, seen):
+        seen.add(base_url)
+        for rule in tinycss2.parse_stylesheet(css, skip_comments=True, skip_whitespace=True):
+            if rule.type == 'qualified-rule':
+                self._count += 1
+                rule = self._prune_rule(rule, document)
+                if rule is not None:
+                    rules.append(self._absolute(rule, base_url))
+            elif rule.type == 'at-rule' and rule.lower_at_keyword == 'import':
+                self._import(rule, base_url, document, imports, rules, seen)
+            elif rule.type == 'at-rule' and rule.lower_at_keyword in GROUPING_RULES:
+                content = self._prune_rule_list(rule.content or [], document)
+                if content:
+                    rules.append(self._absolute(AtRule(
+                        rule.source_line, rule.source_column, rule.at_keyword,
+                        rule.lower_at_keyword, rule.prelude, content), base_url))
+            elif rule.type != 'error':
+                self._count += 1
+                rules.append(self._absolute(rule, base_url))
+
+    def _prune_rule_list(self, content, document):
+        kept = []
+        for rule in tinycss2.parse_rule_list(content, skip_comments=True, skip_whitespace=True):
+            if rule.type == 'qualified-rule':
+                self._count += 1
+                rule = self._prune_rule(rule, document)
+            if rule is not None and rule.type != 'error':
+                kept.extend([rule, WhitespaceToken(rule.source_line, rule.source_column, '\n')])
+        return kept
+
+    @staticmethod
+    def _prune_rule(rule, document):
+        selectors = [selector for selector in _selectors(rule.prelude) if can_match(selector, document)]
+        if not selectors:
+            return None
+        prelude = []
+        for selector in selectors:
+            if prelude:
+                prelude.append(tinycss2.parse_one_component_value(','))
+            prelude.extend(selector)
+        return QualifiedRule(rule.source_line, rule.source_column, prelude, rule.content)
+
+    def _import(self, rule, base_url, document, imports, rules, seen):
+        url, path = self._import_path(rule, base_url)
+        if path is not None and url not in seen:
+            with open(path, encoding='utf-8') as f:
+                self._prune_sheet(f.read(), url, document, imports, rules, seen)
+            return
+        imports.append(self._absolute(rule, base_url))
+
+    @staticmethod
+    def _import_path(rule, base_url):
+        """`(url, path)` of the stylesheet of an `@import` rule, with a None
+        path unless it is a local file without media queries, which is
+        inlined."""
+        tokens = [token for token in rule.prelude if token.type not in ('whitespace', 'comment')]
+        url = None
+        if tokens and tokens[0].type in ('string', 'url'):
+            url = urljoin(base_url, tokens[0].value)
+        elif tokens and isinstance(tokens[0], FunctionBlock) and tokens[0].lower_name == 'url':
+            argument = [arg for arg in tokens[0].arguments if arg.type == 'string']
+            url = urljoin(base_url, argument[0].value) if argument else None
+        path = url_to_path(url) if url and url.startswith('file:') else None
+        if path is None or len(tokens) != 1 or not os.path.isfile(path):
+            return url, None
+        return url, path
+
+    def _imported(self, css, base_url, seen):
+        """The content of the local stylesheets `css` inlines, recursively,
+        in the order `_prune_sheet` reads them."""
+        if '@import' not in css.lower():
+            return
+        for rule in tinycss2.parse_stylesheet(css, skip_comments=True, skip_whitespace=True):
+            if rule.type != 'at-rule' or rule.lower_at_keyword != 'import':
+                continue
+            url, path = self._import_path(rule, base_url)
+            if path is None or url in seen:
+                continue
+            seen.add(url)
+            with open(path, 'rb') as f:
+                imported = f.read()
+            yield imported
+            yield from self._imported(imported.decode('utf-8'), url, seen)
+
+    def _prune_fonts(self, rules, document):
+        """Drop the `@font-face` rules of the families no other rule or
+        inline style refers to."""
+        used = ' '.join([tinycss2.serialize([rule]).lower() for rule in rules
+                         if not self._is_font_face(rule)] + sorted(document.styles))
+        kept = []
+        for rule in rules:
+            if self._is_font_face(rule):
+                family = _family(rule)
+                if family and family not in used:
+                    continue
+            kept.append(rule)
+        return kept
+
+    @staticmethod
+    def _is_font_face(rule):
+        return rule.type == 'at-rule' and rule.lower_at_keyword == 'font-face'
+
+    def _absolute(self, node, base_url):
+        """Make the relative URLs of `node` absolute, in place."""
+        for name in ('prelude', 'content', 'arguments'):
+            tokens = getattr(node, name, None)
+            if not tokens:
+                continue
+            for index, token in enumerate(tokens):
+                if isinstance(token, URLToken):
+                    tokens[index] = tinycss2.parse_one_component_value(
+                        'url({})'.format(serialize_url(urljoin(base_url, token.value))))
+                elif (isinstance(token, StringToken) and name == 'arguments'
+                      and node.lower_name == 'url'):
+                    tokens[index] = tinycss2.parse_one_component_value(
+                        '"{}"'.format(serialize_string_value(urljoin(base_url, token.value))))
+                elif (isinstance(token, StringToken) and name == 'prelude'
+                      and getattr(node, 'lower_at_keyword', None) == 'import'):
+                    tokens[index] = tinycss2.parse_one_component_value(
+                        '"{}"'.format(serialize_string_value(urljoin(base_url, token.value))))
+                elif hasattr(token, 'content') or hasattr(token, 'arguments'):
+                    self._absolute(token, base_url)
+        return node
@@ -0,0 +1,90 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from weasyprint import HTML
+
+from mkpdfs_mkdocs.profiling import BuildProfile
+from mkpdfs_mkdocs.render_profiles import RENDER_PROFILES
+from mkpdfs_mkdocs.styles import process_styles
+
+NO_PROFILE = BuildProfile()
+DEFAULT_RENDER = RENDER_PROFILES['default']
+
+
+def temporary_path(pdf_path, pid=None):
+    return '{}.{}.tmp'.format(pdf_path, pid or os.getpid())
+
+
+def write_pdf(html, pdf_path, design, styles=None, fetcher=None, profile=None, render_profile=None):
+    """Render `html` to `pdf_path` with the `design` stylesheet.
+
+    The PDF is written next to its destination first and moved into place
+    once complete, so readers never see a partially written file. This
+    function is also the entry point of the render worker processes, which
+    use the `StyleCache` of their process unless `styles` is given.
+    Resources are loaded through `fetcher` when given. The stages of the
+    render are timed by `profile` when given. The WeasyPrint options and
+    stylesheet of `render_profile` are applied when given.
+    """
+    profile = profile or NO_PROFILE
+    with profile.stage('load'):
+        document = HTML(string=html, **document_options(fetcher))
+    _write(document, pdf_path, design, styles, profile, render_profile)
+
+
+def write_pdf_file(html_path, pdf_path, design, styles=None, fetcher=None, profile=None,
+                   render_profile=None):
+    """Render the HTML file at `html_path` to `pdf_path`, letting WeasyPrint
+    read the document from disk instead of holding it as a string."""
+    profile = profile or NO_PROFILE
+    with profile.stage('load'):
+        document = HTML(filename=html_path, **document_options(fetcher))
+    _write(document, pdf_path, design, styles, profile, render_profile)
+
+
+def document_options(fetcher=None):
+    return {'url_fetcher': fetcher.url_fetcher()} if fetcher is not None else {}
+
+
+def _write(document, pdf_path, design, styles, profile=NO_PROFILE, render_profile=None):
+    render_profile = render_profile or DEFAULT_RENDER
+    stylesheets, font_config = (styles or process_styles).get(design)
+    stylesheets = render_profile.stylesheets(stylesheets, font_config)
+    options = render_profile.render_options()
+    tmp = temporary_path(pdf_path)
+    try:
+        with profile.stage('layout'):
+            rendered = document.render(stylesheets=stylesheets, font_config=font_config, **options)
+        profile.count_pages(page.anchors for page in rendered.pages)
+        with profile.stage('write_pdf'):
+            rendered.write_pdf(tmp, **options)
+        os.replace(tmp, pdf_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def write_pdfs(jobs, design, workers=None, styles=None, fetcher=None, from_files=False,
+               render_profile=None):
+    """Render a list of `(html, pdf_path)` jobs, or of `(html, pdf_path,
+    design)` jobs using their own stylesheet. With `from_files`, `html` is
+    the path of the file holding the document.
+
+    WeasyPrint is single threaded and CPU bound, so the documents are spread
+    over a pool of worker processes, one per core unless `workers` is given.
+    Each worker parses the design once for all the documents it renders.
+    """
+    jobs = [tuple(job) + (design,) * (3 - len(job)) for job in jobs]
+    render = write_pdf_file if from_files else write_pdf
+    if len(jobs) <= 1 or workers == 1:
+        for html, pdf_path, job_design in jobs:
+            render(html, pdf_path, job_design, styles, fetcher, None, render_profile)
+        return
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers or None, mp_context=context) as pool:
+        futures = [pool.submit(render, html, pdf_path, job_design, None, fetcher, None,
+                               render_profile)
+                   for html, pdf_path, job_design in jobs]
+        for future in futures:
+            future.result()
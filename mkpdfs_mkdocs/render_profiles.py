@@ -0,0 +1,74 @@
+import logging
+import os
+import sys
+
+import weasyprint
+from weasyprint import CSS
+
+log = logging.getLogger('mkdocs.mkpdfs')
+
+# Overrides the `render_profile` option
+ENV_VAR = 'MKPDFS_RENDER_PROFILE'
+
+# The page numbers of the table of contents (`target-counter`) make
+# WeasyPrint lay out the document a second time
+NO_TOC_PAGE_NUMBERS = '#contents a::after { content: none !important; }'
+
+
+class RenderProfile(object):
+    """A named set of speed and size trade-offs of the PDF generation.
+
+    `config` overrides the plugin options of the preprocessing, `options`
+    are passed to WeasyPrint and `css` is added to the design. Instances
+    are sent to the render worker processes.
+    """
+
+    def __init__(self, name, config=None, options=None, css=None):
+        self.name = name
+        self.config = config or {}
+        self.options = options or {}
+        self.css = css
+
+    def render_options(self):
+        """The WeasyPrint options this version of WeasyPrint supports. The
+        options only exist since WeasyPrint 59."""
+        supported = getattr(weasyprint, 'DEFAULT_OPTIONS', {})
+        return {key: value for key, value in self.options.items() if key in supported}
+
+    def stylesheets(self, stylesheets, font_config):
+        if not self.css:
+            return stylesheets
+        return stylesheets + [CSS(string=self.css, font_config=font_config)]
+
+
+RENDER_PROFILES = {
+    'default': RenderProfile('default'),
+    # Quick visual checks: small images, nothing downloaded, no page
+    # numbers in the table of contents, whole fonts and uncompressed output
+    'draft': RenderProfile('draft',
+                           config={'optimize_images': True, 'image_dpi': 72, 'jpeg_quality': 60,
+                                   'remote_images': False},
+                           options={'dpi': 72, 'full_fonts': True, 'hinting': False,
+                                    'uncompressed_pdf': True},
+                           css=NO_TOC_PAGE_NUMBERS),
+    # Publishing: optimized images, shared by the pages using the same
+    # file, subset fonts and compressed output
+    'release': RenderProfile('release',
+                             config={'optimize_images': True},
+                             options={'optimize_images': True, 'full_fonts': False,
+                                      'uncompressed_pdf': False}),
+}
+
+
+def get_render_profile(name):
+    """The profile named by the `MKPDFS_RENDER_PROFILE` environment
+    variable, or else by the `render_profile` option."""
+    name = os.environ.get(ENV_VAR) or name or 'default'
+    if name not in RENDER_PROFILES:
+        sys.exit('Unknown render profile {}, expected one of: {}'.format(
+            name, ', '.join(sorted(RENDER_PROFILES))))
+    profile = RENDER_PROFILES[name]
+    if profile.options and not hasattr(weasyprint, 'DEFAULT_OPTIONS'):
+        log.warning('WeasyPrint 59 or later is needed to apply all the settings of the {} '
+                    'render profile.'.format(name))
+    return profile
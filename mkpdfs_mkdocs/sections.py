@@ -0,0 +1,62 @@
+import os
+import re
+from html import escape, unescape
+from urllib.parse import unquote
+
+from weasyprint import urls
+
+from mkpdfs_mkdocs.preprocessor.links.transform import transform_id
+
+LINK_RE = re.compile(r'<a\s[^>]*>')
+HREF_RE = re.compile(r'''(\shref=)(["'])([^"']*)\2''')
+ID_RE = re.compile(r'''(<[a-zA-Z][^>]*?\sid=)(["'])([^"']*)\2''')
+
+
+class SectionLinks(object):
+    """Rewrites the articles of the page PDFs for the PDF of a section.
+
+    The links of those articles are relative to the folder of each page
+    PDF, see `rel_pdf_href`. In the section PDF, written to `pdf_dir`, the
+    links to pages of the section point to their article instead, whose
+    ids are prefixed with the page URL as in the combined document, and
+    the other relative links are rebased on `pdf_dir`.
+    """
+
+    def __init__(self, pages, pdf_dir):
+        # Page PDF, relative to `site_dir` -> page URL
+        self.pages = {os.path.normpath(pdf): url for url, pdf in pages}
+        self.pdf_dir = pdf_dir
+
+    def article(self, url, pdf, markup):
+        """`markup`, the article of the page PDF `pdf` of `url`, rewritten
+        for the section PDF."""
+        page_dir = os.path.dirname(pdf)
+
+        def link(match):
+            tag = match.group(0)
+            href = HREF_RE.search(tag)
+            if href is None:
+                return tag
+            location = self._location(url, page_dir, unescape(href.group(3)))
+            return '{}{}"{}"{}'.format(tag[:href.start()], href.group(1), escape(location),
+                                       tag[href.end():])
+
+        def anchor(match):
+            return '{}{}{}{}'.format(match.group(1), match.group(2),
+                                     escape(transform_id(unescape(match.group(3)), url)),
+                                     match.group(2))
+
+        markup = LINK_RE.sub(link, ID_RE.sub(anchor, markup))
+        return '<div id="{}">{}</div>'.format(escape(transform_id('', url)), markup)
+
+    def _location(self, url, page_dir, href):
+        if href.startswith('#'):
+            return '#' + transform_id(href[1:], url)
+        if not href or urls.url_is_absolute(href) or os.path.isabs(href):
+            return href
+        path, hash_, fragment = href.partition('#')
+        target = os.path.normpath(os.path.join(page_dir, path))
+        page = self.pages.get(os.path.normpath(unquote(target)))
+        if page is not None:
+            return '#' + transform_id(fragment, page)
+        return os.path.relpath(target, self.pdf_dir).replace(os.sep, '/') + hash_ + fragment
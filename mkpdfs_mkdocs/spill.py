@@ -0,0 +1,41 @@
+import os
+import shutil
+import tempfile
+
+
+class SpillStore(object):
+    """Keeps serialized articles on disk instead of in memory.
+
+    Each article is written to its own file as soon as it is preprocessed,
+    and streamed back into the combined document when it is assembled.
+    """
+
+    def __init__(self):
+        self.directory = tempfile.mkdtemp(prefix='mkpdfs_spill_')
+        self._paths = {}
+
+    def __contains__(self, key):
+        return key in self._paths
+
+    def put(self, key, markup):
+        path = self._paths.get(key) or os.path.join(self.directory, '{}.html'.format(len(self._paths)))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(markup)
+        self._paths[key] = path
+
+    def read(self, key):
+        with open(self._paths[key], encoding='utf-8') as f:
+            return f.read()
+
+    def copy_to(self, key, out):
+        """Stream the article stored under `key` into the file object `out`."""
+        with open(self._paths[key], encoding='utf-8') as f:
+            shutil.copyfileobj(f, out)
+
+    def path(self, name):
+        """Path of an extra file kept with the spilled articles."""
+        return os.path.join(self.directory, name)
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self._paths = {}
@@ -0,0 +1,72 @@
+import logging
+import os
+import re
+
+from weasyprint import CSS
+from weasyprint.text.fonts import FontConfiguration
+
+from mkpdfs_mkdocs.preprocessor.links.util import url_to_path
+
+log = logging.getLogger('mkdocs.mkpdfs')
+
+URL_RE = re.compile(r'url\(\s*[\'"]?([^\'")]+?)[\'"]?\s*\)')
+
+
+class StyleCache(object):
+    """The parsed design stylesheets and their font configurations.
+
+    Parsing a design loads every `@font-face` it declares, so both are
+    kept for each design path and reused by the following renders, as a
+    build may alternate between several designs: those of the outputs, the
+    pruned stylesheets of the documents and the design of the page PDFs.
+    They are rebuilt when the design file, or one of the local files it
+    references, is modified.
+    """
+
+    # Designs kept, the least recently added are dropped first
+    MAX_DESIGNS = 8
+
+    def __init__(self):
+        self._designs = {}  # Path -> (signature, stylesheets, font_config)
+
+    def get(self, design):
+        """Return the `(stylesheets, font_config)` to render with `design`."""
+        signature = self.signature(design)
+        cached = self._designs.get(design)
+        if cached is not None and cached[0] == signature:
+            return cached[1:]
+        if cached is not None:
+            log.info('The design has changed, reloading {}'.format(design))
+            del self._designs[design]
+        font_config = FontConfiguration()
+        if os.path.isfile(design):
+            stylesheets = [CSS(filename=design, font_config=font_config)]
+        else:
+            log.warning('The design {} has not been found.'.format(design))
+            stylesheets = []
+        while len(self._designs) >= self.MAX_DESIGNS:
+            del self._designs[next(iter(self._designs))]
+        self._designs[design] = (signature, stylesheets, font_config)
+        return stylesheets, font_config
+
+    @staticmethod
+    def signature(design):
+        try:
+            with open(design, encoding='utf-8') as f:
+                css = f.read()
+        except OSError:
+            return ()
+        root = os.path.dirname(design)
+        files = [design]
+        for url in URL_RE.findall(css):
+            if url.startswith('file:'):
+                # Such as the absolute URLs of a design pruned by `CssPruner`
+                files.append(os.path.normpath(url_to_path(url)))
+            elif ':' not in url:
+                files.append(os.path.normpath(os.path.join(root, url)))
+        return tuple((path, os.stat(path).st_mtime_ns)
+                     for path in files if os.path.isfile(path))
+
+
+# Used by the render worker processes, which live as long as their pool
+process_styles = StyleCache()
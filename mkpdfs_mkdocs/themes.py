@@ -0,0 +1,66 @@
+import re
+from html import escape
+
+# Taken from mkdocs-pdf-export-plugin for material theme.
+# https://github.com/zhaoterryy/mkdocs-pdf-export-plugin/blob/46af862318c92996913a81cab07cc998a871c2cb/mkdocs_pdf_export_plugin/themes/material.py#L65-L71
+MATERIAL_ICON = '<svg style="height: 1.2rem; width: 1.2rem;" viewBox="0 0 384 512" xmlns="http://www.w3.org/2000/svg"><path d="M224 136V0H24C10.7 0 0 10.7 0 24v464c0 13.3 10.7 24 24 24h336c13.3 0 24-10.7 24-24V160H248c-13.2 0-24-10.8-24-24zm76.45 211.36l-96.42 95.7c-6.65 6.61-17.39 6.61-24.04 0l-96.42-95.7C73.42 337.29 80.54 320 94.82 320H160v-80c0-8.84 7.16-16 16-16h32c8.84 0 16 7.16 16 16v80h65.18c14.28 0 21.4 17.29 11.27 27.36zM377 105L279.1 7c-4.5-4.5-10.6-7-17-7H256v128h128v-6.1c0-6.3-2.5-12.4-7-16.9z"></path></svg>'
+
+
+class Theme(object):
+    """What the plugin needs to know about a MkDocs theme.
+
+    The download button is spliced into the page markup right after the
+    opening tag of the page content, found with `content_start`, so the
+    page is never parsed a second time. To support a new theme, subclass
+    this class and register it in `THEMES`.
+    """
+
+    # Opening tags of the page content, tried in order
+    content_patterns = (
+        re.compile(r'<article\b[^>]*>'),
+        re.compile(r'<div\b[^>]*\srole=["\']?main\b[^>]*>'),
+    )
+    # Whether the articles start with edit icons to remove from the PDF
+    header_icons = False
+
+    def __init__(self, name):
+        self.name = name
+
+    def content_start(self, html):
+        """Offset of the page content in `html`, or -1 if not found."""
+        for pattern in self.content_patterns:
+            match = pattern.search(html)
+            if match:
+                return match.end()
+        return -1
+
+    def button(self, href):
+        return ('<a class="md-content__icon pdf-download-btn" download href="{}" title="Download">'
+                '<i class="fa fas fa-download"></i><small> PDF</small></a>'.format(escape(href)))
+
+    def add_button(self, html, href):
+        """Return the page `html` with a button downloading `href`."""
+        offset = self.content_start(html)
+        if offset < 0:
+            return html
+        return html[:offset] + self.button(href) + html[offset:]
+
+
+class MaterialTheme(Theme):
+
+    content_patterns = (re.compile(re.escape('<article class="md-content__inner md-typeset">')),)
+    header_icons = True
+
+    def button(self, href):
+        return ('<a class="md-content__button md-icon" download href="{}" title="PDF Export">{}</a>'
+                .format(escape(href), MATERIAL_ICON))
+
+
+THEMES = {
+    'material': MaterialTheme,
+}
+
+
+def get_theme(name):
+    """The `Theme` for the theme called `name`."""
+    return THEMES.get(name, Theme)(name)
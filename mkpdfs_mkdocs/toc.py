@@ -0,0 +1,154 @@
+import os
+from html import escape, unescape
+
+from weasyprint import urls
+
+from mkpdfs_mkdocs.preprocessor.links import transform_href
+from mkpdfs_mkdocs.utils import is_external
+
+
+def _text(text):
+    return escape(unescape(text), quote=False)
+
+
+def _attr(value):
+    """Quote an attribute value the way BeautifulSoup serializes it."""
+    value = escape(value, quote=False)
+    if '"' not in value:
+        return '"{}"'.format(value)
+    if "'" not in value:
+        return "'{}'".format(value)
+    return '"{}"'.format(value.replace('"', '&quot;'))
+
+
+class _List(object):
+    """A `<ul>` of the table of contents that may still receive items."""
+
+    def __init__(self, items=None):
+        self.items = items or []
+
+    def __str__(self):
+        return '<ul>{}</ul>'.format(''.join(self.items))
+
+
+class TocBuilder(object):
+    """Builds the markup of the table of contents of the combined document.
+
+    The `NavNode` tree and the table of contents of each page are walked
+    once and the links point straight to the anchors of the combined
+    document, as `get_combined` would rewrite them. Skipped sections have
+    their title left out, and the items of their pages are listed under
+    their index page. When `selected` is given, only the entries with
+    their key in it are listed.
+    """
+
+    def __init__(self, selected=None):
+        self.selected = selected
+        self._parts = []
+
+    def build(self, title, roots):
+        self._parts = ['<article id="contents"><h1 id="toc-title">{}</h1>'.format(
+            escape(title, quote=False))]
+        for n in roots:
+            if self._excluded(n):
+                continue
+            if n.url is not None and is_external(n.url):
+                # Skip toc generation for external links
+                continue
+            self._parts.append('<h3>{}</h3>'.format(_text(n.title)))
+            if n.is_page:
+                self._page(n.key, n.item.toc)
+            else:
+                self._section(n)
+        self._parts.append('</article>')
+        return ''.join(str(part) for part in self._parts)
+
+    def _excluded(self, p):
+        if self.selected is not None and p.key not in self.selected:
+            return True
+        meta = p.item.meta if p.is_page else None
+        return meta and 'pdf' in meta and not meta['pdf']
+
+    @staticmethod
+    def _link(href, title, rel_url):
+        if urls.url_is_absolute(href) or os.path.isabs(href):
+            return '<a class="external-link" href={}>{}</a>'.format(_attr(href), _text(title))
+        return '<a href={}>{}</a>'.format(_attr(transform_href(href, rel_url)), _text(title))
+
+    def _items(self, url, items):
+        """`<li>` of each item, with its children nested."""
+        return ['<li>{}{}</li>'.format(self._link(item.url, item.title, url),
+                                       self._children(url, item.children) if item.children else '')
+                for item in items]
+
+    def _children(self, url, children):
+        return '<ul>{}</ul>'.format(''.join(self._items(url, children)))
+
+    def _menu(self, url, page, items):
+        """The title of `page` followed by its list of `items`."""
+        heading = '<div><h4>{}</h4>'.format(self._link('#', page.title, url))
+        return [heading, items, '</div>'] if items is not None else [heading, '</div>']
+
+    def _page(self, url, toc):
+        parts = []
+        for item in toc.items:
+            parts.append('<li>{}</li>'.format(self._link(item.url, item.title, url)))
+            if item.children:
+                parts.append(self._children(url, item.children))
+        self._parts.append('<ul>{}</ul>'.format(''.join(parts)))
+
+    def _section(self, section):
+        section_ul = None
+        for p in section.children:
+            if self._excluded(p):
+                continue
+            if p.is_section:
+                if not p.skipped:
+                    self._parts.append('<h3>{}</h3>'.format(_text(p.title)))
+                self._section(p)
+                continue
+            if not p.is_page:
+                # Skip external links
+                continue
+            url = p.key
+            if p.item.file.name == 'index':
+                # The items under the page title are listed directly
+                section_ul = self._index_items(url, p)
+                self._parts.extend(self._menu(url, p, section_ul))
+            elif section.skipped:
+                items = self._subpage_items(url, p)
+                if items:
+                    if section_ul is None:
+                        section_ul = _List()
+                        self._parts.append(section_ul)
+                    section_ul.items.extend(items)
+            else:
+                items = None
+                if p.item.toc and len(p.item.toc.items) > 0:
+                    items = _List()
+                    for child in p.item.toc.items:
+                        if child.title == p.title:
+                            items.items.append('<div>{}</div>'.format(
+                                self._children(url, child.children) if child.children else ''))
+                        else:
+                            items.items.extend(self._items(url, [child]))
+                self._parts.append('<div>')
+                self._parts.extend(self._menu(url, p, items))
+                self._parts.append('</div>')
+
+    def _index_items(self, url, p):
+        if not p.item.toc:
+            return None
+        items = []
+        for child in p.item.toc.items:
+            if child.title == p.title:
+                if child.children:
+                    items.extend(self._items(url, child.children))
+                continue
+            items.extend(self._items(url, [child]))
+        return _List(items) if items else None
+
+    def _subpage_items(self, url, p):
+        if not p.item.toc or len(p.item.toc.items) == 0:
+            return []
+        return self._items(url, [child for child in p.item.toc.items if child.title != p.title])
@@ -1,41 +1,23 @@
+import re
+import sys
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
 from bs4 import BeautifulSoup
+from bs4.element import PreformattedString
 
 
-def modify_html(html: str, href: str) -> str:
-    soup = BeautifulSoup(html, 'html.parser')
-    a = soup.new_tag('a',
-                     href=href,
-                     title='Download',
-                     download=None
-                     )
-    a['class'] = 'md-content__icon pdf-download-btn'
-    i = soup.new_tag('i')
-    i['class'] = 'fa fas fa-download'
-    small = soup.new_tag('small')
-    a.append(i)
-    small.append(' PDF')
-    a.append(small)
-    if soup.article:
-        soup.article.insert(0, a)
-    else:
-        soup.find('div', **{'role': 'main'}).insert(0, a);
-    return str(soup)
-
-
-def modify_html_material(html: str, href: str) -> str:
-    # Taken from mkdocs-pdf-export-plugin for material theme.
-    # https://github.com/zhaoterryy/mkdocs-pdf-export-plugin/blob/46af862318c92996913a81cab07cc998a871c2cb/mkdocs_pdf_export_plugin/themes/material.py#L65-L71
-    a_tag = "<a class=\"md-content__button md-icon\" download href=\"%s\" title=\"PDF Export\">" % href
-    icon = '<svg style="height: 1.2rem; width: 1.2rem;" viewBox="0 0 384 512" xmlns="http://www.w3.org/2000/svg"><path d="M224 136V0H24C10.7 0 0 10.7 0 24v464c0 13.3 10.7 24 24 24h336c13.3 0 24-10.7 24-24V160H248c-13.2 0-24-10.8-24-24zm76.45 211.36l-96.42 95.7c-6.65 6.61-17.39 6.61-24.04 0l-96.42-95.7C73.42 337.29 80.54 320 94.82 320H160v-80c0-8.84 7.16-16 16-16h32c8.84 0 16 7.16 16 16v80h65.18c14.28 0 21.4 17.29 11.27 27.36zM377 105L279.1 7c-4.5-4.5-10.6-7-17-7H256v128h128v-6.1c0-6.3-2.5-12.4-7-16.9z"></path></svg>'
-    button_tag = a_tag + icon + "</a>"
-    insert_point = "<article class=\"md-content__inner md-typeset\">"
-    html = html.replace(insert_point, insert_point + button_tag)
-    return html
+class RawHTML(PreformattedString):
+    """Already serialized markup, written out verbatim when the tree holding
+    it is rendered."""
 
 
 def gen_address(config):
     soup = BeautifulSoup('<body></body>',
-                         'html5lib'
+                         config.get('html_parser') or 'html.parser'
                          )
     address = soup.new_tag('address')
     p = soup.new_tag('p')
@@ -57,3 +39,16 @@ def gen_address(config):
 
 def is_external(href: str):
     return href.startswith('http://') or href.startswith('https://')
+
+
+def slugify(text: str):
+    return re.sub(r'[^\w]+', '-', text.lower()).strip('-')
+
+
+def peak_rss():
+    """Peak resident memory of the process in MiB, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in KiB elsewhere
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
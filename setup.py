@@ -27,6 +27,12 @@ setup(
         'weasyprint>=0.53',
         'beautifulsoup4>=4.6.3'
     ],
+    extras_require={
+        'lxml': ['lxml'],
+        'html5lib': ['html5lib'],
+        'parallel': ['pypdf>=3.5'],
+        'images': ['Pillow'],
+    },
     project_urls={  # Optional
         'Bug Reports': 'https://github.com/comwes/mkpdfs-mkdocs-plugin/issues',
         'Source': 'https://github.com/comwes/mkpdfs-mkdocs-plugin',
@@ -54,7 +60,10 @@ setup(
     entry_points={
         'mkdocs.plugins': [
             'mkpdfs = mkpdfs_mkdocs:Mkpdfs',
-        ]
+        ],
+        'console_scripts': [
+            'mkpdfs = mkpdfs_mkdocs.cli:main',
+        ],
     },
     zip_safe=False,
 )
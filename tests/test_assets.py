@@ -0,0 +1,12 @@
+from mkpdfs_mkdocs.assets import AssetIndex
+
+
+def test_svg_swaps_follow_the_png_files(tmp_path):
+    (tmp_path / 'img' / '_svg_to_png').mkdir(parents=True)
+    base_url = (tmp_path / 'index.html').as_uri()
+    content = '<img src="img/d.svg"><img src="img/e.svg"><img src="img/f.png">'
+    assert AssetIndex(str(tmp_path)).swaps(content, base_url) == []
+
+    (tmp_path / 'img' / '_svg_to_png' / 'd.png').write_bytes(b'\x89PNG')
+    assert AssetIndex(str(tmp_path)).swaps(content, base_url) == [
+        ('img/d.svg', 'img/_svg_to_png/d.png')]
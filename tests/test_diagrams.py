@@ -0,0 +1,84 @@
+import os
+
+from bs4 import BeautifulSoup
+
+from mkpdfs_mkdocs.diagrams import DEFAULT_RENDERERS, DiagramStage
+
+PAGE = ('<article><h1>Flow</h1>'
+        '<pre class="mermaid">graph TD; A--&gt;B</pre>'
+        '<pre><code class="language-mermaid">graph LR; C--&gt;D</code></pre>'
+        '<pre><code class="language-python">print(1)</code></pre></article>')
+
+
+class StubRenderer(object):
+    """Writes the diagram source as the image, or fails for the sources
+    containing `fail`."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, kind, source_path, output_path):
+        with open(source_path, encoding='utf-8') as f:
+            source = f.read()
+        self.calls.append((kind, source))
+        if 'fail' in source:
+            raise OSError('stub failure')
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(source)
+
+
+def preprocess(stage, page=PAGE):
+    article = BeautifulSoup(page, 'html.parser').article
+    diagrams = stage.mark_blocks(article) if stage.mentions(page) else []
+    return str(article), diagrams
+
+
+def test_blocks_replaced_once_rendered(tmp_path):
+    renderer = StubRenderer()
+    stage = DiagramStage(str(tmp_path), renderer=renderer, workers=2)
+    markup, diagrams = preprocess(stage)
+    assert diagrams == [('mermaid', 'graph TD; A-->B'), ('mermaid', 'graph LR; C-->D')]
+    assert '<img' not in markup
+
+    assert stage.render() == (2, 0)
+    resolved = stage.resolve(markup)
+    assert resolved.count('<img alt="mermaid diagram" class="diagram diagram-mermaid"') == 2
+    assert 'class="mermaid"' not in resolved and 'language-python' in resolved
+    for kind, source in diagrams:
+        assert os.path.isfile(stage.image_path(kind, source))
+
+
+def test_cached_images_not_rendered_again(tmp_path):
+    renderer = StubRenderer()
+    stage = DiagramStage(str(tmp_path), renderer=renderer)
+    preprocess(stage)
+    stage.render()
+
+    renderer.calls = []
+    stage = DiagramStage(str(tmp_path), renderer=renderer)
+    markup, _ = preprocess(stage)
+    assert stage.render() == (0, 0)
+    assert renderer.calls == []
+    assert stage.resolve(markup).count('<img') == 2
+
+
+def test_failed_render_keeps_block(tmp_path):
+    stage = DiagramStage(str(tmp_path), renderer=StubRenderer())
+    page = '<article><pre class="mermaid">graph TD; fail</pre></article>'
+    markup, _ = preprocess(stage, page)
+    assert stage.render() == (1, 1)
+    assert stage.resolve(markup) == page
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_pages_without_diagrams_untouched(tmp_path):
+    stage = DiagramStage(str(tmp_path), renderer=StubRenderer())
+    page = '<article><p>No diagram</p></article>'
+    assert not stage.mentions(page)
+    assert stage.resolve(page) == page
+
+
+def test_renderers_merged_with_defaults(tmp_path):
+    stage = DiagramStage(str(tmp_path), commands={'plantuml': 'plantuml {input} -o {output}'})
+    assert stage.commands['mermaid'] == DEFAULT_RENDERERS['mermaid']
+    assert 'plantuml' in stage.commands
@@ -0,0 +1,91 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from mkpdfs_mkdocs import fetcher as fetcher_module
+from mkpdfs_mkdocs.fetcher import Fetcher
+
+IMAGE = b'\x89PNG stand-in'
+
+
+class Handler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        Handler.requests.append(self.path)
+        if self.path != '/image.png':
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(IMAGE)))
+        self.end_headers()
+        self.wfile.write(IMAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    """Base URL of a local HTTP server standing in for the remote hosts."""
+    Handler.requests = []
+    httpd = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(httpd.server_port)
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_prefetch_fetches_each_url_once(server, tmp_path):
+    fetcher = Fetcher(str(tmp_path / 'cache'))
+    image, missing = server + '/image.png', server + '/missing.png'
+    assert fetcher.prefetch([image, missing]) == 1
+    assert fetcher.fetch(image) == (IMAGE, 'image/png', image)
+    with pytest.raises(Exception):
+        fetcher.fetch(missing)
+    assert fetcher.prefetch([image, missing]) == 0
+    assert sorted(Handler.requests) == ['/image.png', '/missing.png']
+
+
+def test_disk_cache_and_offline(server, tmp_path):
+    image = server + '/image.png'
+    Fetcher(str(tmp_path / 'cache')).fetch(image)
+
+    offline = Fetcher(str(tmp_path / 'cache'), offline=True)
+    assert offline.fetch(image)[0] == IMAGE
+    with pytest.raises(ValueError):
+        offline.fetch(server + '/other.png')
+    assert Handler.requests == ['/image.png']
+
+    with pytest.raises(ValueError):
+        Fetcher(str(tmp_path / 'cache'), remote=False).fetch(image)
+
+
+def test_local_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(fetcher_module, 'MEMORY_LIMIT', 16)
+    small, large = tmp_path / 'small.css', tmp_path / 'large.png'
+    small.write_bytes(b'p {}')
+    large.write_bytes(b'x' * 64)
+    fetcher = Fetcher(str(tmp_path / 'cache'))
+
+    body, mime_type, url = fetcher.fetch(small.as_uri())
+    assert (body, mime_type, url) == (b'p {}', 'text/css', small.as_uri())
+    small.write_bytes(b'changed')
+    assert fetcher.fetch(small.as_uri())[0] == b'p {}'
+
+    first = fetcher.fetch(large.as_uri())[0]
+    second = fetcher.fetch(large.as_uri() + '#fragment')[0]
+    assert first.read() == b'x' * 64
+    assert second.read(8) == b'x' * 8 and second.read() == b'x' * 56
+    assert list(fetcher._maps) == [str(large)]
+    fetcher.close()
+    assert fetcher._maps == {}
+    assert fetcher.fetch(large.as_uri())[0].read() == b'x' * 64
+    fetcher.close()
+
+
+def test_unknown_scheme(tmp_path):
+    assert Fetcher(str(tmp_path)).fetch('data:image/png;base64,') is None
@@ -0,0 +1,20 @@
+from mkpdfs_mkdocs.fingerprint import RenderCache
+from mkpdfs_mkdocs.prune import CssPruner, DocumentSelectors
+from mkpdfs_mkdocs.render_profiles import get_render_profile
+
+
+def test_fonts_of_a_pruned_design(tmp_path):
+    design = tmp_path / 'design.css'
+    design.write_text('@font-face { font-family: F; src: url(font.otf) }\nbody { font-family: F }\n')
+    font = tmp_path / 'font.otf'
+    font.write_bytes(b'font 1')
+    html = '<body><p>Text</p></body>'
+    document = DocumentSelectors()
+    document.feed(html)
+    pruned = CssPruner(str(tmp_path / 'cache')).prune(str(design), document)
+    assert pruned != str(design)
+
+    profile = get_render_profile('default')
+    before = RenderCache(str(tmp_path / 'renders')).fingerprint(html, pruned, profile)
+    font.write_bytes(b'font 2')
+    assert RenderCache(str(tmp_path / 'renders')).fingerprint(html, pruned, profile) != before
@@ -0,0 +1,49 @@
+from mkpdfs_mkdocs.linkmap import (AMBIGUOUS_PAGE, MISSING_ANCHOR, MISSING_PAGE, OTHER_URL, BrokenLink,
+                                 LinkMap, PageLinks, page_stem, rewrite_links)
+
+
+def test_links_to_pages_left_out():
+    links = LinkMap()
+    links.add('guide/admin/', PageLinks(['guide/admin/:'], ['guide/intro/:setup', 'guide/admin/:',
+                                                             'https:']))
+    links.add('guide/intro/', PageLinks(['guide/intro/:setup'], ['guide/admin/:']))
+    assert links.outside({'guide/admin/'}) == [('guide/admin/', 'guide/intro/:setup')]
+    assert links.outside({'guide/admin/', 'guide/intro/'}) == []
+
+
+def link_map():
+    links = LinkMap()
+    # Ids as rewritten by transform_id, the homepage of directory URLs being ./
+    links.add('./', PageLinks(['./:', './:top'], []))
+    links.add('guide/', PageLinks(['guide/:', 'guide/:setup'],
+                                  [':', ':top', 'guide/:setup', 'guide/index.html:setup',
+                                   'guide/:missing', 'gone/:', 'ref/:', 'ref/index.html:']))
+    links.add('ref/', PageLinks(['ref/:'], []))
+    links.add('ref.html', PageLinks(['ref.html:'], []))
+    return links
+
+
+def test_page_stem():
+    assert [page_stem(path) for path in ('', './', 'index.html', 'guide/', 'guide/index.md',
+                                         'guide/page.html', 'guide/page/')] == [
+        '.', '.', '.', 'guide', 'guide', 'guide/page', 'guide/page']
+
+
+def test_broken_links():
+    assert link_map().broken() == [
+        # The homepage is ./ and the links to it normalized to nothing
+        BrokenLink('guide/', ':', OTHER_URL, './:'),
+        BrokenLink('guide/', ':top', OTHER_URL, './:top'),
+        BrokenLink('guide/', 'gone/:', MISSING_PAGE, None),
+        BrokenLink('guide/', 'guide/:missing', MISSING_ANCHOR, 'guide/:'),
+        BrokenLink('guide/', 'guide/index.html:setup', OTHER_URL, 'guide/:setup'),
+        BrokenLink('guide/', 'ref/index.html:', AMBIGUOUS_PAGE, None),
+    ]
+    assert link_map().broken(['ref/']) == []
+
+
+def test_rewrite_links():
+    markup = ('<a href="#:top">home</a><a href="#gone/:">gone</a>'
+              '<a class="x" href=\'#guide/:setup\'>setup</a>')
+    assert rewrite_links(markup, {':top': './:top', 'gone/:': None}) == (
+        '<a href="#./:top">home</a><a>gone</a><a class="x" href=\'#guide/:setup\'>setup</a>')
@@ -0,0 +1,29 @@
+from mkpdfs_mkdocs.partial import PartialLinks
+
+PAGES = ['./', 'guide/intro/', 'guide/admin/']
+MARKUP = ('<a href="#guide/intro/:setup">setup</a> <a class="x" href="#guide/admin/:">admin</a> '
+          '<a href="https://example.org">site</a>')
+
+
+def test_links_to_the_full_pdf(tmp_path):
+    # Not rendered yet: site_dir is cleaned by each build
+    links = PartialLinks(PAGES, {'guide/admin/'}, str(tmp_path / 'pdf' / 'combined.pdf'),
+                         str(tmp_path / 'pdf' / 'partial' / 'admin.pdf'))
+    assert links.rewrite(MARKUP) == (
+        '<a class="external-link" href="../combined.pdf#guide/intro/:setup">setup</a> '
+        '<a class="x" href="#guide/admin/:">admin</a> <a href="https://example.org">site</a>')
+    assert (links.rewritten, links.unlinked) == (1, 0)
+
+
+def test_links_to_the_site(tmp_path):
+    links = PartialLinks(PAGES, {'./'}, str(tmp_path / 'combined.pdf'), str(tmp_path / 'partial.pdf'),
+                         site_url='https://docs.example.org/')
+    assert links.rewrite(MARKUP).split(' <a href="https')[0] == (
+        '<a class="external-link" href="https://docs.example.org/guide/intro/#setup">setup</a> '
+        '<a class="external-link x" href="https://docs.example.org/guide/admin/">admin</a>')
+
+
+def test_links_left_as_text(tmp_path):
+    links = PartialLinks(PAGES, {'guide/admin/'}, None, str(tmp_path / 'admin.pdf'))
+    assert links.rewrite(MARKUP).startswith('<a class="external-link">setup</a> ')
+    assert links.unlinked == 1
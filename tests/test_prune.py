@@ -0,0 +1,66 @@
+import tinycss2
+
+from mkpdfs_mkdocs.prune import CssPruner, DocumentSelectors, _selectors, can_match
+
+HTML = '<body><div class="note" id="intro"><p>Text <span style="font-family: Body">x</span></p></div></body>'
+
+
+def document(html=HTML):
+    selectors = DocumentSelectors()
+    selectors.feed(html)
+    return selectors
+
+
+def matches(selector):
+    prelude = tinycss2.parse_stylesheet(selector + ' {}')[0].prelude
+    return [can_match(tokens, document()) for tokens in _selectors(prelude)]
+
+
+def test_selectors():
+    assert matches('p, .note, #intro, div.note > p, body p + span') == [True] * 5
+    assert matches('table, .warning, #outro, div.warning > p, div > table') == [False] * 5
+
+
+def test_unsure_selectors_kept():
+    # Functional pseudo-classes, attribute and namespaced selectors are not checked
+    assert matches('p:not(.warning), :is(table, .note), a[href], svg|rect, li::marker') == [
+        True, True, False, True, False]
+
+
+def prune(tmp_path, css, html=HTML, **files):
+    for name, content in files.items():
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_text(content)
+    design = tmp_path / 'design.css'
+    design.write_text(css)
+    with open(CssPruner(str(tmp_path / 'cache')).prune(str(design), document(html))) as f:
+        return f.read()
+
+
+def test_rules_pruned(tmp_path):
+    css = ('p { color: red }\ntable { color: blue }\n'
+           '@media print { .note, .warning { margin: 0 } .warning { margin: 1em } }\n')
+    assert prune(tmp_path, css) == 'p { color: red }\n@media print {.note{ margin: 0 }\n}\n'
+
+
+def test_unused_fonts_dropped(tmp_path):
+    css = ('@font-face { font-family: "Title"; src: url(fonts/title.otf) }\n'
+           '@font-face { font-family: Body; src: url(fonts/body.otf) }\n'
+           '@font-face { font-family: Code; src: url(fonts/code.otf) }\n'
+           'p { font-family: "Title", serif }\npre { font-family: Code }\n')
+    pruned = prune(tmp_path, css)
+    assert 'title.otf' in pruned and 'body.otf' in pruned  # In an inline style
+    assert 'code.otf' not in pruned and 'pre' not in pruned
+    assert 'url({})'.format((tmp_path / 'fonts' / 'title.otf').as_uri()) in pruned
+
+
+def test_local_imports_inlined(tmp_path):
+    css = '@import "https://example.org/fonts.css";\n@import url("parts/base.css");\np { margin: 0 }\n'
+    pruned = prune(tmp_path, css, **{
+        'parts/base.css': '@import "more.css" print;\n.note { background: url(../img/bg.png) }\n'
+                          'table { border: 0 }\n'})
+    more = (tmp_path / 'parts' / 'more.css').as_uri()
+    assert pruned == ('@import "https://example.org/fonts.css";\n'
+                      '@import "{}" print;\n'
+                      '.note {{ background: url({}) }}\n'
+                      'p {{ margin: 0 }}\n').format(more, (tmp_path / 'img' / 'bg.png').as_uri())
@@ -0,0 +1,33 @@
+import pytest
+
+from mkpdfs_mkdocs.preprocessor.links.util import rel_pdf_href
+from mkpdfs_mkdocs.sections import SectionLinks
+
+
+@pytest.mark.parametrize('href, expected', [
+    ('guide/intro/', 'guide/intro/index.pdf'),
+    ('guide/admin/users/#add', 'guide/admin/users/index.pdf#add'),
+    ('../../', '../../index.pdf'),
+    ('..', '../index.pdf'),
+    ('bar.html#x', 'bar.pdf#x'),
+    ('guide/index.html', 'guide/index.pdf'),
+    ('#x', '#x'),
+    ('https://example.org/', 'https://example.org/'),
+    ('file.zip', 'file.zip'),
+])
+def test_page_pdf_links(href, expected):
+    assert rel_pdf_href(href) == expected
+
+
+def test_section_links():
+    links = SectionLinks([('guide/', 'guide/index.pdf'),
+                          ('guide/intro/', 'guide/intro/index.pdf')], 'pdf')
+    markup = ('<h2 id="setup">Setup</h2><a href="#setup">here</a>'
+              '<a href="../index.pdf#run">intro</a> <a href="../../ref/api/index.pdf#get">api</a>'
+              '<a class="x" href="file.zip">file</a> <a href="https://example.org">site</a>')
+    assert links.article('guide/intro/', 'guide/intro/index.pdf', markup) == (
+        '<div id="guide/intro/:"><h2 id="guide/intro/:setup">Setup</h2>'
+        '<a href="#guide/intro/:setup">here</a><a href="#guide/:run">intro</a> '
+        '<a href="../ref/api/index.pdf#get">api</a>'
+        '<a class="x" href="../guide/intro/file.zip">file</a> '
+        '<a href="https://example.org">site</a></div>')
@@ -0,0 +1,24 @@
+import os
+
+from mkpdfs_mkdocs.styles import StyleCache
+
+
+def test_designs_cached_by_path(tmp_path):
+    first, second = tmp_path / 'first.css', tmp_path / 'second.css'
+    first.write_text('p { color: red }')
+    second.write_text('p { color: blue }')
+    styles = StyleCache()
+    loaded = styles.get(str(first)), styles.get(str(second))
+    # Alternating designs are not parsed again
+    assert styles.get(str(first)) == loaded[0] and styles.get(str(second)) == loaded[1]
+    assert loaded[0][0][0] is not loaded[1][0][0]
+
+    first.write_text('p { color: green }')
+    os.utime(str(first), ns=(0, 0))
+    assert styles.get(str(first))[0][0] is not loaded[0][0][0]
+    assert styles.get(str(second)) == loaded[1]
+
+
+def test_missing_design(tmp_path):
+    stylesheets, font_config = StyleCache().get(str(tmp_path / 'missing.css'))
+    assert stylesheets == [] and font_config is not None